@@ -0,0 +1,25 @@
+"""add conversation memory columns to comparison_sessions
+
+Revision ID: 20261019_add_conv_memory
+Revises: 20250821_add_evt_purpose
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+
+revision = '20261019_add_conv_memory'
+down_revision = '20250821_add_evt_purpose'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Running summary of older chat turns + watermark of the last folded message; idempotent
+    op.execute("ALTER TABLE comparison_sessions ADD COLUMN IF NOT EXISTS conversation_summary TEXT")
+    op.execute("ALTER TABLE comparison_sessions ADD COLUMN IF NOT EXISTS summary_through TIMESTAMP WITH TIME ZONE")
+
+
+def downgrade():
+    op.execute("ALTER TABLE comparison_sessions DROP COLUMN IF EXISTS summary_through")
+    op.execute("ALTER TABLE comparison_sessions DROP COLUMN IF EXISTS conversation_summary")
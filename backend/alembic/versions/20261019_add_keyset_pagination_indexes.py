@@ -0,0 +1,45 @@
+"""add (owner, sort timestamp, id) indexes for keyset pagination of activity lists
+
+Revision ID: 20261019_add_keyset_idx
+Revises: 20261019_add_search_latest
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_keyset_idx'
+down_revision = '20261019_add_search_latest'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Each list endpoint orders by (timestamp, id) within one owner; see services/pagination.py
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_events_user_ts_id "
+        "ON user_events (user_id, event_timestamp DESC, event_id DESC)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_favorites_user_created_id "
+        "ON user_favorites (user_id, created_at DESC, favorite_id DESC)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_comparison_created_id "
+        "ON chat_messages (comparison_id, created_at, message_id) WHERE deleted_at IS NULL"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_history_latest_user_created_id "
+        "ON search_history_latest (user_id, created_at DESC, search_id DESC)"
+    )
+    op.execute("DROP INDEX IF EXISTS idx_search_history_latest_user_created")
+
+
+def downgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_history_latest_user_created "
+        "ON search_history_latest (user_id, created_at DESC)"
+    )
+    op.execute("DROP INDEX IF EXISTS idx_search_history_latest_user_created_id")
+    op.execute("DROP INDEX IF EXISTS idx_chat_messages_comparison_created_id")
+    op.execute("DROP INDEX IF EXISTS idx_user_favorites_user_created_id")
+    op.execute("DROP INDEX IF EXISTS idx_user_events_user_ts_id")
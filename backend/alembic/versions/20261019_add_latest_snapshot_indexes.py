@@ -0,0 +1,31 @@
+"""add (product_id, recorded_at desc) indexes for latest price/rating lookups
+
+Revision ID: 20261019_add_snapshot_idx
+Revises: 20261019_add_conv_memory
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_snapshot_idx'
+down_revision = '20261019_add_conv_memory'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serve DISTINCT ON (product_id) ... ORDER BY product_id, recorded_at DESC NULLS LAST
+    # (ProductSnapshotRepository) straight from the index
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_product_prices_product_latest "
+        "ON product_prices (product_id, price_recorded_at DESC NULLS LAST)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_product_ratings_product_latest "
+        "ON product_ratings (product_id, rating_recorded_at DESC NULLS LAST)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_product_ratings_product_latest")
+    op.execute("DROP INDEX IF EXISTS idx_product_prices_product_latest")
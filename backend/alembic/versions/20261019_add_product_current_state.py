@@ -0,0 +1,64 @@
+"""create product_current_state (latest price/rating per product) and backfill it
+
+Revision ID: 20261019_add_current_state
+Revises: 20261019_add_snapshot_idx
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_current_state'
+down_revision = '20261019_add_snapshot_idx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS product_current_state (
+            product_id varchar(255) PRIMARY KEY,
+            current_price numeric(10,2),
+            original_price numeric(10,2),
+            currency_code varchar(3),
+            currency_symbol varchar(5),
+            is_in_stock boolean,
+            price_recorded_at timestamp with time zone,
+            average_rating numeric(3,2),
+            total_review_count integer,
+            rating_recorded_at timestamp with time zone,
+            updated_at timestamp with time zone DEFAULT now()
+        );
+        """
+    )
+    # Backfill from the histories (latest row per product); idempotent
+    op.execute(
+        """
+        INSERT INTO product_current_state (
+            product_id, current_price, original_price, currency_code, currency_symbol,
+            is_in_stock, price_recorded_at, average_rating, total_review_count, rating_recorded_at
+        )
+        SELECT ids.product_id, p.current_price, p.original_price, p.currency_code, p.currency_symbol,
+               p.is_in_stock, p.price_recorded_at, r.average_rating, r.total_review_count, r.rating_recorded_at
+        FROM (
+            SELECT product_id FROM product_prices
+            UNION
+            SELECT product_id FROM product_ratings
+        ) AS ids
+        LEFT JOIN (
+            SELECT DISTINCT ON (product_id) *
+            FROM product_prices
+            ORDER BY product_id, price_recorded_at DESC NULLS LAST
+        ) AS p ON p.product_id = ids.product_id
+        LEFT JOIN (
+            SELECT DISTINCT ON (product_id) *
+            FROM product_ratings
+            ORDER BY product_id, rating_recorded_at DESC NULLS LAST
+        ) AS r ON r.product_id = ids.product_id
+        ON CONFLICT (product_id) DO NOTHING
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS product_current_state")
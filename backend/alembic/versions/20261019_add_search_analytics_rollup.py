@@ -0,0 +1,62 @@
+"""search_analytics rollup: query_key/total_results_count columns, daily buckets, watermarks
+
+Revision ID: 20261019_add_search_rollup
+Revises: 20261019_partition_tables
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_search_rollup'
+down_revision = '20261019_partition_tables'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # search_analytics was created by rev_20250819_aux_tables but never populated
+    op.execute("ALTER TABLE search_analytics ADD COLUMN IF NOT EXISTS query_key VARCHAR(512)")
+    op.execute("ALTER TABLE search_analytics ADD COLUMN IF NOT EXISTS total_results_count BIGINT NOT NULL DEFAULT 0")
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_search_analytics_query_platform "
+        "ON search_analytics (query_key, platform_name)"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS idx_search_analytics_total ON search_analytics (total_searches)")
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS search_analytics_daily (
+            query_key VARCHAR(512) NOT NULL,
+            platform_name VARCHAR(50) NOT NULL,
+            bucket_date DATE NOT NULL,
+            searches INTEGER NOT NULL DEFAULT 0,
+            results_total BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (query_key, platform_name, bucket_date)
+        );
+        """
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS idx_search_analytics_daily_date ON search_analytics_daily (bucket_date)")
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            name VARCHAR(100) PRIMARY KEY,
+            watermark_at TIMESTAMP WITH TIME ZONE,
+            watermark_id VARCHAR(64),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        );
+        """
+    )
+    # The rollup scans search_history in (created_at, search_id) order from the watermark
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_history_created_id "
+        "ON search_history (created_at, search_id)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_search_history_created_id")
+    op.execute("DROP TABLE IF EXISTS rollup_watermarks")
+    op.execute("DROP TABLE IF EXISTS search_analytics_daily")
+    op.execute("DROP INDEX IF EXISTS idx_search_analytics_total")
+    op.execute("DROP INDEX IF EXISTS ux_search_analytics_query_platform")
+    op.execute("ALTER TABLE search_analytics DROP COLUMN IF EXISTS total_results_count")
+    op.execute("ALTER TABLE search_analytics DROP COLUMN IF EXISTS query_key")
@@ -0,0 +1,56 @@
+"""search_analytics distinct users: per-query user set and distinct_users counter
+
+Revision ID: 20261019_add_search_users
+Revises: 20261019_add_user_rollup
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_search_users'
+down_revision = '20261019_add_user_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE search_analytics ADD COLUMN IF NOT EXISTS distinct_users INTEGER NOT NULL DEFAULT 0")
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS search_analytics_users (
+            query_key VARCHAR(512) NOT NULL,
+            platform_name VARCHAR(50) NOT NULL,
+            user_id UUID NOT NULL,
+            PRIMARY KEY (query_key, platform_name, user_id)
+        );
+        """
+    )
+    # Backfill from the rows the search rollup has already consumed (up to its watermark)
+    op.execute(
+        """
+        INSERT INTO search_analytics_users (query_key, platform_name, user_id)
+        SELECT DISTINCT COALESCE(s.query_key, lower(s.search_query)), s.platform, s.user_id
+        FROM search_history s
+        JOIN rollup_watermarks w ON w.name = 'search_analytics' AND w.watermark_at IS NOT NULL
+        WHERE s.user_id IS NOT NULL AND s.platform IS NOT NULL
+          AND (s.created_at, s.search_id) <= (w.watermark_at, CAST(w.watermark_id AS uuid))
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.execute(
+        """
+        UPDATE search_analytics sa
+        SET distinct_users = u.n
+        FROM (
+            SELECT query_key, platform_name, COUNT(*) AS n
+            FROM search_analytics_users
+            GROUP BY query_key, platform_name
+        ) AS u
+        WHERE sa.query_key = u.query_key AND sa.platform_name = u.platform_name
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS search_analytics_users")
+    op.execute("ALTER TABLE search_analytics DROP COLUMN IF EXISTS distinct_users")
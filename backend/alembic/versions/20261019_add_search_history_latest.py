@@ -0,0 +1,55 @@
+"""create search_history_latest (latest search per user and normalized query) and backfill it
+
+Revision ID: 20261019_add_search_latest
+Revises: 20261019_add_msg_counters
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_search_latest'
+down_revision = '20261019_add_msg_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS search_history_latest (
+            user_id uuid NOT NULL REFERENCES users(user_id),
+            query_key varchar(512) NOT NULL,
+            search_id uuid NOT NULL UNIQUE,
+            search_query varchar(500) NOT NULL,
+            platform varchar(50) NOT NULL,
+            results_count integer DEFAULT 0,
+            custom_label varchar(200),
+            created_at timestamp with time zone DEFAULT now(),
+            PRIMARY KEY (user_id, query_key)
+        );
+        """
+    )
+    # History page: a user's entries newest first
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_history_latest_user_created "
+        "ON search_history_latest (user_id, created_at DESC)"
+    )
+    # Backfill with the same dedup rule the history page used; idempotent
+    op.execute(
+        """
+        INSERT INTO search_history_latest (
+            user_id, query_key, search_id, search_query, platform, results_count, custom_label, created_at
+        )
+        SELECT DISTINCT ON (user_id, COALESCE(query_key, LOWER(search_query)))
+               user_id, COALESCE(query_key, LOWER(search_query)), search_id, search_query, platform,
+               results_count, custom_label, created_at
+        FROM search_history
+        WHERE deleted_at IS NULL
+        ORDER BY user_id, COALESCE(query_key, LOWER(search_query)), created_at DESC
+        ON CONFLICT (user_id, query_key) DO NOTHING
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS search_history_latest")
@@ -0,0 +1,44 @@
+"""add message_count / last_message_at to comparison_sessions with backfill and listing index
+
+Revision ID: 20261019_add_msg_counters
+Revises: 20261019_add_current_state
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_msg_counters'
+down_revision = '20261019_add_current_state'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE comparison_sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE comparison_sessions ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP WITH TIME ZONE")
+    # Backfill from live (non-deleted) messages; idempotent
+    op.execute(
+        """
+        UPDATE comparison_sessions s
+        SET message_count = c.cnt, last_message_at = c.last_at
+        FROM (
+            SELECT comparison_id, COUNT(*) AS cnt, MAX(created_at) AS last_at
+            FROM chat_messages
+            WHERE deleted_at IS NULL
+            GROUP BY comparison_id
+        ) AS c
+        WHERE c.comparison_id = s.comparison_id
+        """
+    )
+    # Session list: a user's live sessions with at least 2 messages, newest first
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_comparison_sessions_user_listed "
+        "ON comparison_sessions (user_id, updated_at DESC) "
+        "WHERE deleted_at IS NULL AND message_count >= 2"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_comparison_sessions_user_listed")
+    op.execute("ALTER TABLE comparison_sessions DROP COLUMN IF EXISTS last_message_at")
+    op.execute("ALTER TABLE comparison_sessions DROP COLUMN IF EXISTS message_count")
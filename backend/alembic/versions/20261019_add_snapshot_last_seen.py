@@ -0,0 +1,26 @@
+"""add last_seen_at to product_prices / product_ratings (history rows become intervals)
+
+Revision ID: 20261019_add_last_seen
+Revises: 20261019_add_keyset_idx
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_last_seen'
+down_revision = '20261019_add_keyset_idx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nullable, no default: metadata-only change on existing rows.
+    # Existing duplicates are collapsed by compact_snapshots.py, not here,
+    # so the migration stays fast on large histories.
+    op.execute("ALTER TABLE product_prices ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP WITH TIME ZONE")
+    op.execute("ALTER TABLE product_ratings ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP WITH TIME ZONE")
+
+
+def downgrade():
+    op.execute("ALTER TABLE product_ratings DROP COLUMN IF EXISTS last_seen_at")
+    op.execute("ALTER TABLE product_prices DROP COLUMN IF EXISTS last_seen_at")
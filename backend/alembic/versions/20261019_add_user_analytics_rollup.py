@@ -0,0 +1,35 @@
+"""user_analytics rollup: updated_at column and (user_id, timestamp) source indexes
+
+Revision ID: 20261019_add_user_rollup
+Revises: 20261019_add_search_rollup
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = '20261019_add_user_rollup'
+down_revision = '20261019_add_search_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # user_analytics was created by rev_20250819_aux_tables (with its (user_id, analytics_date)
+    # unique index) but never populated
+    op.execute("ALTER TABLE user_analytics ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE")
+    # Per (user, day) recounts; user_events is covered by idx_user_events_user_type_timestamp
+    op.execute("CREATE INDEX IF NOT EXISTS idx_search_history_user_created ON search_history (user_id, created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_comparison_sessions_user_created ON comparison_sessions (user_id, created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_user_created ON chat_messages (user_id, created_at)")
+    # Dirty-day detection scans each source by time from the watermark
+    op.execute("CREATE INDEX IF NOT EXISTS idx_comparison_sessions_created ON comparison_sessions (created_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_created ON chat_messages (created_at)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_chat_messages_created")
+    op.execute("DROP INDEX IF EXISTS idx_comparison_sessions_created")
+    op.execute("DROP INDEX IF EXISTS idx_chat_messages_user_created")
+    op.execute("DROP INDEX IF EXISTS idx_comparison_sessions_user_created")
+    op.execute("DROP INDEX IF EXISTS idx_search_history_user_created")
+    op.execute("ALTER TABLE user_analytics DROP COLUMN IF EXISTS updated_at")
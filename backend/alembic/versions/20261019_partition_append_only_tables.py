@@ -0,0 +1,156 @@
+"""convert user_events, product_prices and chat_messages to monthly range partitions
+
+Revision ID: 20261019_partition_tables
+Revises: 20261019_add_last_seen
+Create Date: 2026-10-19
+
+Each table is renamed to <table>_unpartitioned, recreated as PARTITION BY
+RANGE on its timestamp column with monthly partitions named <table>_pYYYYMM
+(from its oldest row to 3 months ahead) plus <table>_default, then
+repopulated. Indexes, CHECK/FK constraints and defaults carry over; the
+primary key becomes (id, timestamp) because Postgres requires the partition
+key in every unique constraint. Rows are copied in one transaction, so run
+this in a maintenance window on large databases. Later partitions are
+created by services/partitions.py.
+"""
+
+from datetime import date
+
+from alembic import op
+from sqlalchemy import text
+
+revision = '20261019_partition_tables'
+down_revision = '20261019_add_last_seen'
+branch_labels = None
+depends_on = None
+
+# table -> (primary key column, partition key column)
+TABLES = {
+    "user_events": ("event_id", "event_timestamp"),
+    "product_prices": ("price_id", "price_recorded_at"),
+    "chat_messages": ("message_id", "created_at"),
+}
+MONTHS_AHEAD = 3
+
+
+def _add_months(d, months):
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _is_partitioned(bind, table):
+    return bool(bind.execute(
+        text("SELECT c.relkind = 'p' FROM pg_class c WHERE c.relname = :t AND c.relnamespace = current_schema()::regnamespace"),
+        {"t": table},
+    ).scalar())
+
+
+def _exists(bind, table):
+    return bind.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": table}).scalar()
+
+
+def _partition(table, key, pk):
+    bind = op.get_bind()
+    legacy = f"{table}_unpartitioned"
+    # Index definitions not backing a constraint, and constraints other than the PK
+    indexes = bind.execute(text(
+        "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+        "WHERE i.schemaname = current_schema() AND i.tablename = :t "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname AND c.conrelid = CAST(:t AS regclass))"
+    ), {"t": table}).all()
+    constraints = bind.execute(text(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:t AS regclass) AND contype IN ('p', 'u', 'f')"
+    ), {"t": table}).all()
+    columns = bind.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :t ORDER BY ordinal_position"
+    ), {"t": table}).scalars().all()
+    oldest = bind.execute(text(f"SELECT min({key}) FROM {table}")).scalar()
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    for name, _ in indexes:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name[:50]}_legacy")
+    for name, _, _ in constraints:
+        op.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {name[:50]}_legacy")
+
+    op.execute(
+        f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) "
+        f"PARTITION BY RANGE ({key})"
+    )
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({pk}, {key})")
+
+    first = (oldest.date() if oldest else date.today()).replace(day=1)
+    last = _add_months(date.today().replace(day=1), MONTHS_AHEAD)
+    month = first
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    # Rows without a timestamp can't be part of the new primary key; date them at migration time
+    select_list = ", ".join(f"COALESCE({c}, now())" if c == key else c for c in columns)
+    op.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {select_list} FROM {legacy}")
+
+    for name, definition in indexes:
+        if definition.startswith("CREATE UNIQUE") and key not in definition:
+            print(f"Warning: unique index {name} does not include {key}; not recreated on partitioned {table}")
+            continue
+        # Definitions were read before the rename, so they still target `table`
+        op.execute(definition)
+    for name, contype, definition in constraints:
+        if contype == 'p':
+            continue
+        if contype == 'u' and key not in definition:
+            print(f"Warning: unique constraint {name} does not include {key}; not recreated on partitioned {table}")
+            continue
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+    op.execute(f"DROP TABLE {legacy}")
+
+
+def _unpartition(table, key, pk):
+    bind = op.get_bind()
+    legacy = f"{table}_partitioned"
+    indexes = bind.execute(text(
+        "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+        "WHERE i.schemaname = current_schema() AND i.tablename = :t "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname AND c.conrelid = CAST(:t AS regclass))"
+    ), {"t": table}).all()
+    constraints = bind.execute(text(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:t AS regclass) AND contype IN ('u', 'f')"
+    ), {"t": table}).all()
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    for name, _ in indexes:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name[:50]}_legacy")
+    for name, _, _ in constraints:
+        op.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {name[:50]}_legacy")
+    op.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {table}_pkey_legacy")
+
+    op.execute(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS)")
+    op.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({pk})")
+    for _, definition in indexes:
+        op.execute(definition)
+    for name, _, definition in constraints:
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    op.execute(f"DROP TABLE {legacy}")
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table, (pk, key) in TABLES.items():
+        if _exists(bind, table) and not _is_partitioned(bind, table):
+            _partition(table, key, pk)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table, (pk, key) in TABLES.items():
+        if _exists(bind, table) and _is_partitioned(bind, table):
+            _unpartition(table, key, pk)
@@ -0,0 +1,45 @@
+"""comparison_sessions: don't bump updated_at for message counter writes
+
+Revision ID: 20261019_session_touch_counters
+Revises: 20261019_session_touch
+Create Date: 2026-10-19
+
+WHY: add_chat_message (and the partition retention recompute) maintain
+message_count / last_message_at with an UPDATE on the session row; the update
+trigger stamped updated_at for those too, reordering the session list and
+breaking its keyset cursors. The counters join the columns the trigger
+ignores.
+"""
+
+from alembic import op
+
+revision = '20261019_session_touch_counters'
+down_revision = '20261019_session_touch'
+branch_labels = None
+depends_on = None
+
+
+def _touch_function(maintained):
+    cols = ", ".join(f"'{c}'" for c in maintained + ["updated_at"])
+    return f"""
+        CREATE OR REPLACE FUNCTION comparison_sessions_touch_updated_at() RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+        BEGIN
+            IF (to_jsonb(NEW) - ARRAY[{cols}]) = (to_jsonb(OLD) - ARRAY[{cols}]) THEN
+                NEW.updated_at = OLD.updated_at;
+            ELSE
+                NEW.updated_at = CURRENT_TIMESTAMP;
+            END IF;
+            RETURN NEW;
+        END;
+        $$;
+        """
+
+
+def upgrade():
+    op.execute(_touch_function(["conversation_summary", "summary_through", "message_count", "last_message_at"]))
+
+
+def downgrade():
+    op.execute(_touch_function(["conversation_summary", "summary_through"]))
@@ -0,0 +1,53 @@
+"""comparison_sessions: don't bump updated_at for conversation-memory writes
+
+Revision ID: 20261019_session_touch
+Revises: 20261019_add_search_users
+Create Date: 2026-10-19
+
+WHY: The generic update_updated_at_column() trigger stamps updated_at on
+every UPDATE, so background summarization reordered the session list (which
+is sorted by updated_at) and invalidated keyset cursors. Sessions get their
+own trigger function that keeps updated_at when only maintained columns
+changed.
+"""
+
+from alembic import op
+
+revision = '20261019_session_touch'
+down_revision = '20261019_add_search_users'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION comparison_sessions_touch_updated_at() RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+        BEGIN
+            IF (to_jsonb(NEW) - ARRAY['conversation_summary', 'summary_through', 'updated_at'])
+               = (to_jsonb(OLD) - ARRAY['conversation_summary', 'summary_through', 'updated_at']) THEN
+                NEW.updated_at = OLD.updated_at;
+            ELSE
+                NEW.updated_at = CURRENT_TIMESTAMP;
+            END IF;
+            RETURN NEW;
+        END;
+        $$;
+        """
+    )
+    op.execute("DROP TRIGGER IF EXISTS update_comparison_sessions_updated_at ON comparison_sessions")
+    op.execute(
+        "CREATE TRIGGER update_comparison_sessions_updated_at BEFORE UPDATE ON comparison_sessions "
+        "FOR EACH ROW EXECUTE FUNCTION comparison_sessions_touch_updated_at()"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS update_comparison_sessions_updated_at ON comparison_sessions")
+    op.execute(
+        "CREATE TRIGGER update_comparison_sessions_updated_at BEFORE UPDATE ON comparison_sessions "
+        "FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()"
+    )
+    op.execute("DROP FUNCTION IF EXISTS comparison_sessions_touch_updated_at()")
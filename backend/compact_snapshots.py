@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Compact product price/rating history for Query and Buy
+
+Collapses runs of identical consecutive snapshots into single
+(value, first seen, last seen) rows. Safe to re-run; schedule it
+(e.g. nightly) or run once after deploying change-only snapshot writes.
+
+Usage: python compact_snapshots.py [--batch-products N]
+"""
+
+import argparse
+
+from dotenv import load_dotenv
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run-length-encode product_prices / product_ratings")
+    parser.add_argument("--batch-products", type=int, default=500, help="products per transaction")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    from services.product_snapshots import ProductSnapshotRepository
+
+    db = SessionLocal()
+    try:
+        removed = ProductSnapshotRepository(db).compact_history(batch_products=args.batch_products)
+        for table, count in removed.items():
+            print(f"{table}: removed {count} duplicate rows")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 import os
+import asyncio
+import json
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from services.walmart_service import WalmartService
 from services.amazon_service import AmazonService
@@ -11,7 +15,25 @@ from services.grok_service import GrokService
 from services.user_service import UserService
 from services.verification_service import VerificationService
 from services.activity_service import ActivityService
-from database import get_db, engine
+from services.activity_writer import ActivityWriteBuffer, EventRateLimiter
+from services.llm_scheduler import LLMScheduler, PRIORITY_CHAT, PRIORITY_COMPARE, PRIORITY_SUMMARY
+from services.speculative_overview import SpeculativeOverview
+from services.product_snapshots import ProductSnapshotRepository
+from services.count_service import TOTAL_MODES, counts as count_service
+from services.partitions import PartitionManager
+from services.analytics_rollups import (
+    RollupRunner,
+    SearchAnalyticsRollup,
+    UserAnalyticsRollup,
+    top_search_queries,
+    trending_search_queries,
+    user_activity_summary,
+)
+from services.summary_batcher import SummaryBatcher
+from services.comparison_jobs import ComparisonJobStore, TERMINAL_STATUSES
+from services.conversation_memory import ConversationMemory
+from services.chat_intents import answer_structured, is_overview_request
+from database import get_db, engine, SessionLocal
 from models import Base
 from schemas import UserRegisterRequest, UserLoginRequest, AuthResponse, ErrorResponse
 from schemas import (
@@ -44,6 +66,9 @@ load_dotenv()
 
 app = FastAPI(title="Query and Buy API", version="1.0.0")
 
+# Monthly partitions / retention for user_events, product_prices, chat_messages
+partition_manager = PartitionManager()
+
 # Create database tables on startup so import doesn't crash if DB is down
 @app.on_event("startup")
 def on_startup_create_tables():
@@ -54,6 +79,15 @@ def on_startup_create_tables():
         print(f"Warning: failed to create tables on startup: {e}")
 
 
+@app.on_event("startup")
+def on_startup_maintain_partitions():
+    # Keep upcoming monthly partitions ready and apply retention (no-op until partitioned)
+    try:
+        partition_manager.run(engine)
+    except Exception as e:
+        print(f"Warning: partition maintenance failed on startup: {e}")
+
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -97,6 +131,55 @@ except Exception as e:
     print(f"Warning: Grok summarizer not available - {e}")
     grok_summarizer = None
 
+# Bounded, prioritized worker pool shared by every Grok call
+llm_scheduler = LLMScheduler()
+
+
+async def _run_summary_batch(texts: List[str], user_key: Optional[str]) -> List[str]:
+    return await llm_scheduler.run_async(PRIORITY_SUMMARY, grok_summarizer.summarize_queries, texts, user_key=user_key)
+
+# Coalesces concurrent summarize requests of a user into one multi-item Grok call
+summary_batcher = SummaryBatcher(_run_summary_batch)
+
+# Asynchronous comparison jobs (submit -> poll/subscribe -> result)
+comparison_jobs = ComparisonJobStore()
+
+# Bounded chat history (running summary + recent turns) for comparison sessions
+conversation_memory = ConversationMemory()
+
+# Background overview generation at session creation (budgeted per user)
+speculative_overview = SpeculativeOverview(comparison_service, llm_scheduler)
+
+# Write-behind batching of search history and user events
+activity_writer = ActivityWriteBuffer(SessionLocal)
+event_rate_limiter = EventRateLimiter()
+
+
+@app.on_event("shutdown")
+def on_shutdown_flush_activity():
+    # Don't lose buffered searches/events on a graceful restart
+    activity_writer.stop()
+    analytics_rollups.stop()
+
+
+# Incremental analytics rollups (search_analytics, user_analytics) from the raw activity tables
+analytics_rollups = RollupRunner(SessionLocal, [SearchAnalyticsRollup(), UserAnalyticsRollup()])
+SEARCH_ANALYTICS_MIN_SEARCHES = int(os.getenv("SEARCH_ANALYTICS_MIN_SEARCHES", "3"))
+# Raw query text is only shown once this many different users searched it
+SEARCH_ANALYTICS_MIN_USERS = max(2, int(os.getenv("SEARCH_ANALYTICS_MIN_USERS", "5")))
+
+
+@app.on_event("startup")
+def on_startup_start_rollups():
+    analytics_rollups.start()
+
+
+def _llm_user_key(current_user, request: Request) -> str:
+    """Fairness key for the LLM scheduler: user id when known, else client IP."""
+    if current_user and "user_id" in current_user:
+        return str(current_user["user_id"])
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
 class SearchRequest(BaseModel):
     query: str
     platform: str = "walmart_search"
@@ -174,13 +257,19 @@ async def search_products(request: SearchRequest, current_user = Depends(get_cur
         # Log search history if authenticated and logging enabled
         try:
             if (request.log is None or request.log is True) and current_user and "user_id" in current_user:
-                activity = ActivityService(db)
-                activity.log_search(
+                queued = activity_writer.enqueue_search(
                     user_id=current_user["user_id"],
                     search_query=request.query,
                     platform=request.platform,
                     results_count=results.get("total_results", 0),
                 )
+                if not queued:
+                    ActivityService(db).log_search(
+                        user_id=current_user["user_id"],
+                        search_query=request.query,
+                        platform=request.platform,
+                        results_count=results.get("total_results", 0),
+                    )
         except Exception:
             # Non-fatal; continue
             pass
@@ -387,7 +476,7 @@ async def get_amazon_product_reviews(url: str, page: int = 1, platform: str = "a
         raise HTTPException(status_code=500, detail=f"Amazon product reviews request failed: {str(e)}")
 
 @app.post("/api/compare", response_model=ComparisonResponse)
-def compare_products(request: ComparisonRequest):
+async def compare_products(request: ComparisonRequest, http_request: Request, current_user = Depends(get_current_user_optional)):
     """
     Generate AI-powered comparison analysis for selected products
     
@@ -402,14 +491,17 @@ def compare_products(request: ComparisonRequest):
         if not request.products or len(request.products) < 1:
             raise HTTPException(status_code=400, detail="At least one product is required for comparison")
         
-        if len(request.products) > 5:
-            raise HTTPException(status_code=400, detail="Maximum 5 products can be compared at once")
+        if len(request.products) > comparison_service.max_products:
+            raise HTTPException(status_code=400, detail=f"Maximum {comparison_service.max_products} products can be compared at once")
         
-        # Generate comparison
-        comparison_result = comparison_service.compare_products(
+        # Generate comparison on the LLM worker pool (keeps request workers free)
+        comparison_result = await llm_scheduler.run_async(
+            PRIORITY_COMPARE,
+            comparison_service.compare_products,
             selected_products=request.products,
             user_question=request.user_question,
-            original_search_query=request.original_search_query
+            original_search_query=request.original_search_query,
+            user_key=_llm_user_key(current_user, http_request),
         )
         
         return ComparisonResponse(
@@ -424,6 +516,109 @@ def compare_products(request: ComparisonRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Product comparison failed: {str(e)}")
 
+class ComparisonJobResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: str
+    progress: Dict = {}
+    result: Optional[ComparisonResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+    finished_at: Optional[float] = None
+
+def _run_comparison_job(job_id: str, request_data: Dict) -> None:
+    """Worker-side body of a comparison job; records the outcome on the job store."""
+    try:
+        result = comparison_service.compare_products(
+            selected_products=request_data["products"],
+            user_question=request_data.get("user_question"),
+            original_search_query=request_data.get("original_search_query"),
+            progress=lambda stage, **details: comparison_jobs.update_progress(job_id, stage, **details),
+        )
+        comparison_jobs.finish(job_id, result={
+            "ai_analysis": result["ai_analysis"],
+            "products_analyzed": result["products_analyzed"],
+            "original_search_query": result["original_search_query"],
+            "user_question": result["user_question"],
+        })
+    except HTTPException as e:
+        comparison_jobs.finish(job_id, error=str(e.detail))
+    except Exception as e:
+        comparison_jobs.finish(job_id, error=f"Product comparison failed: {str(e)}")
+
+def _record_unstarted_job(job_id: str, future) -> None:
+    # Jobs that expired in the queue (or were cancelled) never ran _run_comparison_job
+    if future.cancelled():
+        comparison_jobs.cancel(job_id)
+        return
+    err = future.exception()
+    if err is not None:
+        comparison_jobs.finish(job_id, error=str(getattr(err, "detail", err)))
+
+@app.post("/api/compare/jobs", response_model=ComparisonJobResponse, status_code=202)
+async def submit_comparison_job(request: ComparisonRequest, http_request: Request, current_user = Depends(get_current_user_optional)):
+    """
+    Queue a comparison and return immediately with a job id.
+
+    Poll GET /api/compare/jobs/{job_id} or subscribe to
+    GET /api/compare/jobs/{job_id}/events for status and the final result.
+    """
+    if not comparison_service:
+        raise HTTPException(status_code=500, detail="Comparison service not configured")
+    if not request.products or len(request.products) < 1:
+        raise HTTPException(status_code=400, detail="At least one product is required for comparison")
+    if len(request.products) > comparison_service.max_products:
+        raise HTTPException(status_code=400, detail=f"Maximum {comparison_service.max_products} products can be compared at once")
+
+    owner_key = _llm_user_key(current_user, http_request)
+    job = comparison_jobs.create(owner_key, request.dict())
+    try:
+        future = llm_scheduler.submit(
+            PRIORITY_COMPARE,
+            _run_comparison_job,
+            job["job_id"],
+            job["request"],
+            user_key=owner_key,
+            max_wait_seconds=comparison_jobs.retention_seconds,
+            background=True,
+        )
+    except HTTPException as e:
+        comparison_jobs.finish(job["job_id"], error=str(e.detail))
+        raise
+    future.add_done_callback(lambda f: _record_unstarted_job(job["job_id"], f))
+    return ComparisonJobStore.public_view(job)
+
+@app.get("/api/compare/jobs/{job_id}", response_model=ComparisonJobResponse)
+async def get_comparison_job(job_id: str, http_request: Request, current_user = Depends(get_current_user_optional)):
+    job = comparison_jobs.get(job_id, _llm_user_key(current_user, http_request))
+    if not job:
+        raise HTTPException(status_code=404, detail="Comparison job not found")
+    return ComparisonJobStore.public_view(job)
+
+@app.get("/api/compare/jobs/{job_id}/events")
+async def stream_comparison_job(job_id: str, http_request: Request, current_user = Depends(get_current_user_optional)):
+    """Server-sent events: one `status` event per change, ending with the terminal state."""
+    owner_key = _llm_user_key(current_user, http_request)
+    if not comparison_jobs.get(job_id, owner_key):
+        raise HTTPException(status_code=404, detail="Comparison job not found")
+
+    async def events():
+        last_update = None
+        while True:
+            job = comparison_jobs.get(job_id, owner_key)
+            if not job:
+                yield "event: error\ndata: {\"detail\": \"Comparison job not found\"}\n\n"
+                return
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield f"event: status\ndata: {json.dumps(ComparisonJobStore.public_view(job), default=str)}\n\n"
+            if job["status"] in TERMINAL_STATUSES or await http_request.is_disconnected():
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/api/compare/health")
 async def compare_health_check():
     """
@@ -435,7 +630,16 @@ async def compare_health_check():
             "walmart": walmart_service is not None,
             "amazon": amazon_service is not None,
             "comparison": comparison_service is not None
-        }
+        },
+        # Token usage per prompt version (cached-token ratio, hit/miss latency)
+        "llm_usage": comparison_service.grok_service.get_usage_stats() if comparison_service else {},
+        # Queue depth and queue-wait metrics per priority class
+        "llm_scheduler": llm_scheduler.get_stats(),
+        "speculative_overview": speculative_overview.get_stats(),
+        "count_cache": count_service.get_stats(),
+        "activity_writer": activity_writer.get_stats(),
+        "event_rate_limiter": event_rate_limiter.get_stats(),
+        "analytics_rollups": analytics_rollups.get_stats(),
     }
 
 # ============================================================================
@@ -443,26 +647,62 @@ async def compare_health_check():
 # ============================================================================
 
 @app.get("/api/search/summarize")
-async def summarize_query(text: str):
+async def summarize_query(text: str, request: Request, current_user = Depends(get_current_user_optional)):
     if not grok_summarizer:
         raise HTTPException(status_code=503, detail="Summarizer not configured")
     try:
-        short = grok_summarizer.summarize_query(text)
+        # Zero-latency path: cached or locally titled simple queries skip the LLM
+        short = grok_summarizer.quick_summary(text)
+        if short is None:
+            short = await summary_batcher.summarize(text, _llm_user_key(current_user, request))
         return {"summary": short}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
 
+class SummarizeBatchRequest(BaseModel):
+    texts: List[str]
+
+@app.post("/api/search/summarize/batch")
+async def summarize_queries(body: SummarizeBatchRequest, request: Request, current_user = Depends(get_current_user_optional)):
+    """Summarize many query strings at once; summaries are aligned with `texts`."""
+    if not grok_summarizer:
+        raise HTTPException(status_code=503, detail="Summarizer not configured")
+    if len(body.texts) > 100:
+        raise HTTPException(status_code=400, detail="Maximum 100 texts per request")
+    try:
+        summaries = await summary_batcher.summarize_many(body.texts, _llm_user_key(current_user, request))
+        return {"summaries": summaries}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
+
 # ============================================================================
 # ACTIVITY: SEARCH HISTORY ENDPOINTS
 # ============================================================================
 
+def _total_mode(total: Optional[str], include_total: Optional[bool], cursor: Optional[str]) -> str:
+    """Resolve ?total=exact|approx|none (include_total kept as a boolean alias).
+
+    Without either, offset pages keep returning exact totals and cursor pages skip them.
+    """
+    if total is not None:
+        if total not in TOTAL_MODES:
+            raise ValueError(f"total must be one of: {', '.join(TOTAL_MODES)}")
+        return total
+    if include_total is not None:
+        return "exact" if include_total else "none"
+    return "none" if cursor else "exact"
+
 @app.get("/api/activity/searches", response_model=SearchHistoryListResponse)
-async def list_search_history(limit: int = 20, offset: int = 0, current_user = Depends(get_current_user), db = Depends(get_db)):
+async def list_search_history(limit: int = 20, offset: int = 0, cursor: Optional[str] = None, include_total: Optional[bool] = None, total: Optional[str] = None, current_user = Depends(get_current_user), db = Depends(get_db)):
     try:
         service = ActivityService(db)
-        items, total = service.list_search_history(current_user["user_id"], limit=limit, offset=offset)
+        items, total, next_cursor = service.list_search_history(
+            current_user["user_id"], limit=limit, offset=offset, cursor=cursor, total_mode=_total_mode(total, include_total, cursor)
+        )
         # Map ORM rows to response dicts to avoid serialization mismatches
         mapped = [
             {
@@ -475,7 +715,9 @@ async def list_search_history(limit: int = 20, offset: int = 0, current_user = D
             }
             for it in items
         ]
-        return {"items": mapped, "total": total}
+        return {"items": mapped, "total": total, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch search history: {str(e)}")
 
@@ -549,11 +791,15 @@ async def remove_favorite(product_id: str, current_user = Depends(get_current_us
         raise HTTPException(status_code=500, detail=f"Failed to remove favorite: {str(e)}")
 
 @app.get("/api/favorites", response_model=FavoriteListResponse)
-async def list_favorites(limit: int = 20, offset: int = 0, current_user = Depends(get_current_user), db = Depends(get_db)):
+async def list_favorites(limit: int = 20, offset: int = 0, cursor: Optional[str] = None, include_total: Optional[bool] = None, total: Optional[str] = None, current_user = Depends(get_current_user), db = Depends(get_db)):
     try:
         service = ActivityService(db)
-        items, total = service.list_favorites(current_user["user_id"], limit=limit, offset=offset)
-        return FavoriteListResponse(items=items, total=total)
+        items, total, next_cursor = service.list_favorites(
+            current_user["user_id"], limit=limit, offset=offset, cursor=cursor, total_mode=_total_mode(total, include_total, cursor)
+        )
+        return FavoriteListResponse(items=items, total=total, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch favorites: {str(e)}")
 
@@ -570,34 +816,207 @@ async def is_favorite(product_id: str, current_user = Depends(get_current_user),
 # USER EVENTS (product interactions)
 # ============================================================================
 
+# Whitelist of event types (those present in event_types)
+ALLOWED_EVENT_TYPES = {"search", "product_view", "product_save", "product_compare", "chat_message", "outbound_click", "share"}
+# A batch larger than the rate limiter's burst could never be admitted (429 forever)
+EVENTS_BATCH_MAX = min(int(os.getenv("ACTIVITY_EVENTS_BATCH_MAX", "500")), event_rate_limiter.burst)
+EVENTS_BATCH_MAX_BYTES = int(os.getenv("ACTIVITY_EVENTS_BATCH_MAX_BYTES", "1048576"))
+
+
+def _event_data(metadata: Optional[dict], product_id: Optional[str], action: Optional[str]) -> dict:
+    data = dict(metadata or {})
+    if product_id:
+        data["product_id"] = product_id
+    if action:
+        data["action"] = action
+    return data
+
+
+class _MalformedLine:
+    """Stand-in for an NDJSON line that isn't valid JSON, rejected by index like other bad items."""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+def _parse_ndjson_line(line: str):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return _MalformedLine(str(e))
+
+
+def _parse_event_batch(raw: bytes, content_type: str) -> list:
+    """Decode a JSON array / {"events": [...]} / NDJSON body into a list of items (ValueError when malformed).
+
+    A bad NDJSON line doesn't fail the batch; it becomes a _MalformedLine item.
+    """
+    text = raw.decode("utf-8")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        return [_parse_ndjson_line(line) for line in text.splitlines() if line.strip()]
+    payload = json.loads(text)
+    if isinstance(payload, dict):
+        payload = payload.get("events")
+    if not isinstance(payload, list):
+        raise ValueError("expected a JSON array of events")
+    return payload
+
+
+def _validate_event_item(item) -> tuple:
+    """(event_type, event_data) for one batch item; raises ValueError with the reason."""
+    if isinstance(item, _MalformedLine):
+        raise ValueError(f"invalid JSON: {item.error}")
+    if not isinstance(item, dict):
+        raise ValueError("event must be an object")
+    event_type = item.get("event_type")
+    if event_type not in ALLOWED_EVENT_TYPES:
+        raise ValueError("invalid event_type")
+    metadata = item.get("metadata")
+    if metadata is not None and not isinstance(metadata, dict):
+        raise ValueError("metadata must be an object")
+    product_id, action = item.get("product_id"), item.get("action")
+    if not isinstance(product_id, (str, type(None))) or not isinstance(action, (str, type(None))):
+        raise ValueError("product_id and action must be strings")
+    return event_type, _event_data(metadata, product_id, action)
+
+
 @app.post("/api/activity/events")
 async def create_event(body: EventRequest, current_user = Depends(get_current_user), db = Depends(get_db)):
     try:
-        # Optional: whitelist event types to those present in event_types
-        allowed = {"search", "product_view", "product_save", "product_compare", "chat_message", "outbound_click", "share"}
-        if body.event_type not in allowed:
+        if body.event_type not in ALLOWED_EVENT_TYPES:
             raise HTTPException(status_code=400, detail="Invalid event type")
 
-        data = body.metadata or {}
-        if body.product_id:
-            data["product_id"] = body.product_id
-        if body.action:
-            data["action"] = body.action
+        data = _event_data(body.metadata, body.product_id, body.action)
 
-        service = ActivityService(db)
-        event = service.log_event(current_user["user_id"], event_type=body.event_type, event_data=data)
-        return {"event_id": str(event.event_id)}
+        event_id = activity_writer.enqueue_event(current_user["user_id"], event_type=body.event_type, event_data=data)
+        if event_id is None:
+            event_id = ActivityService(db).log_event(current_user["user_id"], event_type=body.event_type, event_data=data).event_id
+        return {"event_id": str(event_id)}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create event: {str(e)}")
 
+async def _read_capped_body(request: Request, max_bytes: int) -> bytes:
+    """Read the request body, failing with 413 as soon as it exceeds max_bytes."""
+    too_large = HTTPException(status_code=413, detail="Event batch too large")
+    try:
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if declared > max_bytes:
+        raise too_large
+    # Content-Length may be missing (chunked) or wrong: count what is actually read
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@app.post("/api/activity/events/batch", status_code=202)
+async def create_events_batch(request: Request, current_user = Depends(get_current_user), db = Depends(get_db)):
+    """Ingest many events at once (JSON array, {"events": [...]} or NDJSON).
+
+    Items are validated individually; invalid ones are reported by index and
+    the rest accepted. Accepted events are buffered and written in bulk (COPY)
+    by the activity writer, so the response is 202 before they are stored.
+    """
+    raw = await _read_capped_body(request, EVENTS_BATCH_MAX_BYTES)
+    try:
+        items = _parse_event_batch(raw, request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed event batch: {e}")
+    if len(items) > EVENTS_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {EVENTS_BATCH_MAX} events per batch")
+
+    events, rejected = [], []
+    for index, item in enumerate(items):
+        try:
+            events.append(_validate_event_item(item))
+        except ValueError as e:
+            rejected.append({"index": index, "error": str(e)})
+
+    user_id = current_user["user_id"]
+    if events:
+        retry_after = event_rate_limiter.take(str(user_id), len(events))
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Event rate limit exceeded",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+        if activity_writer.enqueue_events(user_id, events) is None:
+            # Buffer disabled or shutting down: write the batch now
+            try:
+                now = datetime.now(timezone.utc)
+                ActivityService(db).bulk_log_events(
+                    [ActivityWriteBuffer.event_row(user_id, event_type, data, now) for event_type, data in events]
+                )
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to store events: {str(e)}")
+    return JSONResponse(status_code=202, content={"accepted": len(events), "rejected": rejected})
+
+@app.get("/api/analytics/searches")
+async def search_analytics(kind: str = "top", platform: Optional[str] = None, limit: int = 20, window_days: int = 7, current_user = Depends(get_current_user), db = Depends(get_db)):
+    """Top (all-time) or trending (last `window_days` vs the window before) search queries.
+
+    Served from the search_analytics rollups, so results lag new searches by
+    up to ROLLUP_INTERVAL_SECONDS. Queries seen fewer than
+    SEARCH_ANALYTICS_MIN_SEARCHES times or by fewer than
+    SEARCH_ANALYTICS_MIN_USERS different users are never returned, so one
+    user's searches can't be read back by others.
+    """
+    if kind not in ("top", "trending"):
+        raise HTTPException(status_code=400, detail="kind must be 'top' or 'trending'")
+    limit = max(1, min(limit, 100))
+    window_days = max(1, min(window_days, 90))
+    try:
+        if kind == "top":
+            items = top_search_queries(
+                db,
+                platform=platform,
+                limit=limit,
+                min_searches=SEARCH_ANALYTICS_MIN_SEARCHES,
+                min_users=SEARCH_ANALYTICS_MIN_USERS,
+            )
+        else:
+            items = trending_search_queries(
+                db,
+                platform=platform,
+                window_days=window_days,
+                limit=limit,
+                min_searches=SEARCH_ANALYTICS_MIN_SEARCHES,
+                min_users=SEARCH_ANALYTICS_MIN_USERS,
+            )
+        return {"kind": kind, "items": items}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch search analytics: {str(e)}")
+
+@app.get("/api/activity/summary")
+async def activity_summary(days: int = 30, current_user = Depends(get_current_user), db = Depends(get_db)):
+    """Per-day searches, product views, comparisons and chat messages for the dashboard.
+
+    Served from the user_analytics rollup (refreshed every ROLLUP_INTERVAL_SECONDS), not the raw tables.
+    """
+    days = max(1, min(days, 366))
+    try:
+        return user_activity_summary(db, current_user["user_id"], days=days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch activity summary: {str(e)}")
+
 @app.get("/api/activity/events", response_model=EventListResponse)
-async def list_events(event_type: Optional[str] = None, limit: int = 20, offset: int = 0, current_user = Depends(get_current_user), db = Depends(get_db)):
+async def list_events(event_type: Optional[str] = None, limit: int = 20, offset: int = 0, cursor: Optional[str] = None, include_total: Optional[bool] = None, total: Optional[str] = None, current_user = Depends(get_current_user), db = Depends(get_db)):
     try:
         service = ActivityService(db)
-        items, total = service.list_events(current_user["user_id"], event_type=event_type, limit=limit, offset=offset)
-        return EventListResponse(items=items, total=total)
+        items, total, next_cursor = service.list_events(
+            current_user["user_id"], event_type=event_type, limit=limit, offset=offset,
+            cursor=cursor, total_mode=_total_mode(total, include_total, cursor),
+        )
+        return EventListResponse(items=items, total=total, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch events: {str(e)}")
 
@@ -605,79 +1024,92 @@ async def list_events(event_type: Optional[str] = None, limit: int = 20, offset:
 # COMPARISON SESSIONS & CHAT MESSAGES
 # ============================================================================
 
+def _session_selected_products(db, activity: ActivityService, comparison_id) -> List[Dict]:
+    """Products of a session in the shape ComparisonService expects (latest price/rating snapshot)."""
+    products_rows = activity.list_comparison_products(comparison_id)
+    try:
+        snapshots = ProductSnapshotRepository(db).latest_for([row.product_id for row in products_rows])
+        return [
+            {
+                "id": pid,
+                "platform": snap["platform_name"] or "walmart",
+                "url": snap["product_url"],
+                "name": snap["product_name"],
+                "image": snap["image_url"],
+                "price": snap["price"],
+                "original_price": snap["original_price"],
+                "currency": snap["currency_code"],
+                "currency_symbol": snap["currency_symbol"],
+                "in_stock": snap["in_stock"],
+                "rating": snap["average_rating"],
+                "total_reviews": snap["total_reviews"],
+            }
+            for pid, snap in snapshots.items()
+        ]
+    except Exception:
+        return [{"id": row.product_id, "platform": "walmart"} for row in products_rows]
+
 @app.post("/api/compare/sessions")
 async def create_comparison_session(body: ComparisonSessionCreateRequest, current_user = Depends(get_current_user), db = Depends(get_db)):
     try:
         if not body.product_ids:
             raise HTTPException(status_code=400, detail="product_ids is required")
         service = ActivityService(db)
-        # Best-effort: ensure product rows exist from snapshots if provided
-        if body.products:
-            for p in body.products:
-                try:
-                    service.ensure_product_exists(
-                        product_id=p.product_id,
-                        platform_name=p.platform_name,
-                        product_name=p.product_name,
-                        product_url=p.product_url,
-                        image_url=p.image_url,
-                        price=getattr(p, 'price', None),
-                        original_price=getattr(p, 'original_price', None),
-                        currency_code=getattr(p, 'currency_code', None),
-                        currency_symbol=getattr(p, 'currency_symbol', None),
-                        is_in_stock=getattr(p, 'in_stock', None),
-                        average_rating=getattr(p, 'average_rating', None),
-                        total_review_count=getattr(p, 'total_reviews', None),
-                    )
-                except Exception:
-                    pass
+        # Snapshots (if provided) are recorded in bulk with the session
+        snapshots = [
+            {
+                "product_id": p.product_id,
+                "platform_name": p.platform_name,
+                "product_name": p.product_name,
+                "product_url": p.product_url,
+                "image_url": p.image_url,
+                "price": p.price,
+                "original_price": p.original_price,
+                "currency_code": p.currency_code,
+                "currency_symbol": p.currency_symbol,
+                "is_in_stock": p.in_stock,
+                "average_rating": p.average_rating,
+                "total_review_count": p.total_reviews,
+            }
+            for p in (body.products or [])
+        ]
         session = service.create_comparison_session(
             user_id=current_user["user_id"],
             product_ids=body.product_ids,
             original_search_query=body.original_search_query,
             session_name=body.session_name,
+            products=snapshots,
         )
-        return {"comparison_id": str(session.comparison_id)}
+        # Speculatively generate the default overview so the first chat turn is instant
+        speculating = False
+        if body.prefetch_overview is not False:
+            try:
+                speculating = speculative_overview.maybe_start(
+                    str(current_user["user_id"]),
+                    _session_selected_products(db, service, session.comparison_id),
+                    body.original_search_query,
+                )
+            except Exception as e:
+                print(f"Warn: speculative overview not started - {e}")
+        return {"comparison_id": str(session.comparison_id), "overview_prefetch": speculating}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create comparison session: {str(e)}")
 
 @app.get("/api/compare/sessions", response_model=ComparisonSessionListResponse)
-async def list_comparison_sessions(limit: int = 20, offset: int = 0, current_user = Depends(get_current_user), db = Depends(get_db)):
+async def list_comparison_sessions(limit: int = 20, offset: int = 0, cursor: Optional[str] = None, include_total: Optional[bool] = None, total: Optional[str] = None, current_user = Depends(get_current_user), db = Depends(get_db)):
     try:
         service = ActivityService(db)
-        # Only sessions with at least 2 messages
-        items, total = service.list_comparison_sessions(current_user["user_id"], limit=limit, offset=offset, min_messages=2)
-        # Attach a small products preview (first up to 3 images)
-        try:
-            from models import ComparisonProduct, Product
-            enriched = []
-            for sess in items:
-                rows = (
-                    db.query(ComparisonProduct)
-                    .filter(ComparisonProduct.comparison_id == sess.comparison_id)
-                    .limit(3)
-                    .all()
-                )
-                previews = []
-                for r in rows:
-                    prod = db.query(Product).filter(Product.product_id == r.product_id).first()
-                    previews.append({
-                        "product_id": r.product_id,
-                        "image_url": getattr(prod, "image_url", None),
-                    })
-                enriched.append({
-                    "comparison_id": sess.comparison_id,
-                    "session_name": sess.session_name,
-                    "original_search_query": sess.original_search_query,
-                    "created_at": sess.created_at,
-                    "updated_at": sess.updated_at,
-                    "products_preview": previews,
-                })
-            return {"items": enriched, "total": total}
-        except Exception:
-            return ComparisonSessionListResponse(items=items, total=total)
+        # Only sessions with at least 2 messages, with counts and a small products preview
+        # (first up to 3 images) in a single query
+        items, total, next_cursor = service.list_comparison_sessions_with_previews(
+            current_user["user_id"], limit=limit, offset=offset, min_messages=2, preview_limit=3,
+            cursor=cursor, total_mode=_total_mode(total, include_total, cursor),
+        )
+        return {"items": items, "total": total, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch comparison sessions: {str(e)}")
 
@@ -704,11 +1136,16 @@ async def get_comparison_session(comparison_id: str, current_user = Depends(get_
         raise HTTPException(status_code=500, detail=f"Failed to fetch comparison session: {str(e)}")
 
 @app.get("/api/compare/sessions/{comparison_id}/messages", response_model=ChatMessageListResponse)
-async def list_chat_messages(comparison_id: str, limit: int = 50, offset: int = 0, current_user = Depends(get_current_user), db = Depends(get_db)):
+async def list_chat_messages(comparison_id: str, limit: int = 50, offset: int = 0, cursor: Optional[str] = None, include_total: Optional[bool] = None, total: Optional[str] = None, current_user = Depends(get_current_user), db = Depends(get_db)):
     try:
         service = ActivityService(db)
-        items, total = service.list_chat_messages(current_user["user_id"], comparison_id, limit=limit, offset=offset)
-        return ChatMessageListResponse(items=items, total=total)
+        items, total, next_cursor = service.list_chat_messages(
+            current_user["user_id"], comparison_id, limit=limit, offset=offset,
+            cursor=cursor, total_mode=_total_mode(total, include_total, cursor),
+        )
+        return ChatMessageListResponse(items=items, total=total, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
 
@@ -736,48 +1173,52 @@ async def add_chat_message(comparison_id: str, body: ChatMessageCreateRequest, c
             raise HTTPException(status_code=404, detail="Comparison session not found")
 
         # Collect product ids and include enriched snapshot (price, rating, stock, name, image)
-        products_rows = activity.list_comparison_products(comparison_id)
-        selected_products = []
-        try:
-            from models import Product, ProductPrice, ProductRating
-            for row in products_rows:
-                prod = db.query(Product).filter(Product.product_id == row.product_id).first()
-                price_row = (
-                    db.query(ProductPrice)
-                    .filter(ProductPrice.product_id == row.product_id)
-                    .order_by(ProductPrice.price_recorded_at.desc())
-                    .first()
-                )
-                rating_row = (
-                    db.query(ProductRating)
-                    .filter(ProductRating.product_id == row.product_id)
-                    .order_by(ProductRating.rating_recorded_at.desc())
-                    .first()
-                )
-                selected_products.append({
-                    "id": row.product_id,
-                    "platform": (prod.platform_name if prod else None) or "walmart",
-                    "url": getattr(prod, "product_url", None),
-                    "name": getattr(prod, "product_name", None),
-                    "image": getattr(prod, "image_url", None),
-                    "price": getattr(price_row, "current_price", None),
-                    "original_price": getattr(price_row, "original_price", None),
-                    "currency": getattr(price_row, "currency_code", None),
-                    "currency_symbol": getattr(price_row, "currency_symbol", None),
-                    "in_stock": getattr(price_row, "is_in_stock", None),
-                    "rating": getattr(rating_row, "average_rating", None),
-                    "total_reviews": getattr(rating_row, "total_review_count", None),
-                })
-        except Exception:
-            selected_products = [{"id": row.product_id, "platform": "walmart"} for row in products_rows]
+        selected_products = _session_selected_products(db, activity, comparison_id)
+
+        # Simple lookups (cheapest, best rated, in stock...) are answered from the snapshot without the LLM
+        structured = answer_structured(body.message_content.strip(), selected_products)
+        if structured:
+            activity.add_chat_message(
+                user_id=current_user["user_id"],
+                comparison_id=comparison_id,
+                message_type="ai",
+                message_content=structured["answer"],
+                ai_metadata={"source": "structured", "intent": structured["intent"]},
+            )
+            _schedule_memory_refresh(current_user["user_id"], comparison_id)
+            return {"ok": True, "ai_message": structured["answer"]}
 
         if not comparison_service:
             raise HTTPException(status_code=500, detail="Comparison service not configured")
 
-        comp = comparison_service.compare_products(
+        try:
+            history = conversation_memory.build_history(
+                activity, current_user["user_id"], comparison_id, exclude_message_id=user_msg.message_id
+            )
+        except Exception:
+            history = None
+
+        # First turn asking for the overview: reuse the speculative (or cached) one
+        if history is None and is_overview_request(body.message_content):
+            overview = await speculative_overview.get_or_wait(selected_products, session.original_search_query)
+            if overview and overview.get("ai_analysis"):
+                activity.add_chat_message(
+                    user_id=current_user["user_id"],
+                    comparison_id=comparison_id,
+                    message_type="ai",
+                    message_content=overview["ai_analysis"],
+                    ai_metadata={"source": "overview_cache"},
+                )
+                return {"ok": True, "ai_message": overview["ai_analysis"]}
+
+        comp = await llm_scheduler.run_async(
+            PRIORITY_CHAT,
+            comparison_service.compare_products,
             selected_products=selected_products,
             user_question=body.message_content.strip(),
             original_search_query=session.original_search_query,
+            conversation_history=history,
+            user_key=str(current_user["user_id"]),
         )
 
         ai_content = comp.get("ai_analysis") or "I analyzed the products based on your question."
@@ -787,6 +1228,7 @@ async def add_chat_message(comparison_id: str, body: ChatMessageCreateRequest, c
             message_type="ai",
             message_content=ai_content,
         )
+        _schedule_memory_refresh(current_user["user_id"], comparison_id)
 
         return {"ok": True, "ai_message": ai_content}
     except HTTPException:
@@ -794,6 +1236,44 @@ async def add_chat_message(comparison_id: str, body: ChatMessageCreateRequest, c
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add message: {str(e)}")
 
+@app.get("/api/compare/sessions/{comparison_id}/overview")
+async def get_comparison_overview(comparison_id: str, wait: bool = True, current_user = Depends(get_current_user), db = Depends(get_db)):
+    """Default overview for a session if cached or being generated speculatively; 404 otherwise."""
+    try:
+        activity = ActivityService(db)
+        session = activity.get_comparison_session(current_user["user_id"], comparison_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Comparison session not found")
+        selected_products = _session_selected_products(db, activity, comparison_id)
+        overview = await speculative_overview.get_or_wait(
+            selected_products, session.original_search_query, timeout=30 if wait else 0.01
+        )
+        if not overview:
+            raise HTTPException(status_code=404, detail="Overview not available")
+        return {"ai_analysis": overview["ai_analysis"], "products_analyzed": overview["products_analyzed"]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch overview: {str(e)}")
+
+def _refresh_conversation_memory(user_id, comparison_id: str) -> None:
+    # Runs on an LLM worker thread, after the response; uses its own DB session
+    db = SessionLocal()
+    try:
+        conversation_memory.refresh_summary(ActivityService(db), comparison_service.grok_service, user_id, comparison_id)
+    except Exception as e:
+        print(f"Warn: conversation summary refresh failed for {comparison_id}: {e}")
+    finally:
+        db.close()
+
+def _schedule_memory_refresh(user_id, comparison_id: str) -> None:
+    """Fold older chat turns into the session summary in the background (best effort)."""
+    try:
+        llm_scheduler.submit(PRIORITY_SUMMARY, _refresh_conversation_memory, user_id, comparison_id)
+    except HTTPException:
+        # Queue is full; the next reply will fold these turns instead
+        pass
+
 # List products for a comparison session (enriched snapshot)
 @app.get("/api/compare/sessions/{comparison_id}/products")
 async def list_comparison_products(comparison_id: str, current_user = Depends(get_current_user), db = Depends(get_db)):
@@ -803,40 +1283,10 @@ async def list_comparison_products(comparison_id: str, current_user = Depends(ge
         if not session:
             raise HTTPException(status_code=404, detail="Comparison session not found")
         items = service.list_comparison_products(comparison_id)
-        # Join with products, latest price and rating to return a rich snapshot for UI
+        # Latest product/price/rating snapshot for all items in one query
         try:
-            from models import Product, ProductPrice, ProductRating
-            snapshots = []
-            for it in items:
-                prod = db.query(Product).filter(Product.product_id == it.product_id).first()
-                # Latest price
-                price_row = (
-                    db.query(ProductPrice)
-                    .filter(ProductPrice.product_id == it.product_id)
-                    .order_by(ProductPrice.price_recorded_at.desc())
-                    .first()
-                )
-                # Latest rating
-                rating_row = (
-                    db.query(ProductRating)
-                    .filter(ProductRating.product_id == it.product_id)
-                    .order_by(ProductRating.rating_recorded_at.desc())
-                    .first()
-                )
-                snapshots.append({
-                    "product_id": it.product_id,
-                    "product_name": getattr(prod, "product_name", None),
-                    "image_url": getattr(prod, "image_url", None),
-                    "product_url": getattr(prod, "product_url", None),
-                    "platform_name": getattr(prod, "platform_name", None),
-                    "price": getattr(price_row, "current_price", None),
-                    "original_price": getattr(price_row, "original_price", None),
-                    "currency_code": getattr(price_row, "currency_code", None),
-                    "currency_symbol": getattr(price_row, "currency_symbol", None),
-                    "in_stock": getattr(price_row, "is_in_stock", None),
-                    "average_rating": getattr(rating_row, "average_rating", None),
-                    "total_reviews": getattr(rating_row, "total_review_count", None),
-                })
+            latest = ProductSnapshotRepository(db).latest_for([it.product_id for it in items])
+            snapshots = [{"product_id": pid, **snap} for pid, snap in latest.items()]
             return {"products": snapshots}
         except Exception:
             # Fallback to IDs only
@@ -897,36 +1347,8 @@ async def enrich_session_products(body: EnrichProductsRequest, current_user = De
         ids = list(dict.fromkeys([pid for pid in (body.product_ids or []) if pid]))
         if not ids:
             return {"products": []}
-        from models import Product, ProductPrice, ProductRating
-        out = []
-        for pid in ids:
-            prod = db.query(Product).filter(Product.product_id == pid).first()
-            price_row = (
-                db.query(ProductPrice)
-                .filter(ProductPrice.product_id == pid)
-                .order_by(ProductPrice.price_recorded_at.desc())
-                .first()
-            )
-            rating_row = (
-                db.query(ProductRating)
-                .filter(ProductRating.product_id == pid)
-                .order_by(ProductRating.rating_recorded_at.desc())
-                .first()
-            )
-            out.append({
-                "product_id": pid,
-                "product_name": getattr(prod, "product_name", None) if prod else None,
-                "image_url": getattr(prod, "image_url", None) if prod else None,
-                "product_url": getattr(prod, "product_url", None) if prod else None,
-                "platform_name": getattr(prod, "platform_name", None) if prod else None,
-                "price": getattr(price_row, "current_price", None),
-                "original_price": getattr(price_row, "original_price", None),
-                "currency_code": getattr(price_row, "currency_code", None),
-                "currency_symbol": getattr(price_row, "currency_symbol", None),
-                "in_stock": getattr(price_row, "is_in_stock", None),
-                "average_rating": getattr(rating_row, "average_rating", None),
-                "total_reviews": getattr(rating_row, "total_review_count", None),
-            })
+        latest = ProductSnapshotRepository(db).latest_for(ids)
+        out = [{"product_id": pid, **snap} for pid, snap in latest.items()]
         return {"products": out}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to enrich products: {str(e)}")
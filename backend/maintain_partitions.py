@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Partition maintenance for Query and Buy
+
+Creates the upcoming monthly partitions of user_events, product_prices and
+chat_messages and drops the ones past their retention
+(PARTITION_RETENTION_MONTHS_<TABLE>). The API also runs this on startup;
+schedule this script (e.g. daily) so long-running deployments stay ahead.
+
+Usage: python maintain_partitions.py
+"""
+
+from dotenv import load_dotenv
+
+
+def main():
+    load_dotenv()
+    from database import engine
+    from services.partitions import PartitionManager
+
+    report = PartitionManager().run(engine)
+    if not report:
+        print("No partitioned tables found (has the partitioning migration run?)")
+    for table, changes in report.items():
+        print(f"{table}: created {changes['created'] or 'none'}, dropped {changes['dropped'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Boolean, Text, Integer, ForeignKey, JSON, Numeric
+from sqlalchemy import Column, String, DateTime, Date, Boolean, Text, Integer, BigInteger, ForeignKey, JSON, Numeric, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -84,6 +84,23 @@ class SearchHistory(Base):
     # Relationships
     user = relationship("User", back_populates="search_history")
 
+class SearchHistoryLatest(Base):
+    """Latest search per (user, normalized query), upserted by ActivityService.log_search.
+
+    Backs the deduplicated history page; search_history stays the append-only log.
+    """
+    __tablename__ = "search_history_latest"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id"), primary_key=True)
+    query_key = Column(String(512), primary_key=True)
+    # search_history row of the latest search (id used by the history page actions)
+    search_id = Column(UUID(as_uuid=True), nullable=False, unique=True)
+    search_query = Column(String(500), nullable=False)
+    platform = Column(String(50), nullable=False)
+    results_count = Column(Integer, default=0)
+    custom_label = Column(String(200), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 # Minimal Products model to satisfy FK for user_favorites insert when favoriting
 class Product(Base):
     __tablename__ = "products"
@@ -112,6 +129,8 @@ class ProductPrice(Base):
     shipping_cost = Column(Numeric(10, 2), nullable=True)
     shipping_info = Column(Text, nullable=True)
     price_recorded_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Last time the same values were seen again (NULL: only at price_recorded_at)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
 
 class ProductRating(Base):
     __tablename__ = "product_ratings"
@@ -121,6 +140,24 @@ class ProductRating(Base):
     average_rating = Column(Numeric(3, 2), nullable=True)
     total_review_count = Column(Integer, nullable=True)
     rating_recorded_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+
+class ProductCurrentState(Base):
+    """Latest price/stock/rating per product, maintained alongside the append-only
+    product_prices / product_ratings histories (see ProductSnapshotRepository)."""
+    __tablename__ = "product_current_state"
+
+    product_id = Column(String(255), primary_key=True)
+    current_price = Column(Numeric(10, 2), nullable=True)
+    original_price = Column(Numeric(10, 2), nullable=True)
+    currency_code = Column(String(3), nullable=True)
+    currency_symbol = Column(String(5), nullable=True)
+    is_in_stock = Column(Boolean, nullable=True)
+    price_recorded_at = Column(DateTime(timezone=True), nullable=True)
+    average_rating = Column(Numeric(3, 2), nullable=True)
+    total_review_count = Column(Integer, nullable=True)
+    rating_recorded_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
@@ -147,6 +184,13 @@ class ComparisonSession(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Conversation memory: running summary of chat turns up to summary_through
+    conversation_summary = Column(Text, nullable=True)
+    summary_through = Column(DateTime(timezone=True), nullable=True)
+    # Maintained counters (ActivityService.add_chat_message / soft delete) so listing
+    # never aggregates chat_messages
+    message_count = Column(Integer, nullable=False, default=0, server_default='0')
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
 
 class ComparisonProduct(Base):
     __tablename__ = "comparison_products"
@@ -182,3 +226,66 @@ class EmailVerificationToken(Base):
     send_count = Column(Integer, default=1)
     # purpose: 'verify' (email verification) | 'password_reset' (password reset)
     purpose = Column(String(30), nullable=False, server_default='verify', index=True)
+
+# -------- Analytics rollups (maintained by services/analytics_rollups.py) --------
+class SearchAnalytics(Base):
+    """All-time aggregates per (normalized query, platform), rolled up from search_history."""
+    __tablename__ = "search_analytics"
+    __table_args__ = (
+        Index("ux_search_analytics_query_platform", "query_key", "platform_name", unique=True),
+        Index("idx_search_analytics_total", "total_searches"),
+    )
+
+    search_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    query_key = Column(String(512), nullable=True)
+    search_query = Column(Text, nullable=False)  # most recent spelling of the query
+    platform_name = Column(String(50), nullable=True)
+    total_searches = Column(Integer, default=1)
+    distinct_users = Column(Integer, nullable=False, server_default='0')
+    total_results_count = Column(BigInteger, nullable=False, server_default='0')
+    average_results_count = Column(Integer, nullable=True)
+    first_searched_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_searched_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SearchAnalyticsDaily(Base):
+    """Per-day search counts per (normalized query, platform); backs trending queries."""
+    __tablename__ = "search_analytics_daily"
+    __table_args__ = (Index("idx_search_analytics_daily_date", "bucket_date"),)
+
+    query_key = Column(String(512), primary_key=True)
+    platform_name = Column(String(50), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    searches = Column(Integer, nullable=False, server_default='0')
+    results_total = Column(BigInteger, nullable=False, server_default='0')
+
+class SearchAnalyticsUser(Base):
+    """Users seen per (normalized query, platform); keeps search_analytics.distinct_users exact."""
+    __tablename__ = "search_analytics_users"
+
+    query_key = Column(String(512), primary_key=True)
+    platform_name = Column(String(50), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+
+class RollupWatermark(Base):
+    """High-water mark (timestamp, id) of the last source row consumed by a rollup job."""
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String(100), primary_key=True)
+    watermark_at = Column(DateTime(timezone=True), nullable=True)
+    watermark_id = Column(String(64), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UserAnalytics(Base):
+    """Per-user, per-day (UTC) activity counters, recomputed by the user_analytics rollup."""
+    __tablename__ = "user_analytics"
+    __table_args__ = (Index("ux_user_analytics_user_date", "user_id", "analytics_date", unique=True),)
+
+    analytics_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    analytics_date = Column(Date, nullable=False)
+    total_searches = Column(Integer, default=0)
+    total_product_views = Column(Integer, default=0)
+    total_comparisons = Column(Integer, default=0)
+    total_chat_messages = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=True)
@@ -107,7 +107,10 @@ class SearchHistoryItem(BaseModel):
 
 class SearchHistoryListResponse(BaseModel):
     items: List[SearchHistoryItem]
-    total: int
+    # None unless requested (cursor pages skip the count by default)
+    total: Optional[int] = None
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 class SearchHistoryUpdateRequest(BaseModel):
     custom_label: Optional[str] = None
@@ -133,7 +136,10 @@ class FavoriteItem(BaseModel):
 
 class FavoriteListResponse(BaseModel):
     items: List[FavoriteItem]
-    total: int
+    # None unless requested (cursor pages skip the count by default)
+    total: Optional[int] = None
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 # -------- User Events (product interactions) --------
 class EventRequest(BaseModel):
@@ -154,7 +160,10 @@ class EventItem(BaseModel):
 
 class EventListResponse(BaseModel):
     items: List[EventItem]
-    total: int
+    # None unless requested (cursor pages skip the count by default)
+    total: Optional[int] = None
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 # -------- Comparison sessions & chat --------
 class ProductSnapshot(BaseModel):
@@ -176,6 +185,8 @@ class ComparisonSessionCreateRequest(BaseModel):
     original_search_query: Optional[str] = None
     session_name: Optional[str] = None
     products: Optional[List[ProductSnapshot]] = None
+    # None -> server default (SPECULATIVE_OVERVIEW_ENABLED); False opts out of overview prefetch
+    prefetch_overview: Optional[bool] = None
 
 class ProductPreview(BaseModel):
     product_id: str
@@ -187,6 +198,8 @@ class ComparisonSessionItem(BaseModel):
     original_search_query: Optional[str]
     created_at: datetime
     updated_at: datetime
+    message_count: Optional[int] = None
+    last_message_at: Optional[datetime] = None
     products_preview: Optional[List[ProductPreview]] = None
 
     class Config:
@@ -194,7 +207,10 @@ class ComparisonSessionItem(BaseModel):
 
 class ComparisonSessionListResponse(BaseModel):
     items: List[ComparisonSessionItem]
-    total: int
+    # None unless requested (cursor pages skip the count by default)
+    total: Optional[int] = None
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 class ChatMessageItem(BaseModel):
     message_id: uuid.UUID
@@ -207,7 +223,10 @@ class ChatMessageItem(BaseModel):
 
 class ChatMessageListResponse(BaseModel):
     items: List[ChatMessageItem]
-    total: int
+    # None unless requested (cursor pages skip the count by default)
+    total: Optional[int] = None
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 class SessionProductsPatchRequest(BaseModel):
     action: str  # 'add' | 'remove'
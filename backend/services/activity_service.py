@@ -11,9 +11,16 @@ WHY: Centralize activity write/read paths to keep endpoints thin and ensure
 consistency with the database schema defined in database_schema_postgresql.sql.
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import and_, case, delete, func, literal_column, or_, select, text, true, update
+from sqlalchemy.dialects.postgresql import insert
 from typing import List, Optional, Tuple
-from models import UserEvent, SearchHistory, UserFavorite, ComparisonSession, ComparisonProduct, ChatMessage, Product, ProductPrice, ProductRating
+from models import UserEvent, SearchHistory, SearchHistoryLatest, UserFavorite, ComparisonSession, ComparisonProduct, ChatMessage, Product
+from .product_snapshots import ProductSnapshotRepository
+from .count_service import counts
+from .pagination import keyset_condition, keyset_order, next_cursor, paginate
+import csv
+import io
+import json
 import uuid
 
 
@@ -28,6 +35,9 @@ class ActivityService:
         self.db = db
 
     # -------- SEARCH HISTORY (primary: search_history; mirror: user_events) --------
+    # search_history is the append-only log; search_history_latest holds one row
+    # per (user, normalized query) with the label carried in-row and backs the
+    # deduplicated history page.
     def log_search(
         self,
         user_id: Optional[uuid.UUID],
@@ -39,39 +49,32 @@ class ActivityService:
 
         WHY: We store canonical search history in search_history to enable
         fast retrieval/pagination. We also mirror the event to user_events for
-        analytics use-cases.
+        analytics use-cases. The history page entry is a single upsert into
+        search_history_latest, which keeps any custom label for the query.
         """
         if user_id is None:
             return None
 
         # query_key: normalized key to group identical queries across renames
         normalized = ' '.join(search_query.lower().split())[:512]
-        # Carry forward the latest custom label for this normalized key, if any
-        try:
-            existing_label_row = (
-                self.db.query(SearchHistory.custom_label)
-                .filter(
-                    SearchHistory.user_id == user_id,
-                    SearchHistory.deleted_at == None,
-                    or_(SearchHistory.query_key == normalized, func.lower(SearchHistory.search_query) == normalized),
-                    SearchHistory.custom_label != None,
-                )
-                .order_by(SearchHistory.created_at.desc())
-                .first()
-            )
-            carry_label = existing_label_row[0] if existing_label_row else None
-        except Exception:
-            carry_label = None
-
         record = SearchHistory(
+            search_id=uuid.uuid4(),
             user_id=user_id,
             search_query=search_query.strip(),
             query_key=normalized,
             platform=platform,
             results_count=results_count,
-            custom_label=carry_label,
         )
         self.db.add(record)
+        self._upsert_latest_searches([{
+            "user_id": user_id,
+            "query_key": normalized,
+            "search_id": record.search_id,
+            "search_query": search_query.strip(),
+            "platform": platform,
+            "results_count": results_count,
+            "created_at": func.now(),
+        }])
         # Mirror to user_events (non-blocking best-effort)
         try:
             event = UserEvent(
@@ -87,43 +90,114 @@ class ActivityService:
         except Exception:
             pass
         self.db.commit()
-        self.db.refresh(record)
+        counts.invalidate(user_id, "searches", "events")
         return record
 
+    @staticmethod
+    def search_row(user_id: uuid.UUID, search_query: str, platform: str, results_count: int, created_at) -> dict:
+        """Column values of one search_history row (shared by the sync and buffered paths)."""
+        return {
+            "search_id": uuid.uuid4(),
+            "user_id": user_id,
+            "search_query": search_query.strip(),
+            # query_key: normalized key to group identical queries across renames
+            "query_key": ' '.join(search_query.lower().split())[:512],
+            "platform": platform,
+            "results_count": results_count,
+            "created_at": created_at,
+        }
+
+    def bulk_log_searches(self, rows: List[dict]) -> None:
+        """Write buffered searches (see search_row) with multi-row statements and commit.
+
+        One INSERT for search_history, one upsert for search_history_latest and
+        one INSERT for the user_events mirror, regardless of batch size.
+        """
+        if not rows:
+            return
+        self.db.execute(insert(SearchHistory), rows)
+        # One row per (user, query) per statement: ON CONFLICT can't touch a row twice
+        latest = {}
+        for row in sorted(rows, key=lambda r: r["created_at"]):
+            latest[(row["user_id"], row["query_key"])] = row
+        self._upsert_latest_searches(list(latest.values()))
+        self._insert_events([
+            {
+                "event_id": uuid.uuid4(),
+                "user_id": row["user_id"],
+                "event_type": "search",
+                "event_data": {
+                    "search_query": row["search_query"],
+                    "platform": row["platform"],
+                    "results_count": row["results_count"],
+                },
+                "event_timestamp": row["created_at"],
+            }
+            for row in rows
+        ])
+        self.db.commit()
+        for user_id in {row["user_id"] for row in rows}:
+            counts.invalidate(user_id, "searches", "events")
+
+    def _upsert_latest_searches(self, rows: List[dict]) -> None:
+        latest = insert(SearchHistoryLatest).values(rows)
+        self.db.execute(
+            latest.on_conflict_do_update(
+                index_elements=[SearchHistoryLatest.user_id, SearchHistoryLatest.query_key],
+                # custom_label is deliberately not overwritten
+                set_={
+                    "search_id": latest.excluded.search_id,
+                    "search_query": latest.excluded.search_query,
+                    "platform": latest.excluded.platform,
+                    "results_count": latest.excluded.results_count,
+                    "created_at": latest.excluded.created_at,
+                },
+                # Buffered writes may land after a newer synchronous one
+                where=SearchHistoryLatest.created_at <= latest.excluded.created_at,
+            )
+        )
+
     def list_search_history(
         self,
         user_id: uuid.UUID,
         limit: int = 20,
         offset: int = 0,
-    ) -> Tuple[List[SearchHistory], int]:
-        """Return paginated search history for a user (newest first)."""
-        limit = max(1, min(limit, 100))
-        offset = max(0, offset)
-
-        # Return unique latest entries by normalized key
-        key_expr = func.coalesce(SearchHistory.query_key, func.lower(SearchHistory.search_query))
-        subq = (
-            self.db.query(
-                key_expr.label('qk'),
-                func.max(SearchHistory.created_at).label('max_created')
-            )
-            .filter(SearchHistory.user_id == user_id, SearchHistory.deleted_at == None)
-            .group_by(key_expr)
-            .subquery()
-        )
+        cursor: Optional[str] = None,
+        total_mode: str = "exact",
+    ) -> Tuple[List[SearchHistoryLatest], Optional[int], Optional[str]]:
+        """Return paginated search history for a user (newest first, one entry per query).
 
-        q = (
-            self.db.query(SearchHistory)
-            .join(subq, (key_expr == subq.c.qk) & (SearchHistory.created_at == subq.c.max_created))
-            .filter(SearchHistory.user_id == user_id)
-            .order_by(SearchHistory.created_at.desc())
+        Returns (items, total or None, next_cursor); see services/pagination.py.
+        `total_mode` is exact|approx|none (services/count_service.py).
+        """
+        # Index range scan on (user_id, created_at DESC, search_id DESC)
+        q = self.db.query(SearchHistoryLatest).filter(SearchHistoryLatest.user_id == user_id)
+        total = counts.total(self.db, q, user_id, "searches", total_mode)
+        items, _, cursor_next = paginate(
+            q, SearchHistoryLatest.created_at, SearchHistoryLatest.search_id,
+            limit=max(1, min(limit, 100)), offset=offset, cursor=cursor, with_total=False,
         )
-        total = q.count()
-        items = q.limit(limit).offset(offset).all()
-        return items, total
+        return items, total, cursor_next
 
     def delete_search(self, user_id: uuid.UUID, search_id: uuid.UUID) -> bool:
-        """Delete a specific search_history row by id for a user."""
+        """Remove a search from the history page (soft-deletes its logged rows)."""
+        latest = (
+            self.db.query(SearchHistoryLatest)
+            .filter(SearchHistoryLatest.search_id == search_id, SearchHistoryLatest.user_id == user_id)
+            .first()
+        )
+        if latest:
+            # The page shows one entry per query: hide every logged search of it
+            self.db.query(SearchHistory).filter(
+                SearchHistory.user_id == user_id,
+                SearchHistory.deleted_at == None,
+                or_(SearchHistory.query_key == latest.query_key, func.lower(SearchHistory.search_query) == latest.query_key),
+            ).update({SearchHistory.deleted_at: func.now()}, synchronize_session=False)
+            self.db.delete(latest)
+            self.db.commit()
+            counts.invalidate(user_id, "searches")
+            return True
+
         record = (
             self.db.query(SearchHistory)
             .filter(
@@ -136,35 +210,55 @@ class ActivityService:
             return False
         record.deleted_at = func.now()
         self.db.commit()
+        counts.invalidate(user_id, "searches")
         return True
 
-    def update_search_label(self, user_id: uuid.UUID, search_id: uuid.UUID, custom_label: Optional[str]) -> Optional[SearchHistory]:
+    def update_search_label(self, user_id: uuid.UUID, search_id: uuid.UUID, custom_label: Optional[str]) -> Optional[SearchHistoryLatest]:
         """Update the custom label for a search history item (soft rename)."""
         record = (
-            self.db.query(SearchHistory)
+            self.db.query(SearchHistoryLatest)
             .filter(
-                SearchHistory.search_id == search_id,
-                SearchHistory.user_id == user_id,
-                SearchHistory.deleted_at == None,
+                SearchHistoryLatest.search_id == search_id,
+                SearchHistoryLatest.user_id == user_id,
             )
             .first()
         )
         if not record:
             return None
         record.custom_label = (custom_label or None)
+        # Keep the logged row in step
+        self.db.query(SearchHistory).filter(
+            SearchHistory.search_id == search_id, SearchHistory.user_id == user_id
+        ).update({SearchHistory.custom_label: record.custom_label}, synchronize_session=False)
         self.db.commit()
         self.db.refresh(record)
         return record
 
     def clear_search_history(self, user_id: uuid.UUID) -> int:
         """Delete all search history rows for a user. Returns count deleted."""
-        # Soft delete: mark all user's rows as deleted
-        updated = (
-            self.db.query(SearchHistory)
-            .filter(SearchHistory.user_id == user_id, SearchHistory.deleted_at == None)
-            .update({SearchHistory.deleted_at: func.now()}, synchronize_session=False)
+        # Soft delete: mark all user's rows as deleted, and drop the history page rows,
+        # in one statement (data-modifying CTEs) whatever the history size
+        history = (
+            update(SearchHistory)
+            .where(SearchHistory.user_id == user_id, SearchHistory.deleted_at.is_(None))
+            .values(deleted_at=func.now())
+            .returning(SearchHistory.search_id)
+            .cte("cleared_history")
+        )
+        latest = (
+            delete(SearchHistoryLatest)
+            .where(SearchHistoryLatest.user_id == user_id)
+            .returning(SearchHistoryLatest.search_id)
+            .cte("cleared_latest")
         )
+        updated, _ = self.db.execute(
+            select(
+                select(func.count()).select_from(history).scalar_subquery(),
+                select(func.count()).select_from(latest).scalar_subquery(),
+            )
+        ).one()
         self.db.commit()
+        counts.invalidate(user_id, "searches")
         return updated
 
     # -------- FAVORITES (user_favorites) --------
@@ -188,54 +282,106 @@ class ActivityService:
         WHY: Avoid FK failures and keep session product snapshots fresh for FE without extra calls.
         """
         try:
-            prod = self.db.query(Product).filter(Product.product_id == product_id).first()
-            if not prod:
-                prod = Product(
-                    product_id=product_id,
-                    platform_name=platform_name or 'unknown',
-                    product_name=product_name or product_id,
-                    product_url=product_url,
-                    image_url=image_url,
-                )
-                self.db.add(prod)
-            else:
-                # Light upsert of key snapshot fields
-                if platform_name and not prod.platform_name:
-                    prod.platform_name = platform_name
-                if product_name and (not prod.product_name or prod.product_name == product_id):
-                    prod.product_name = product_name
-                if product_url and not prod.product_url:
-                    prod.product_url = product_url
-                if image_url and not prod.image_url:
-                    prod.image_url = image_url
-
-            # Append latest price snapshot if provided
-            if price is not None or original_price is not None or is_in_stock is not None:
-                self.db.add(
-                    ProductPrice(
-                        product_id=product_id,
-                        current_price=float(price) if price is not None else None,
-                        original_price=float(original_price) if original_price is not None else None,
-                        currency_code=currency_code,
-                        currency_symbol=currency_symbol,
-                        is_in_stock=True if is_in_stock is None else bool(is_in_stock),
-                    )
-                )
-
-            # Append latest rating snapshot if provided
-            if average_rating is not None or total_review_count is not None:
-                self.db.add(
-                    ProductRating(
-                        product_id=product_id,
-                        average_rating=float(average_rating) if average_rating is not None else None,
-                        total_review_count=total_review_count,
-                    )
-                )
+            self.ensure_products_exist([{
+                "product_id": product_id,
+                "platform_name": platform_name,
+                "product_name": product_name,
+                "product_url": product_url,
+                "image_url": image_url,
+                "price": price,
+                "original_price": original_price,
+                "currency_code": currency_code,
+                "currency_symbol": currency_symbol,
+                "is_in_stock": is_in_stock,
+                "average_rating": average_rating,
+                "total_review_count": total_review_count,
+            }])
             self.db.commit()
         except Exception:
             # Non-fatal: if it fails, add_favorite may still succeed if no FK, else return 500 handled upstream
             self.db.rollback()
             return
+
+    def ensure_products_exist(self, products: List[dict]) -> None:
+        """Bulk ensure_product_exists (caller commits); each dict takes the same keys as its arguments.
+
+        WHY: Multi-product writes (session creation) used to SELECT, add and
+        commit per product. This is a fixed number of statements instead: one
+        products upsert, then one multi-row insert each for the price and
+        rating histories (plus their product_current_state upserts).
+        """
+        # Merge duplicates: later non-null values win
+        by_id = {}
+        for p in products:
+            if p.get("product_id"):
+                by_id.setdefault(p["product_id"], {}).update({k: v for k, v in p.items() if v is not None})
+        if not by_id:
+            return
+
+        stmt = insert(Product).values([
+            {
+                "product_id": pid,
+                "platform_name": p.get("platform_name") or 'unknown',
+                "product_name": p.get("product_name") or pid,
+                "product_url": p.get("product_url"),
+                "image_url": p.get("image_url"),
+            }
+            for pid, p in by_id.items()
+        ])
+        new = stmt.excluded
+        # Light upsert of key snapshot fields: only fill what is missing (a
+        # placeholder name equal to the id counts as missing)
+        name_missing = or_(Product.product_name.is_(None), Product.product_name == Product.product_id)
+        self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Product.product_id],
+                set_={
+                    "platform_name": func.coalesce(func.nullif(Product.platform_name, ''), new.platform_name),
+                    "product_name": case((name_missing, new.product_name), else_=Product.product_name),
+                    "product_url": func.coalesce(Product.product_url, new.product_url),
+                    "image_url": func.coalesce(Product.image_url, new.image_url),
+                },
+                # Skip the write (and the dead tuple) when nothing would change
+                where=or_(
+                    func.coalesce(Product.platform_name, '') == '',
+                    and_(name_missing, new.product_name != Product.product_id),
+                    and_(Product.product_url.is_(None), new.product_url.isnot(None)),
+                    and_(Product.image_url.is_(None), new.image_url.isnot(None)),
+                ),
+            )
+        )
+
+        # Append latest price/rating snapshots if provided; product_current_state
+        # is updated in the same transaction
+        def num(value):
+            return float(value) if value is not None else None
+
+        prices = [
+            {
+                "product_id": pid,
+                "current_price": num(p.get("price")),
+                "original_price": num(p.get("original_price")),
+                "currency_code": p.get("currency_code"),
+                "currency_symbol": p.get("currency_symbol"),
+                "is_in_stock": True if p.get("is_in_stock") is None else bool(p.get("is_in_stock")),
+            }
+            for pid, p in by_id.items()
+            # current_price is NOT NULL: one row without it would fail the whole batch insert
+            if p.get("price") is not None
+        ]
+        ratings = [
+            {
+                "product_id": pid,
+                "average_rating": num(p.get("average_rating")),
+                "total_review_count": p.get("total_review_count"),
+            }
+            for pid, p in by_id.items()
+            if p.get("average_rating") is not None or p.get("total_review_count") is not None
+        ]
+        snapshots = ProductSnapshotRepository(self.db)
+        snapshots.record_prices(prices)
+        snapshots.record_ratings(ratings)
+
     def add_favorite(self, user_id: uuid.UUID, product_id: str, user_notes: Optional[str] = None) -> UserFavorite:
         """Add a product to user_favorites (idempotent; updates notes if exists)."""
         # Ensure unique constraint by checking existing
@@ -255,6 +401,7 @@ class ActivityService:
         fav = UserFavorite(user_id=user_id, product_id=product_id, user_notes=user_notes)
         self.db.add(fav)
         self.db.commit()
+        counts.invalidate(user_id, "favorites")
         self.db.refresh(fav)
         return fav
 
@@ -269,20 +416,25 @@ class ActivityService:
             return False
         self.db.delete(fav)
         self.db.commit()
+        counts.invalidate(user_id, "favorites")
         return True
 
-    def list_favorites(self, user_id: uuid.UUID, limit: int = 20, offset: int = 0) -> Tuple[List[UserFavorite], int]:
+    def list_favorites(
+        self,
+        user_id: uuid.UUID,
+        limit: int = 20,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        total_mode: str = "exact",
+    ) -> Tuple[List[UserFavorite], Optional[int], Optional[str]]:
         """Paginated favorites list (newest first)."""
-        limit = max(1, min(limit, 100))
-        offset = max(0, offset)
-        q = (
-            self.db.query(UserFavorite)
-            .filter(UserFavorite.user_id == user_id)
-            .order_by(UserFavorite.created_at.desc())
+        q = self.db.query(UserFavorite).filter(UserFavorite.user_id == user_id)
+        total = counts.total(self.db, q, user_id, "favorites", total_mode)
+        items, _, cursor_next = paginate(
+            q, UserFavorite.created_at, UserFavorite.favorite_id,
+            limit=max(1, min(limit, 100)), offset=offset, cursor=cursor, with_total=False,
         )
-        total = q.count()
-        items = q.limit(limit).offset(offset).all()
-        return items, total
+        return items, total, cursor_next
 
     def is_favorite(self, user_id: uuid.UUID, product_id: str) -> bool:
         """Check if product is currently favorited by user."""
@@ -296,6 +448,7 @@ class ActivityService:
     # -------- GENERIC USER EVENTS --------
     def log_event(self, user_id: uuid.UUID, event_type: str, event_data: dict) -> UserEvent:
         """Insert a user_event row for analytics/behavior tracking."""
+        self._pin_utc()
         event = UserEvent(
             user_id=user_id,
             event_type=event_type,
@@ -303,18 +456,75 @@ class ActivityService:
         )
         self.db.add(event)
         self.db.commit()
+        counts.invalidate(user_id, "events")
         self.db.refresh(event)
         return event
 
-    def list_events(self, user_id: uuid.UUID, event_type: Optional[str] = None, limit: int = 20, offset: int = 0):
+    def bulk_log_events(self, rows: List[dict]) -> None:
+        """Insert buffered user_events rows (event_id, user_id, event_type, event_data, event_timestamp) and commit."""
+        if not rows:
+            return
+        self._insert_events(rows)
+        self.db.commit()
+        for user_id in {row["user_id"] for row in rows}:
+            counts.invalidate(user_id, "events")
+
+    def _pin_utc(self) -> None:
+        # event_timestamp is timestamp without time zone holding UTC; the aware
+        # timestamps of buffered rows and the CURRENT_TIMESTAMP default are
+        # converted to it through the session TimeZone, so pin that to UTC
+        self.db.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+
+    def _insert_events(self, rows: List[dict]) -> None:
+        """Write user_events rows in the session's transaction: COPY on psycopg2, multi-row INSERT otherwise.
+
+        WHY: COPY streams the whole batch in one round trip without per-row
+        statement/parameter overhead, several times faster than INSERT for
+        the large batches the event ingestion endpoint produces.
+        """
+        self._pin_utc()
+        if self.db.get_bind().dialect.driver != "psycopg2":
+            self.db.execute(insert(UserEvent), rows)
+            return
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow([
+                row["event_id"],
+                row["user_id"],
+                row["event_type"],
+                json.dumps(row.get("event_data") or {}, default=str),
+                row["event_timestamp"].isoformat(),
+            ])
+        buf.seek(0)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                "COPY user_events (event_id, user_id, event_type, event_data, event_timestamp) FROM STDIN WITH (FORMAT csv)",
+                buf,
+            )
+        finally:
+            cursor.close()
+
+    def list_events(
+        self,
+        user_id: uuid.UUID,
+        event_type: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        total_mode: str = "exact",
+    ):
         """Paginated user_events list (optionally filter by event_type)."""
         q = self.db.query(UserEvent).filter(UserEvent.user_id == user_id)
         if event_type:
             q = q.filter(UserEvent.event_type == event_type)
-        q = q.order_by(UserEvent.event_timestamp.desc())
-        total = q.count()
-        items = q.limit(max(1, min(limit, 100))).offset(max(0, offset)).all()
-        return items, total
+        total = counts.total(self.db, q, user_id, "events", total_mode, scope=event_type)
+        items, _, cursor_next = paginate(
+            q, UserEvent.event_timestamp, UserEvent.event_id,
+            limit=max(1, min(limit, 100)), offset=offset, cursor=cursor, with_total=False,
+        )
+        return items, total, cursor_next
 
     # -------- COMPARISON SESSIONS & CHAT --------
     def create_comparison_session(
@@ -323,9 +533,13 @@ class ActivityService:
         product_ids: list[str],
         original_search_query: str | None = None,
         session_name: str | None = None,
+        products: list[dict] | None = None,
     ) -> ComparisonSession:
         """Create a comparison session and attach product ids.
 
+        `products` are optional snapshots (ensure_products_exist dicts) for
+        some or all of the ids, recorded in the same transaction.
+
         WHY: Enables resuming a chat later with the same set of products.
         """
         session = ComparisonSession(
@@ -336,13 +550,15 @@ class ActivityService:
         self.db.add(session)
         self.db.flush()
         # Ensure products rows exist to satisfy FK constraint (products -> comparison_products)
-        for pid in product_ids:
-            try:
-                self.ensure_product_exists(product_id=pid)
-            except Exception:
-                # Non-fatal: continue; insert may still succeed if FK not enforced
-                pass
-            self.db.add(ComparisonProduct(comparison_id=session.comparison_id, product_id=pid))
+        snapshots = {p["product_id"]: p for p in (products or []) if p.get("product_id")}
+        rows = [snapshots.pop(pid, {"product_id": pid}) for pid in dict.fromkeys(product_ids)]
+        try:
+            with self.db.begin_nested():
+                self.ensure_products_exist(rows + list(snapshots.values()))
+        except Exception as e:
+            # Non-fatal: continue; insert may still succeed if FK not enforced
+            print(f"Warn: ensure_products_exist failed - {e}")
+        self.db.add_all([ComparisonProduct(comparison_id=session.comparison_id, product_id=pid) for pid in product_ids])
         try:
             self.db.commit()
         except Exception:
@@ -351,34 +567,138 @@ class ActivityService:
         self.db.refresh(session)
         return session
 
-    def list_comparison_sessions(self, user_id: uuid.UUID, limit: int = 20, offset: int = 0, min_messages: int = 0):
+    def _sessions_query(self, user_id: uuid.UUID, min_messages: int = 0):
+        q = (
+            self.db
+            .query(ComparisonSession)
+            .filter(ComparisonSession.user_id == user_id, ComparisonSession.deleted_at == None)
+        )
+        if min_messages and min_messages > 0:
+            # Maintained counter; see add_chat_message
+            q = q.filter(ComparisonSession.message_count >= min_messages)
+        return q
+
+    def list_comparison_sessions(
+        self,
+        user_id: uuid.UUID,
+        limit: int = 20,
+        offset: int = 0,
+        min_messages: int = 0,
+        cursor: Optional[str] = None,
+        total_mode: str = "exact",
+    ):
         """Return user's comparison sessions (newest updated first).
 
         If min_messages > 0, only sessions with at least that many chat messages are returned.
         """
-        # Subquery to count messages per session
-        msg_counts_sq = (
-            self.db
-            .query(ChatMessage.comparison_id.label('cid'), func.count(ChatMessage.message_id).label('msg_count'))
-            .group_by(ChatMessage.comparison_id)
-            .subquery()
+        q = self._sessions_query(user_id, min_messages)
+        total = counts.total(self.db, q, user_id, "sessions", total_mode, scope=min_messages)
+        items, _, cursor_next = paginate(
+            q, ComparisonSession.updated_at, ComparisonSession.comparison_id,
+            limit=max(1, min(limit, 100)), offset=offset, cursor=cursor, with_total=False,
         )
+        return items, total, cursor_next
 
-        q = (
-            self.db
-            .query(ComparisonSession)
-            .outerjoin(msg_counts_sq, msg_counts_sq.c.cid == ComparisonSession.comparison_id)
-            .filter(ComparisonSession.user_id == user_id, ComparisonSession.deleted_at == None)
+    def list_comparison_sessions_with_previews(
+        self,
+        user_id: uuid.UUID,
+        limit: int = 20,
+        offset: int = 0,
+        min_messages: int = 0,
+        preview_limit: int = 3,
+        cursor: Optional[str] = None,
+        total_mode: str = "exact",
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
+        """Sessions page with message counts and up to `preview_limit` product images, in one query.
+
+        WHY: The session list used to issue one products query plus one query per
+        preview image for every session on the page. Message counts are the
+        maintained comparison_sessions.message_count column, previews a LATERAL
+        subquery (index lookup on comparison_id) and the total a window count,
+        so a page costs one round trip regardless of its size. Pages by
+        keyset `cursor` on (updated_at, comparison_id), or offset. The window
+        count is only added for exact totals that are not cached yet.
+        """
+        total_sessions = None
+        if total_mode != "none":
+            total_sessions = counts.peek(user_id, "sessions", min_messages, exact=total_mode == "exact")
+        if total_sessions is None and total_mode != "none" and (cursor or total_mode == "approx"):
+            # The window count would only see rows after the cursor; approx may use an estimate
+            total_sessions = counts.total(self.db, self._sessions_query(user_id, min_messages), user_id, "sessions", total_mode, scope=min_messages)
+        window_total = total_mode == "exact" and total_sessions is None
+        preview_rows = (
+            select(ComparisonProduct.product_id, Product.image_url)
+            .outerjoin(Product, Product.product_id == ComparisonProduct.product_id)
+            .where(ComparisonProduct.comparison_id == ComparisonSession.comparison_id, ComparisonProduct.deleted_at == None)
+            .order_by(ComparisonProduct.added_at)
+            .limit(max(0, preview_limit))
+            .correlate(ComparisonSession)
+            .lateral('preview_rows')
+        )
+        previews = (
+            select(
+                func.coalesce(
+                    func.json_agg(func.json_build_object('product_id', preview_rows.c.product_id, 'image_url', preview_rows.c.image_url)),
+                    literal_column("'[]'::json"),
+                ).label('products_preview')
+            )
+            .select_from(preview_rows)
+            .lateral('previews')
+        )
+        stmt = (
+            select(
+                ComparisonSession.comparison_id,
+                ComparisonSession.session_name,
+                ComparisonSession.original_search_query,
+                ComparisonSession.created_at,
+                ComparisonSession.updated_at,
+                ComparisonSession.message_count,
+                ComparisonSession.last_message_at,
+                previews.c.products_preview,
+                (func.count().over() if window_total else literal_column('NULL')).label('total'),
+            )
+            .select_from(ComparisonSession)
+            .join(previews, true())
+            .where(ComparisonSession.user_id == user_id, ComparisonSession.deleted_at == None)
         )
-
         if min_messages and min_messages > 0:
-            q = q.filter((msg_counts_sq.c.msg_count != None) & (msg_counts_sq.c.msg_count >= min_messages))
-
-        q = q.order_by(ComparisonSession.updated_at.desc())
+            stmt = stmt.where(ComparisonSession.message_count >= min_messages)
+        if cursor:
+            stmt = stmt.where(keyset_condition(ComparisonSession.updated_at, ComparisonSession.comparison_id, cursor))
+            offset = 0
+        limit = max(1, min(limit, 100))
+        stmt = (
+            stmt.order_by(*keyset_order(ComparisonSession.updated_at, ComparisonSession.comparison_id))
+            .limit(limit + 1)
+            .offset(max(0, offset))
+        )
 
-        total = q.count()
-        items = q.limit(max(1, min(limit, 100))).offset(max(0, offset)).all()
-        return items, total
+        rows = self.db.execute(stmt).all()
+        cursor_next = next_cursor(rows, limit, 'updated_at', 'comparison_id')
+        rows = rows[:limit]
+        items = [
+            {
+                "comparison_id": r.comparison_id,
+                "session_name": r.session_name,
+                "original_search_query": r.original_search_query,
+                "created_at": r.created_at,
+                "updated_at": r.updated_at,
+                "message_count": r.message_count,
+                "last_message_at": r.last_message_at,
+                "products_preview": r.products_preview or [],
+            }
+            for r in rows
+        ]
+        if not window_total:
+            return items, total_sessions, cursor_next
+        if rows:
+            counts.store(user_id, "sessions", min_messages, rows[0].total)
+            return items, rows[0].total, cursor_next
+        if offset > 0:
+            # Page past the end: the window count is unavailable, count separately
+            return items, counts.total(self.db, self._sessions_query(user_id, min_messages), user_id, "sessions", scope=min_messages), None
+        counts.store(user_id, "sessions", min_messages, 0)
+        return items, 0, None
 
     def get_comparison_session(self, user_id: uuid.UUID, comparison_id: uuid.UUID) -> ComparisonSession | None:
         """Fetch a specific session if owned by user."""
@@ -434,42 +754,74 @@ class ActivityService:
         return True
 
     def clear_comparison_sessions(self, user_id: uuid.UUID) -> int:
-        """Soft delete all comparison sessions for a user by setting deleted_at; also soft-delete related products and messages. Returns count."""
+        """Soft delete all comparison sessions for a user by setting deleted_at; also soft-delete related products and messages. Returns count.
+
+        WHY: One statement regardless of how many sessions the user has. The
+        session UPDATE ... RETURNING feeds the product and message UPDATEs as
+        data-modifying CTEs, instead of loading every session and issuing two
+        UPDATEs per session.
+        """
+        now_expr = func.now()
         sessions = (
-            self.db.query(ComparisonSession)
-            .filter(ComparisonSession.user_id == user_id, ComparisonSession.deleted_at == None)
-            .all()
+            update(ComparisonSession)
+            .where(ComparisonSession.user_id == user_id, ComparisonSession.deleted_at.is_(None))
+            # Its messages are soft-deleted below
+            .values(deleted_at=now_expr, message_count=0)
+            .returning(ComparisonSession.comparison_id)
+            .cte("cleared_sessions")
         )
-        count = 0
-        now_expr = func.now()
-        for sess in sessions:
-            sess.deleted_at = now_expr
-            count += 1
-            self.db.query(ComparisonProduct).filter(
-                ComparisonProduct.comparison_id == sess.comparison_id,
-                ComparisonProduct.deleted_at == None
-            ).update({ComparisonProduct.deleted_at: now_expr}, synchronize_session=False)
-            self.db.query(ChatMessage).filter(
-                ChatMessage.comparison_id == sess.comparison_id,
-                ChatMessage.deleted_at == None
-            ).update({ChatMessage.deleted_at: now_expr}, synchronize_session=False)
+        products = (
+            update(ComparisonProduct)
+            .where(
+                ComparisonProduct.comparison_id.in_(select(sessions.c.comparison_id)),
+                ComparisonProduct.deleted_at.is_(None),
+            )
+            .values(deleted_at=now_expr)
+            .returning(ComparisonProduct.comparison_id)
+            .cte("cleared_products")
+        )
+        messages = (
+            update(ChatMessage)
+            .where(
+                ChatMessage.comparison_id.in_(select(sessions.c.comparison_id)),
+                ChatMessage.deleted_at.is_(None),
+            )
+            .values(deleted_at=now_expr)
+            .returning(ChatMessage.comparison_id)
+            .cte("cleared_messages")
+        )
+        cleared = self.db.execute(
+            select(
+                select(func.count()).select_from(sessions).scalar_subquery(),
+                select(func.count()).select_from(products).scalar_subquery(),
+                select(func.count()).select_from(messages).scalar_subquery(),
+            )
+        ).one()
         self.db.commit()
-        return count
+        counts.invalidate(user_id, "sessions", "messages")
+        return cleared[0]
 
-    def list_chat_messages(self, user_id: uuid.UUID, comparison_id: uuid.UUID, limit: int = 50, offset: int = 0):
-        """Return chat messages for a session after access check."""
+    def list_chat_messages(
+        self,
+        user_id: uuid.UUID,
+        comparison_id: uuid.UUID,
+        limit: int = 50,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        total_mode: str = "exact",
+    ):
+        """Return chat messages for a session after access check (oldest first)."""
         # Verify access
         session = self.get_comparison_session(user_id, comparison_id)
         if not session:
-            return [], 0
-        q = (
-            self.db.query(ChatMessage)
-            .filter(ChatMessage.comparison_id == comparison_id, ChatMessage.deleted_at == None)
-            .order_by(ChatMessage.created_at.asc())
+            return [], (None if total_mode == "none" else 0), None
+        q = self.db.query(ChatMessage).filter(ChatMessage.comparison_id == comparison_id, ChatMessage.deleted_at == None)
+        total = counts.total(self.db, q, user_id, "messages", total_mode, scope=str(comparison_id))
+        items, _, cursor_next = paginate(
+            q, ChatMessage.created_at, ChatMessage.message_id,
+            limit=max(1, min(limit, 200)), offset=offset, cursor=cursor, descending=False, with_total=False,
         )
-        total = q.count()
-        items = q.limit(max(1, min(limit, 200))).offset(max(0, offset)).all()
-        return items, total
+        return items, total, cursor_next
 
     def add_chat_message(
         self,
@@ -492,8 +844,65 @@ class ActivityService:
             ai_metadata=ai_metadata,
         )
         self.db.add(msg)
+        # Counter update in the same transaction as the insert; the sessions
+        # update trigger keeps updated_at for counter-only changes
+        self.db.query(ComparisonSession).filter(ComparisonSession.comparison_id == comparison_id).update(
+            {
+                ComparisonSession.message_count: ComparisonSession.message_count + 1,
+                ComparisonSession.last_message_at: func.now(),
+            },
+            synchronize_session=False,
+        )
         self.db.commit()
+        # The session may have just reached the list's min_messages
+        counts.invalidate(user_id, "sessions", "messages")
         self.db.refresh(msg)
         return msg
 
 
+
+    # -------- CONVERSATION MEMORY (running summary on comparison_sessions) --------
+    def get_conversation_window(
+        self,
+        user_id: uuid.UUID,
+        comparison_id: uuid.UUID,
+        recent_messages: int,
+        exclude_message_id: uuid.UUID | None = None,
+    ) -> tuple[str | None, list[ChatMessage]]:
+        """Return (running summary, newest messages after the summary watermark, oldest first)."""
+        session = self.get_comparison_session(user_id, comparison_id)
+        if not session:
+            return None, []
+        q = self.db.query(ChatMessage).filter(ChatMessage.comparison_id == comparison_id, ChatMessage.deleted_at == None)
+        if session.summary_through is not None:
+            q = q.filter(ChatMessage.created_at > session.summary_through)
+        if exclude_message_id is not None:
+            q = q.filter(ChatMessage.message_id != exclude_message_id)
+        rows = q.order_by(ChatMessage.created_at.desc()).limit(max(0, recent_messages)).all()
+        return session.conversation_summary, list(reversed(rows))
+
+    def list_unsummarized_messages(self, user_id: uuid.UUID, comparison_id: uuid.UUID) -> tuple[ComparisonSession | None, list[ChatMessage]]:
+        """Session plus all messages newer than its summary watermark (oldest first)."""
+        session = self.get_comparison_session(user_id, comparison_id)
+        if not session:
+            return None, []
+        q = self.db.query(ChatMessage).filter(ChatMessage.comparison_id == comparison_id, ChatMessage.deleted_at == None)
+        if session.summary_through is not None:
+            q = q.filter(ChatMessage.created_at > session.summary_through)
+        return session, q.order_by(ChatMessage.created_at.asc()).all()
+
+    def update_conversation_summary(self, comparison_id: uuid.UUID, summary: str, through) -> None:
+        """Store a new running summary and advance the watermark.
+
+        WHY: Background summarization is not user activity; the sessions
+        update trigger keeps updated_at (session list ordering and cursors)
+        when only the summary columns change.
+        """
+        self.db.query(ComparisonSession).filter(ComparisonSession.comparison_id == comparison_id).update(
+            {
+                ComparisonSession.conversation_summary: summary,
+                ComparisonSession.summary_through: through,
+            },
+            synchronize_session=False,
+        )
+        self.db.commit()
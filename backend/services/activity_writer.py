@@ -0,0 +1,261 @@
+"""
+Activity write buffer
+---------------------
+Write-behind buffering of search history and user events.
+
+WHY: Every search and tracked event used to cost its own transaction (3
+statements + commit for a search, an INSERT + commit + refresh for an event)
+on the request path, so write volume and commit latency grew with traffic.
+Records are now queued in memory and a background thread writes them in
+batches (multi-row INSERT/upsert, one commit per batch) every
+ACTIVITY_FLUSH_INTERVAL_MS or as soon as ACTIVITY_FLUSH_MAX_BATCH records are
+waiting. Ids and timestamps are assigned at enqueue time so ordering and
+returned ids are unaffected; the cost is that the history/event lists can lag
+a write by up to one flush interval. When the buffer is full (or disabled)
+enqueue returns a falsy value and callers write synchronously as before.
+Events go into a ring buffer instead: a batch upload beyond
+ACTIVITY_EVENT_RING_SIZE overwrites the oldest unflushed events (counted as
+"overwritten") rather than pushing analytics writes back onto the request
+path. A single event returns its event_id to the client, so it is never
+queued where it could be overwritten: on a full ring it is written
+synchronously like a search. Pending records
+are flushed on application shutdown. A batch mixes many users' rows, so when
+it fails on a row-level error (e.g. the FK of a user deleted since enqueue)
+it is retried in halves and only the failing rows are dropped.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from sqlalchemy.exc import DataError, IntegrityError
+
+from .activity_service import ActivityService
+
+# Errors caused by individual rows (COPY raises psycopg2's, not SQLAlchemy's)
+_ROW_ERRORS = (IntegrityError, DataError, psycopg2.IntegrityError, psycopg2.DataError)
+
+
+class ActivityWriteBuffer:
+    """Bounded in-memory queue of activity rows flushed in batches by a daemon thread."""
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        flush_interval_ms: Optional[int] = None,
+        max_batch: Optional[int] = None,
+        max_buffer: Optional[int] = None,
+        ring_size: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval_ms = flush_interval_ms or int(os.getenv("ACTIVITY_FLUSH_INTERVAL_MS", "500"))
+        self.max_batch = max_batch or int(os.getenv("ACTIVITY_FLUSH_MAX_BATCH", "200"))
+        self.max_buffer = max_buffer or int(os.getenv("ACTIVITY_BUFFER_MAX", "10000"))
+        self.ring_size = ring_size or int(os.getenv("ACTIVITY_EVENT_RING_SIZE", "50000"))
+        if enabled is None:
+            enabled = os.getenv("ACTIVITY_BUFFER_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self._cv = threading.Condition()
+        self._searches: deque = deque()
+        self._events: deque = deque(maxlen=self.ring_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # Serializes flushes between the background thread and flush()/stop()
+        self._flush_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "rejected": 0, "flushed": 0, "batches": 0, "errors": 0, "dropped": 0, "overwritten": 0, "split_retries": 0}
+        self._last_error: Optional[str] = None
+
+    # -------- enqueue --------
+    def enqueue_search(self, user_id, search_query: str, platform: str, results_count: int) -> bool:
+        """Queue a search for log_search-equivalent writing; False means "write it yourself"."""
+        if user_id is None:
+            return True
+        row = ActivityService.search_row(user_id, search_query, platform, results_count, datetime.now(timezone.utc))
+        return self._put(self._searches, row)
+
+    def enqueue_event(self, user_id, event_type: str, event_data: Optional[dict]) -> Optional[uuid.UUID]:
+        """Queue a user_events row; returns its event_id, or None when the caller must write it."""
+        rows = self.enqueue_events(user_id, [(event_type, event_data)], overwrite=False)
+        return rows[0]["event_id"] if rows else None
+
+    def enqueue_events(
+        self, user_id, events: List[Tuple[str, Optional[dict]]], overwrite: bool = True
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Queue (event_type, event_data) pairs; returns the queued rows, or None when the caller must write them.
+
+        With overwrite=False a full ring rejects the rows instead of
+        discarding the oldest queued events.
+        """
+        now = datetime.now(timezone.utc)
+        rows = [self.event_row(user_id, event_type, event_data, now) for event_type, event_data in events]
+        with self._cv:
+            overflow = max(0, len(self._events) + len(rows) - self.ring_size)
+            if not self.enabled or self._stopping or (overflow and not overwrite):
+                self._stats["rejected"] += len(rows)
+                return None
+            self._ensure_thread()
+            # deque(maxlen) discards from the left, i.e. the oldest events
+            self._events.extend(rows)
+            self._stats["enqueued"] += len(rows)
+            self._stats["overwritten"] += overflow
+            if len(self._events) >= self.max_batch:
+                self._cv.notify()
+        return rows
+
+    @staticmethod
+    def event_row(user_id, event_type: str, event_data: Optional[dict], timestamp: datetime) -> Dict[str, Any]:
+        return {
+            "event_id": uuid.uuid4(),
+            "user_id": user_id,
+            "event_type": event_type,
+            "event_data": event_data or {},
+            "event_timestamp": timestamp,
+        }
+
+    def _put(self, queue: deque, row: Dict[str, Any]) -> bool:
+        with self._cv:
+            if not self.enabled or self._stopping or len(queue) >= self.max_buffer:
+                self._stats["rejected"] += 1
+                return False
+            self._ensure_thread()
+            queue.append(row)
+            self._stats["enqueued"] += 1
+            if len(queue) >= self.max_batch:
+                self._cv.notify()
+        return True
+
+    # -------- flushing --------
+    def _ensure_thread(self) -> None:
+        # Called with self._cv held; the thread starts lazily on first use
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        interval = self.flush_interval_ms / 1000.0
+        while True:
+            with self._cv:
+                deadline = time.monotonic() + interval
+                while not self._stopping and len(self._searches) < self.max_batch and len(self._events) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cv.wait(remaining)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def flush(self) -> int:
+        """Write everything currently queued; returns the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cv:
+                    searches = [self._searches.popleft() for _ in range(min(self.max_batch, len(self._searches)))]
+                    events = [self._events.popleft() for _ in range(min(self.max_batch, len(self._events)))]
+                if not searches and not events:
+                    return written
+                if searches:
+                    written += self._write(searches, "bulk_log_searches")
+                if events:
+                    written += self._write(events, "bulk_log_events")
+
+    def _write(self, rows: list, method: str) -> int:
+        """Write one batch; on a row-level error retry it in halves so only failing rows are dropped."""
+        error = self._try_write(rows, method)
+        if error is None:
+            self._bump(flushed=len(rows), batches=1)
+            return len(rows)
+        if len(rows) > 1 and isinstance(error, _ROW_ERRORS):
+            self._bump(split_retries=1)
+            mid = len(rows) // 2
+            return self._write(rows[:mid], method) + self._write(rows[mid:], method)
+        # Activity logging is best-effort, same as the synchronous path
+        users = sorted({str(row.get("user_id")) for row in rows})
+        print(f"Warn: activity flush failed, dropped {len(rows)} {method} rows (users {', '.join(users[:5])}) - {error}")
+        self._bump(errors=1, dropped=len(rows))
+        with self._cv:
+            self._last_error = f"{type(error).__name__}: {error}"[:500]
+        return 0
+
+    def _try_write(self, rows: list, method: str) -> Optional[Exception]:
+        db = self.session_factory()
+        try:
+            getattr(ActivityService(db), method)(rows)
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the flush thread and write whatever is still queued (graceful shutdown)."""
+        with self._cv:
+            self._stopping = True
+            self._cv.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    # -------- metrics --------
+    def _bump(self, **deltas: int) -> None:
+        with self._cv:
+            for field, delta in deltas.items():
+                self._stats[field] += delta
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cv:
+            return dict(
+                self._stats,
+                enabled=self.enabled,
+                queued_searches=len(self._searches),
+                queued_events=len(self._events),
+                ring_size=self.ring_size,
+                flush_interval_ms=self.flush_interval_ms,
+                max_batch=self.max_batch,
+                last_error=self._last_error,
+            )
+
+
+class EventRateLimiter:
+    """Per-user token buckets for event ingestion (sustained rate plus burst allowance)."""
+
+    def __init__(self, rate_per_second: Optional[float] = None, burst: Optional[int] = None, max_users: Optional[int] = None):
+        self.rate_per_second = rate_per_second or float(os.getenv("ACTIVITY_EVENTS_RATE_PER_SECOND", "20"))
+        self.burst = burst or int(os.getenv("ACTIVITY_EVENTS_BURST", "500"))
+        self.max_users = max_users or int(os.getenv("ACTIVITY_EVENTS_RATE_MAX_USERS", "50000"))
+        self._lock = threading.Lock()
+        # user_key -> (tokens, last_refill)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._stats = {"allowed": 0, "limited": 0}
+
+    def take(self, user_key: str, count: int) -> float:
+        """Consume `count` tokens; returns 0 when allowed, else seconds until they'd be available.
+
+        `count` must not exceed `burst`: the bucket never holds more, so such a
+        request could never be admitted (callers cap their batch size to it).
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(user_key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate_per_second)
+            if count > tokens:
+                self._buckets[user_key] = (tokens, now)
+                self._stats["limited"] += 1
+                return (min(count, self.burst) - tokens) / self.rate_per_second
+            self._buckets[user_key] = (tokens - count, now)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+            self._stats["allowed"] += 1
+            return 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, users=len(self._buckets), rate_per_second=self.rate_per_second, burst=self.burst)
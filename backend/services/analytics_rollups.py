@@ -0,0 +1,448 @@
+"""
+Analytics rollups
+-----------------
+Incremental aggregation of raw activity into the analytics tables, and the
+reads served from them.
+
+WHY: Questions like "what do people search for most" or "what is trending"
+would otherwise mean scanning all of search_history on every request. A
+background job instead consumes only the search_history rows added since
+its high-water mark, (created_at, search_id) stored in rollup_watermarks.
+It folds them into search_analytics (all-time per normalized query and
+platform) and search_analytics_daily (per day, for trending) with one
+set-based statement per batch, and advances the mark in the same
+transaction. A crash or restart therefore resumes where it stopped,
+without double counting. Distinct users per query are kept exactly in
+search_analytics_users (one row per query, platform and user), so the reads
+can hide queries that fewer than SEARCH_ANALYTICS_MIN_USERS people searched:
+raw query text is only shown once it can't be tied to one user. Rows younger than ROLLUP_SAFETY_LAG_SECONDS are
+left for the next run, because transactions (and the write-behind buffer)
+can commit rows whose created_at is slightly in the past. The watermark
+row is claimed with FOR UPDATE SKIP LOCKED, so with several API workers
+exactly one does the work.
+
+user_analytics (per user per UTC day) is handled differently because its
+counters span four sources. Each run takes the time window since the
+watermark, finds the (user, day) pairs with any new source row, and
+recounts those days in full from the sources, overwriting the row. A
+re-run or an overlapping window therefore produces the same numbers
+(idempotent). Today's rows are refreshed on every run (intra-day), the
+first run after midnight recounts the whole previous day (daily), and
+backfills advance one USER_ROLLUP_CHUNK_HOURS window per transaction.
+"""
+import os
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+EPOCH = "1970-01-01T00:00:00+00:00"
+NIL_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def claim_watermark(db: Session, name: str) -> Optional[tuple]:
+    """Lock the job's watermark row for this transaction.
+
+    Returns (watermark_at, watermark_id), which are None before the first
+    run, or None when another worker holds it.
+    """
+    db.execute(text("INSERT INTO rollup_watermarks (name) VALUES (:n) ON CONFLICT (name) DO NOTHING"), {"n": name})
+    db.commit()
+    row = db.execute(
+        text("SELECT watermark_at, watermark_id FROM rollup_watermarks WHERE name = :n FOR UPDATE SKIP LOCKED"),
+        {"n": name},
+    ).first()
+    return tuple(row) if row is not None else None
+
+
+def advance_watermark(db: Session, name: str, watermark_at, watermark_id) -> None:
+    db.execute(
+        text("UPDATE rollup_watermarks SET watermark_at = :at, watermark_id = :id, updated_at = now() WHERE name = :n"),
+        {"n": name, "at": watermark_at, "id": str(watermark_id) if watermark_id is not None else None},
+    )
+
+
+_SEARCH_BATCH_SQL = """
+    WITH batch AS (
+        SELECT search_id, created_at, search_query, platform, user_id,
+               COALESCE(query_key, lower(search_query)) AS query_key,
+               COALESCE(results_count, 0) AS results_count
+        FROM search_history
+        WHERE (created_at, search_id) > (CAST(:wm_at AS timestamptz), CAST(:wm_id AS uuid))
+          AND created_at < now() - make_interval(secs => :lag)
+        ORDER BY created_at, search_id
+        LIMIT :batch
+    ),
+    new_users AS (
+        INSERT INTO search_analytics_users (query_key, platform_name, user_id)
+        SELECT DISTINCT query_key, platform, user_id FROM batch WHERE user_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING query_key, platform_name
+    ),
+    totals AS (
+        SELECT b.query_key, b.platform, COUNT(*) AS n, SUM(b.results_count) AS results_total,
+               MIN(b.created_at) AS first_at, MAX(b.created_at) AS last_at,
+               (array_agg(b.search_query ORDER BY b.created_at DESC))[1] AS display_query,
+               COALESCE(MAX(u.added), 0) AS users_added
+        FROM batch b
+        LEFT JOIN (
+            SELECT query_key, platform_name, COUNT(*) AS added FROM new_users GROUP BY 1, 2
+        ) u ON u.query_key = b.query_key AND u.platform_name = b.platform
+        GROUP BY b.query_key, b.platform
+    ),
+    upsert_totals AS (
+        INSERT INTO search_analytics AS sa (
+            search_id, query_key, search_query, platform_name, total_searches, distinct_users,
+            total_results_count, average_results_count, first_searched_at, last_searched_at
+        )
+        SELECT CAST(md5(query_key || '|' || platform) AS uuid), query_key, display_query, platform, n, users_added,
+               results_total, round(results_total::numeric / n), first_at, last_at
+        FROM totals
+        ON CONFLICT (query_key, platform_name) DO UPDATE SET
+            total_searches = sa.total_searches + excluded.total_searches,
+            distinct_users = sa.distinct_users + excluded.distinct_users,
+            total_results_count = sa.total_results_count + excluded.total_results_count,
+            average_results_count = round(
+                (sa.total_results_count + excluded.total_results_count)::numeric
+                / NULLIF(sa.total_searches + excluded.total_searches, 0)
+            ),
+            search_query = CASE WHEN excluded.last_searched_at >= sa.last_searched_at
+                                THEN excluded.search_query ELSE sa.search_query END,
+            first_searched_at = LEAST(sa.first_searched_at, excluded.first_searched_at),
+            last_searched_at = GREATEST(sa.last_searched_at, excluded.last_searched_at)
+    ),
+    upsert_daily AS (
+        INSERT INTO search_analytics_daily AS d (query_key, platform_name, bucket_date, searches, results_total)
+        SELECT query_key, platform, CAST(created_at AT TIME ZONE 'UTC' AS date), COUNT(*), SUM(results_count)
+        FROM batch
+        GROUP BY 1, 2, 3
+        ON CONFLICT (query_key, platform_name, bucket_date) DO UPDATE SET
+            searches = d.searches + excluded.searches,
+            results_total = d.results_total + excluded.results_total
+    )
+    SELECT (SELECT COUNT(*) FROM batch), last.created_at, last.search_id
+    FROM (SELECT NULL) AS one
+    LEFT JOIN LATERAL (
+        SELECT created_at, search_id FROM batch ORDER BY created_at DESC, search_id DESC LIMIT 1
+    ) AS last ON true
+"""
+
+
+class SearchAnalyticsRollup:
+    """search_history -> search_analytics / search_analytics_daily, incrementally."""
+
+    name = "search_analytics"
+
+    def __init__(self, batch_size: Optional[int] = None, safety_lag_seconds: Optional[int] = None):
+        self.batch_size = batch_size or int(os.getenv("SEARCH_ROLLUP_BATCH_SIZE", "5000"))
+        self.safety_lag_seconds = safety_lag_seconds or int(os.getenv("ROLLUP_SAFETY_LAG_SECONDS", "60"))
+
+    def run(self, db: Session, max_batches: int = 100) -> int:
+        """Consume pending rows in batches (one transaction each); returns rows consumed."""
+        consumed = 0
+        for _ in range(max_batches):
+            mark = claim_watermark(db, self.name)
+            if mark is None:
+                db.rollback()
+                break
+            count, last_at, last_id = db.execute(
+                text(_SEARCH_BATCH_SQL),
+                {
+                    "wm_at": mark[0] or EPOCH,
+                    "wm_id": mark[1] or NIL_ID,
+                    "lag": self.safety_lag_seconds,
+                    "batch": self.batch_size,
+                },
+            ).one()
+            if count:
+                advance_watermark(db, self.name, last_at, last_id)
+            db.commit()
+            consumed += count
+            if count < self.batch_size:
+                break
+        return consumed
+
+
+# Recount every (user, UTC day) with a source row in [:lo, :hi) and overwrite it.
+# search_history.created_at is timestamptz; user_events, comparison_sessions
+# and chat_messages store naive UTC timestamps, which are cast to a date as is.
+# Comparing the naive columns with the timestamptz bounds goes through the
+# session TimeZone, so run this only after _pin_utc.
+_USER_DAYS_SQL = """
+    WITH dirty AS (
+        SELECT user_id, CAST(created_at AT TIME ZONE 'UTC' AS date) AS day
+        FROM search_history WHERE created_at >= :lo AND created_at < :hi
+        UNION
+        SELECT user_id, CAST(event_timestamp AS date)
+        FROM user_events WHERE event_type = 'product_view' AND event_timestamp >= :lo AND event_timestamp < :hi
+        UNION
+        SELECT user_id, CAST(created_at AS date)
+        FROM comparison_sessions WHERE created_at >= :lo AND created_at < :hi
+        UNION
+        SELECT user_id, CAST(created_at AS date)
+        FROM chat_messages WHERE message_type = 'user' AND created_at >= :lo AND created_at < :hi
+    ),
+    days AS (
+        SELECT user_id, day,
+               CAST(day AS timestamp) AT TIME ZONE 'UTC' AS day_start,
+               CAST(day + 1 AS timestamp) AT TIME ZONE 'UTC' AS day_end
+        FROM dirty
+    ),
+    recounted AS (
+        SELECT d.user_id, d.day,
+               (SELECT COUNT(*) FROM search_history s
+                WHERE s.user_id = d.user_id AND s.created_at >= d.day_start AND s.created_at < d.day_end) AS searches,
+               (SELECT COUNT(*) FROM user_events e
+                WHERE e.user_id = d.user_id AND e.event_type = 'product_view'
+                  AND e.event_timestamp >= d.day_start AND e.event_timestamp < d.day_end) AS product_views,
+               (SELECT COUNT(*) FROM comparison_sessions c
+                WHERE c.user_id = d.user_id AND c.created_at >= d.day_start AND c.created_at < d.day_end) AS comparisons,
+               (SELECT COUNT(*) FROM chat_messages m
+                WHERE m.user_id = d.user_id AND m.message_type = 'user'
+                  AND m.created_at >= d.day_start AND m.created_at < d.day_end) AS chat_messages
+        FROM days d
+    ),
+    upserted AS (
+        INSERT INTO user_analytics AS ua (
+            analytics_id, user_id, analytics_date, total_searches, total_product_views,
+            total_comparisons, total_chat_messages, updated_at
+        )
+        SELECT CAST(md5(user_id::text || '|' || day::text) AS uuid), user_id, day,
+               searches, product_views, comparisons, chat_messages, now()
+        FROM recounted
+        ON CONFLICT (user_id, analytics_date) DO UPDATE SET
+            total_searches = excluded.total_searches,
+            total_product_views = excluded.total_product_views,
+            total_comparisons = excluded.total_comparisons,
+            total_chat_messages = excluded.total_chat_messages,
+            updated_at = now()
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM upserted
+"""
+
+_USER_SOURCES_START_SQL = """
+    SELECT LEAST(
+        (SELECT MIN(created_at) FROM search_history),
+        (SELECT MIN(event_timestamp) FROM user_events),
+        (SELECT MIN(created_at) FROM comparison_sessions),
+        (SELECT MIN(created_at) FROM chat_messages)
+    )
+"""
+
+
+def _pin_utc(db: Session) -> None:
+    # Naive timestamps are UTC; make every timestamp/timestamptz conversion in this
+    # transaction use UTC whatever the server's or role's TimeZone setting
+    db.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+
+
+class UserAnalyticsRollup:
+    """user_events / search_history / comparison_sessions / chat_messages -> user_analytics."""
+
+    name = "user_analytics"
+
+    def __init__(self, chunk_hours: Optional[int] = None, safety_lag_seconds: Optional[int] = None):
+        self.chunk = timedelta(hours=chunk_hours or int(os.getenv("USER_ROLLUP_CHUNK_HOURS", "24")))
+        self.safety_lag = timedelta(seconds=safety_lag_seconds or int(os.getenv("ROLLUP_SAFETY_LAG_SECONDS", "60")))
+
+    def run(self, db: Session, max_chunks: int = 30) -> int:
+        """Advance the watermark window by window (one transaction each); returns (user, day) rows written."""
+        written = 0
+        for _ in range(max_chunks):
+            mark = claim_watermark(db, self.name)
+            if mark is None:
+                db.rollback()
+                break
+            _pin_utc(db)
+            horizon = datetime.now(timezone.utc) - self.safety_lag
+            lo = mark[0] or db.execute(text(_USER_SOURCES_START_SQL)).scalar() or horizon
+            hi = min(lo + self.chunk, horizon)
+            if hi <= lo:
+                db.rollback()
+                break
+            written += db.execute(text(_USER_DAYS_SQL), {"lo": lo, "hi": hi}).scalar() or 0
+            today_start = datetime.combine(hi.astimezone(timezone.utc).date(), time(), tzinfo=timezone.utc)
+            if hi >= horizon and lo < today_start:
+                # Daily pass once caught up past midnight: recount the closed day in full,
+                # picking up rows that committed after the intra-day runs saw it
+                written += db.execute(
+                    text(_USER_DAYS_SQL), {"lo": today_start - timedelta(days=1), "hi": today_start}
+                ).scalar() or 0
+            advance_watermark(db, self.name, hi, None)
+            db.commit()
+            if hi >= horizon:
+                break
+        return written
+
+    def rebuild(self, db: Session, since: datetime) -> int:
+        """Recount every (user, day) with activity since `since` (e.g. after a backfill); commits."""
+        _pin_utc(db)
+        written = db.execute(
+            text(_USER_DAYS_SQL), {"lo": since, "hi": datetime.now(timezone.utc)}
+        ).scalar() or 0
+        db.commit()
+        return written
+
+
+class RollupRunner:
+    """Daemon thread running rollup jobs every ROLLUP_INTERVAL_SECONDS."""
+
+    def __init__(self, session_factory: Callable, jobs: List, interval_seconds: Optional[int] = None):
+        self.session_factory = session_factory
+        self.jobs = jobs
+        self.interval_seconds = interval_seconds or int(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+        self.enabled = os.getenv("ROLLUPS_ENABLED", "true").lower() in ("1", "true", "yes")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {job.name: {"runs": 0, "rows": 0, "errors": 0} for job in jobs}
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="analytics-rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.run_once()
+
+    def run_once(self) -> Dict[str, int]:
+        """Run every job once; returns rows consumed per job."""
+        consumed = {}
+        for job in self.jobs:
+            db = self.session_factory()
+            try:
+                consumed[job.name] = job.run(db)
+                self._bump(job.name, runs=1, rows=consumed[job.name])
+            except Exception as e:
+                db.rollback()
+                print(f"Warn: rollup {job.name} failed - {e}")
+                self._bump(job.name, errors=1)
+            finally:
+                db.close()
+        return consumed
+
+    def _bump(self, name: str, **deltas: int) -> None:
+        with self._lock:
+            for field, delta in deltas.items():
+                self._stats[name][field] += delta
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# -------- reads --------
+def top_search_queries(
+    db: Session, platform: Optional[str] = None, limit: int = 20, min_searches: int = 1, min_users: int = 1
+) -> List[Dict]:
+    """Most searched queries of all time searched by at least `min_users` people (from search_analytics)."""
+    rows = db.execute(
+        text(
+            """
+            SELECT search_query, platform_name, total_searches, average_results_count,
+                   first_searched_at, last_searched_at
+            FROM search_analytics
+            WHERE query_key IS NOT NULL AND total_searches >= :min AND distinct_users >= :min_users
+              AND (CAST(:platform AS varchar) IS NULL OR platform_name = :platform)
+            ORDER BY total_searches DESC, last_searched_at DESC
+            LIMIT :limit
+            """
+        ),
+        {"platform": platform, "limit": limit, "min": min_searches, "min_users": min_users},
+    ).mappings()
+    return [dict(r) for r in rows]
+
+
+def trending_search_queries(
+    db: Session,
+    platform: Optional[str] = None,
+    window_days: int = 7,
+    limit: int = 20,
+    min_searches: int = 1,
+    min_users: int = 1,
+    today: Optional[date] = None,
+) -> List[Dict]:
+    """Queries growing fastest: last `window_days` vs the window before (from search_analytics_daily).
+
+    Only queries searched by at least `min_users` people overall are returned.
+    """
+    # Rollup days are UTC days
+    today = today or datetime.now(timezone.utc).date()
+    recent_start = today - timedelta(days=window_days - 1)
+    previous_start = recent_start - timedelta(days=window_days)
+    rows = db.execute(
+        text(
+            """
+            SELECT d.query_key, d.platform_name,
+                   SUM(d.searches) FILTER (WHERE d.bucket_date >= :recent_start) AS recent_searches,
+                   COALESCE(SUM(d.searches) FILTER (WHERE d.bucket_date < :recent_start), 0) AS previous_searches,
+                   MAX(sa.search_query) AS search_query
+            FROM search_analytics_daily d
+            JOIN search_analytics sa ON sa.query_key = d.query_key AND sa.platform_name = d.platform_name
+            WHERE d.bucket_date BETWEEN :previous_start AND :today
+              AND sa.distinct_users >= :min_users
+              AND (CAST(:platform AS varchar) IS NULL OR d.platform_name = :platform)
+            GROUP BY d.query_key, d.platform_name
+            HAVING SUM(d.searches) FILTER (WHERE d.bucket_date >= :recent_start) >= :min
+            ORDER BY (SUM(d.searches) FILTER (WHERE d.bucket_date >= :recent_start) + 1.0)
+                     / (COALESCE(SUM(d.searches) FILTER (WHERE d.bucket_date < :recent_start), 0) + 1.0) DESC,
+                     recent_searches DESC
+            LIMIT :limit
+            """
+        ),
+        {
+            "platform": platform,
+            "limit": limit,
+            "min": min_searches,
+            "min_users": min_users,
+            "today": today,
+            "recent_start": recent_start,
+            "previous_start": previous_start,
+        },
+    ).mappings()
+    return [
+        {
+            "search_query": r["search_query"] or r["query_key"],
+            "platform_name": r["platform_name"],
+            "recent_searches": int(r["recent_searches"]),
+            "previous_searches": int(r["previous_searches"]),
+            "growth": (r["recent_searches"] + 1.0) / (r["previous_searches"] + 1.0),
+        }
+        for r in rows
+    ]
+
+
+def user_activity_summary(db: Session, user_id, days: int = 30, today: Optional[date] = None) -> Dict:
+    """Daily counters for the last `days` UTC days (zero-filled) plus their totals, from user_analytics."""
+    today = today or datetime.now(timezone.utc).date()
+    start = today - timedelta(days=days - 1)
+    rows = db.execute(
+        text(
+            """
+            SELECT analytics_date, total_searches, total_product_views, total_comparisons, total_chat_messages
+            FROM user_analytics
+            WHERE user_id = CAST(:user_id AS uuid) AND analytics_date BETWEEN :start AND :today
+            """
+        ),
+        {"user_id": str(user_id), "start": start, "today": today},
+    ).mappings()
+    counters = ("total_searches", "total_product_views", "total_comparisons", "total_chat_messages")
+    by_day = {r["analytics_date"]: r for r in rows}
+    daily = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        row = by_day.get(day)
+        daily.append({"date": day.isoformat(), **{c: int(row[c] or 0) if row else 0 for c in counters}})
+    return {
+        "days": days,
+        "totals": {c: sum(d[c] for d in daily) for c in counters},
+        "daily": daily,
+    }
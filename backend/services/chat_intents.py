@@ -0,0 +1,179 @@
+"""
+Chat intents
+------------
+Deterministic answers for simple comparison-chat questions.
+
+WHY: Questions like "which is cheapest?", "which has the best rating?" or
+"is X in stock?" are fully answered by the product snapshot add_chat_message
+already assembles (price, rating, total_reviews, in_stock). Answering them
+here takes milliseconds and no LLM call; anything open-ended, compound or
+lacking the needed data returns None and goes to GrokService as before.
+"""
+import re
+from typing import Dict, List, Optional
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Any of these means the user wants judgement, not a lookup
+_OPEN_ENDED = re.compile(
+    r"\b(why|how|should|recommend|suggest|better for|best for|good for|worth|compare|comparison|"
+    r"difference|differ|vs|versus|pros|cons|features?|review|quality|durable|explain|think|opinion)\b"
+)
+
+_INTENTS = [
+    # Superlatives only: "is the sony cheaper than the bose?" compares two named
+    # products, and "cheapest way to charge it" isn't about the listed prices
+    ("cheapest", re.compile(
+        r"\b(cheapest|least expensive|lowest price|lowest priced|most affordable)\b"
+        r"(?!\s+(way|ways|method|option|options|place|places|time|shipping|delivery|plan|to)\b)"
+    )),
+    ("most_expensive", re.compile(r"\b(most expensive|priciest|highest price|highest priced)\b")),
+    ("biggest_discount", re.compile(r"\b(biggest|best|largest|most) (discount|deal|savings?)\b|\b(on sale|discounted)\b")),
+    ("best_rated", re.compile(r"\b(best|highest|top) (rated|rating|ratings|reviewed)\b|\bhighest stars?\b")),
+    ("worst_rated", re.compile(r"\b(worst|lowest) (rated|rating|ratings)\b")),
+    ("most_reviewed", re.compile(r"\b(most|more) (reviews|reviewed|ratings)\b|\bmost popular\b")),
+    # "available"/"availability" only on their own: "available in blue" or
+    # "availability of sizes" ask about variants, which the snapshot doesn't have
+    ("in_stock", re.compile(
+        r"\b(in stock|out of stock)\b|\b(available|availability)\b(?!\s+(in|with|for|as|at|on|from|of|to)\b)"
+    )),
+]
+
+_NAME_STOP_WORDS = {"the", "a", "an", "is", "it", "in", "of", "for", "with", "and", "stock", "available", "one", "this", "that"}
+
+_OVERVIEW = re.compile(
+    r"\b(overview|summary|summari[sz]e|overall|break ?down|rundown|"
+    r"compare (them|these|the products|all)|tell me about (them|these|the products)|what do you think)\b"
+)
+
+MAX_WORDS = 14
+
+
+def classify_intent(question: str) -> Optional[str]:
+    """Return the single structured intent of `question`, or None if it needs the LLM."""
+    text = " ".join((question or "").lower().split())
+    if not text or len(text.split()) > MAX_WORDS or _OPEN_ENDED.search(text):
+        return None
+    matched = [name for name, pattern in _INTENTS if pattern.search(text)]
+    # Compound questions ("cheapest and best rated?") go to the LLM
+    return matched[0] if len(matched) == 1 else None
+
+
+def is_overview_request(question: str) -> bool:
+    """True for short "give me an overview"-style questions (served by the default overview)."""
+    text = " ".join((question or "").lower().split())
+    return bool(text) and len(text.split()) <= MAX_WORDS and bool(_OVERVIEW.search(text))
+
+
+def _num(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _name(product: Dict) -> str:
+    return product.get("name") or product.get("id") or "this product"
+
+
+def _price(product: Dict, value: Optional[float] = None) -> str:
+    value = _num(product.get("price")) if value is None else value
+    return f"{product.get('currency_symbol') or '$'}{value:,.2f}"
+
+
+def _match_product(question: str, products: List[Dict]) -> Optional[Dict]:
+    """Product whose name shares the most words with the question (None when ambiguous)."""
+    q_words = set(_WORD_RE.findall(question.lower())) - _NAME_STOP_WORDS
+    best, best_score, tie = None, 0, False
+    for product in products:
+        words = set(_WORD_RE.findall((product.get("name") or "").lower())) - _NAME_STOP_WORDS
+        score = len(q_words & words)
+        if score > best_score:
+            best, best_score, tie = product, score, False
+        elif score and score == best_score:
+            tie = True
+    return None if tie else best
+
+
+def _pick(products: List[Dict], key: str, highest: bool) -> Optional[Dict]:
+    with_values = [p for p in products if _num(p.get(key)) is not None]
+    # Require the value for every product so "cheapest" is not guessed from partial data
+    if len(with_values) < 2 or len(with_values) != len(products):
+        return None
+    return (max if highest else min)(with_values, key=lambda p: _num(p.get(key)))
+
+
+def answer_structured(question: str, products: List[Dict]) -> Optional[Dict]:
+    """Answer a simple question from snapshot data.
+
+    Returns {"intent": ..., "answer": ...} or None when the LLM should answer.
+    """
+    intent = classify_intent(question)
+    if not intent or not products:
+        return None
+    footer = "\n\nPrices and availability change often, so double-check on the product page before buying."
+
+    if intent in ("cheapest", "most_expensive"):
+        pick = _pick(products, "price", highest=intent == "most_expensive")
+        if not pick:
+            return None
+        others = sorted(
+            (p for p in products if p is not pick),
+            key=lambda p: _num(p.get("price")),
+            reverse=intent == "most_expensive",
+        )
+        label = "cheapest" if intent == "cheapest" else "most expensive"
+        lines = [f"The {label} option is **{_name(pick)}** at {_price(pick)}."]
+        lines += [f"- {_name(p)}: {_price(p)}" for p in others]
+        return {"intent": intent, "answer": "\n".join(lines) + footer}
+
+    if intent == "biggest_discount":
+        discounts = []
+        for p in products:
+            price, original = _num(p.get("price")), _num(p.get("original_price"))
+            if price is not None and original and original > price:
+                discounts.append((original - price, p, original))
+        if not discounts:
+            return None
+        saving, pick, original = max(discounts, key=lambda d: d[0])
+        pct = saving / original * 100
+        answer = (
+            f"**{_name(pick)}** has the biggest discount: {_price(pick)} instead of "
+            f"{_price(pick, original)} (save {_price(pick, saving)}, about {pct:.0f}% off)."
+        )
+        return {"intent": intent, "answer": answer + footer}
+
+    if intent in ("best_rated", "worst_rated"):
+        pick = _pick(products, "rating", highest=intent == "best_rated")
+        if not pick:
+            return None
+        ranked = sorted(products, key=lambda p: _num(p.get("rating")), reverse=True)
+        label = "highest" if intent == "best_rated" else "lowest"
+        lines = [f"**{_name(pick)}** has the {label} rating at {_num(pick.get('rating')):.1f}/5."]
+        for p in ranked:
+            reviews = p.get("total_reviews")
+            suffix = f" ({int(reviews):,} reviews)" if reviews is not None else ""
+            lines.append(f"- {_name(p)}: {_num(p.get('rating')):.1f}/5{suffix}")
+        return {"intent": intent, "answer": "\n".join(lines) + footer}
+
+    if intent == "most_reviewed":
+        pick = _pick(products, "total_reviews", highest=True)
+        if not pick:
+            return None
+        ranked = sorted(products, key=lambda p: _num(p.get("total_reviews")), reverse=True)
+        lines = [f"**{_name(pick)}** has the most reviews ({int(_num(pick.get('total_reviews'))):,})."]
+        lines += [f"- {_name(p)}: {int(_num(p.get('total_reviews'))):,} reviews" for p in ranked]
+        return {"intent": intent, "answer": "\n".join(lines) + footer}
+
+    if intent == "in_stock":
+        if any(p.get("in_stock") is None for p in products):
+            return None
+        target = _match_product(question, products)
+        if target is not None:
+            status = "is in stock" if target.get("in_stock") else "is currently out of stock"
+            return {"intent": intent, "answer": f"**{_name(target)}** {status}." + footer}
+        lines = ["Here's the current availability:"]
+        lines += [f"- {_name(p)}: {'in stock' if p.get('in_stock') else 'out of stock'}" for p in products]
+        return {"intent": intent, "answer": "\n".join(lines) + footer}
+
+    return None
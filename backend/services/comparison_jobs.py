@@ -0,0 +1,123 @@
+"""
+Comparison jobs
+---------------
+In-memory store for asynchronous comparison jobs.
+
+WHY: POST /api/compare holds the HTTP connection for the whole enrichment +
+LLM run and fails outright when a client or proxy times out. Jobs let the
+endpoint return an id immediately while the work runs on the LLM scheduler's
+worker pool; clients poll (or subscribe via SSE) for status and partial
+progress, and finished results are kept for a retention period.
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
+
+class ComparisonJobStore:
+    """Thread-safe job registry with time-based retention."""
+
+    def __init__(self, retention_seconds: Optional[int] = None, max_jobs: Optional[int] = None):
+        self.retention_seconds = retention_seconds or int(os.getenv("COMPARISON_JOB_RETENTION_SECONDS", "3600"))
+        self.max_jobs = max_jobs or int(os.getenv("COMPARISON_JOB_MAX", "5000"))
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, owner_key: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Register a new queued job and return a snapshot of it."""
+        now = time.time()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "owner_key": owner_key,
+            "status": "queued",
+            "stage": "queued",
+            "progress": {},
+            "request": request,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._prune_locked(now)
+            self._jobs[job["job_id"]] = job
+            return dict(job)
+
+    def get(self, job_id: str, owner_key: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a job owned by `owner_key` (None when missing, expired or foreign)."""
+        with self._lock:
+            self._prune_locked(time.time())
+            job = self._jobs.get(job_id)
+            if not job or job["owner_key"] != owner_key:
+                return None
+            return dict(job, progress=dict(job["progress"]))
+
+    def update_progress(self, job_id: str, stage: str, **progress) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job["status"] in TERMINAL_STATUSES:
+                return
+            job["status"] = "running"
+            job["stage"] = stage
+            job["progress"].update(progress)
+            job["updated_at"] = time.time()
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            now = time.time()
+            job["status"] = "failed" if error else "succeeded"
+            job["stage"] = "done"
+            job["result"] = result
+            job["error"] = error
+            job["updated_at"] = now
+            job["finished_at"] = now
+
+    def cancel(self, job_id: str) -> None:
+        """Mark a job that will never run (its scheduler future was cancelled)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job["status"] in TERMINAL_STATUSES:
+                return
+            now = time.time()
+            job["status"] = "cancelled"
+            job["stage"] = "done"
+            job["updated_at"] = now
+            job["finished_at"] = now
+
+    def _prune_locked(self, now: float) -> None:
+        expired = [
+            jid for jid, job in self._jobs.items()
+            if job["finished_at"] is not None and now - job["finished_at"] > self.retention_seconds
+        ]
+        for jid in expired:
+            del self._jobs[jid]
+        # Hard cap: drop the oldest finished jobs first
+        if len(self._jobs) >= self.max_jobs:
+            finished = sorted(
+                (job["finished_at"], jid) for jid, job in self._jobs.items() if job["finished_at"] is not None
+            )
+            for _, jid in finished[: len(self._jobs) - self.max_jobs + 1]:
+                del self._jobs[jid]
+
+    @staticmethod
+    def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Response shape for clients (drops owner and request payload)."""
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "progress": job["progress"],
+            "result": job["result"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "finished_at": job["finished_at"],
+        }
@@ -1,17 +1,93 @@
 import asyncio
-from typing import Dict, List, Optional
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 from fastapi import HTTPException
 from .walmart_service import WalmartService
 from .amazon_service import AmazonService
 from .grok_service import GrokService
+from .prompts import MAP_PROMPT_VERSION, PROMPT_VERSION
 
 class ComparisonService:
+    # Map step workers shared by every comparison in the process, created lazily
+    _map_pool: Optional[ThreadPoolExecutor] = None
+    _map_pool_lock = threading.Lock()
+
     def __init__(self):
         self.walmart_service = WalmartService()
         self.amazon_service = AmazonService()
         self.grok_service = GrokService()
+        # In-memory TTL LRU cache of comparison results (history-free calls only)
+        # key -> (expires_at_epoch_seconds, result)
+        self._cache: "OrderedDict[Tuple, Tuple[float, Dict]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_ttl = int(os.getenv("COMPARISON_CACHE_TTL_SECONDS", "1800"))
+        self._cache_max_size = int(os.getenv("COMPARISON_CACHE_MAX", "2000"))
+        # Map-reduce mode for large product sets: per-product notes are generated
+        # concurrently, cached per product (reused across sessions) and merged
+        # by a single reduce call. Map calls run on one process-wide pool of
+        # COMPARISON_MAP_CONCURRENCY threads (default: half the LLM scheduler's
+        # workers), so concurrent Grok calls stay bounded by
+        # LLM_SCHEDULER_WORKERS + COMPARISON_MAP_CONCURRENCY however many
+        # comparisons run at once.
+        self.map_reduce_threshold = int(os.getenv("COMPARISON_MAP_REDUCE_THRESHOLD", "5"))
+        self.max_products = int(os.getenv("COMPARISON_MAX_PRODUCTS", "25"))
+        scheduler_workers = int(os.getenv("LLM_SCHEDULER_WORKERS", "4"))
+        self._map_concurrency = int(os.getenv("COMPARISON_MAP_CONCURRENCY", str(max(1, scheduler_workers // 2))))
+        self._notes_cache: "OrderedDict[Tuple, Tuple[float, str]]" = OrderedDict()
+        self._notes_ttl = int(os.getenv("COMPARISON_NOTES_CACHE_TTL_SECONDS", "21600"))
+        self._notes_max_size = int(os.getenv("COMPARISON_NOTES_CACHE_MAX", "5000"))
+
+    @staticmethod
+    def cache_key(selected_products: List[Dict], user_question: str = None, original_search_query: str = None) -> Tuple:
+        """Cache key: product set (order-insensitive), normalized question and search query, prompt version."""
+        products = tuple(sorted((str(p.get('id')), p.get('platform') or 'walmart') for p in selected_products))
+        question = " ".join((user_question or "").lower().split())
+        query = " ".join((original_search_query or "").lower().split())
+        return (PROMPT_VERSION, products, question, query)
+
+    def get_cached_comparison(self, selected_products: List[Dict], user_question: str = None, original_search_query: str = None) -> Optional[Dict]:
+        """Return a fresh cached comparison result, if any (no API calls)."""
+        key = self.cache_key(selected_products, user_question, original_search_query)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] >= time.time():
+                self._cache.move_to_end(key)
+                return dict(cached[1])
+        return None
+
+    def _store_comparison(self, key: Tuple, result: Dict) -> None:
+        with self._cache_lock:
+            self._cache[key] = (time.time() + max(60, self._cache_ttl), dict(result))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_max_size:
+                self._cache.popitem(last=False)
+    
+    @staticmethod
+    def _notes_key(product: Dict) -> Tuple:
+        return (MAP_PROMPT_VERSION, str(product.get('id')), product.get('platform') or 'walmart')
+
+    def _get_cached_notes(self, product: Dict) -> Optional[str]:
+        key = self._notes_key(product)
+        with self._cache_lock:
+            cached = self._notes_cache.get(key)
+            if cached and cached[0] >= time.time():
+                self._notes_cache.move_to_end(key)
+                return cached[1]
+        return None
+
+    def _store_notes(self, product: Dict, notes: str) -> None:
+        with self._cache_lock:
+            key = self._notes_key(product)
+            self._notes_cache[key] = (time.time() + max(60, self._notes_ttl), notes)
+            self._notes_cache.move_to_end(key)
+            while len(self._notes_cache) > self._notes_max_size:
+                self._notes_cache.popitem(last=False)
     
-    def compare_products(self, selected_products: List[Dict], user_question: str = None, original_search_query: str = None) -> Dict:
+    def compare_products(self, selected_products: List[Dict], user_question: str = None, original_search_query: str = None, progress: Optional[Callable] = None, conversation_history: str = None) -> Dict:
         """
         Compare selected products using AI analysis
         
@@ -19,6 +95,8 @@ class ComparisonService:
             selected_products: List of products with basic info (id, platform, url, etc.)
             user_question: Optional specific question from user
             original_search_query: The original search query that found these products
+            progress: Optional callback progress(stage, **details) for job status updates
+            conversation_history: Optional bounded chat history for follow-up questions
             
         Returns:
             Dict containing AI analysis of the products
@@ -28,23 +106,45 @@ class ComparisonService:
             print(f"User question: {user_question}")
             print(f"Original search query: {original_search_query}")
             
-            # Fetch detailed information for all selected products
-            enriched_products = self._fetch_all_product_data(selected_products)
-            print(f"Enriched {len(enriched_products)} products with details")
+            # Results depend on the chat history when one is given; only cache history-free calls
+            cacheable = not conversation_history
+            if cacheable:
+                cached = self.get_cached_comparison(selected_products, user_question, original_search_query)
+                if cached:
+                    print("Comparison served from cache")
+                    return cached
             
-            # Generate AI analysis using Grok (synchronous call)
-            ai_analysis = self.grok_service.analyze_products(
-                products_data=enriched_products,
-                user_question=user_question,
-                original_search_query=original_search_query
-            )
+            if len(selected_products) > self.map_reduce_threshold:
+                # Too many products for one prompt: per-product notes, then one merge call
+                ai_analysis = self._map_reduce_analysis(
+                    selected_products, user_question, original_search_query, progress, conversation_history
+                )
+                products_analyzed = len(selected_products)
+            else:
+                # Fetch detailed information for all selected products
+                enriched_products = self._fetch_all_product_data(selected_products, progress)
+                print(f"Enriched {len(enriched_products)} products with details")
+                if progress:
+                    progress("analyzing", products_total=len(selected_products), products_enriched=len(enriched_products))
+                
+                # Generate AI analysis using Grok (synchronous call)
+                ai_analysis = self.grok_service.analyze_products(
+                    products_data=enriched_products,
+                    user_question=user_question,
+                    original_search_query=original_search_query,
+                    conversation_history=conversation_history,
+                )
+                products_analyzed = len(enriched_products)
             
-            return {
+            result = {
                 "ai_analysis": ai_analysis,
-                "products_analyzed": len(enriched_products),
+                "products_analyzed": products_analyzed,
                 "original_search_query": original_search_query,
                 "user_question": user_question
             }
+            if cacheable:
+                self._store_comparison(self.cache_key(selected_products, user_question, original_search_query), result)
+            return result
             
         except Exception as e:
             print(f"Error in compare_products: {str(e)}")
@@ -52,33 +152,82 @@ class ComparisonService:
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Product comparison failed: {str(e)}")
     
-    def _fetch_all_product_data(self, selected_products: List[Dict]) -> List[Dict]:
+    def _map_reduce_analysis(self, selected_products: List[Dict], user_question: str = None, original_search_query: str = None, progress: Optional[Callable] = None, conversation_history: str = None) -> str:
+        """Map: cached-or-generated notes per product (concurrently). Reduce: one merge call."""
+        total = len(selected_products)
+        notes: List[Optional[str]] = [self._get_cached_notes(p) for p in selected_products]
+        missing = [i for i, n in enumerate(notes) if n is None]
+        summarized = total - len(missing)
+        print(f"Map-reduce comparison: {summarized}/{total} product notes cached")
+        if progress:
+            progress("summarizing", products_total=total, products_summarized=summarized)
+        if missing:
+            pool = self._get_map_pool()
+            futures = {pool.submit(self._map_product, selected_products[i]): i for i in missing}
+            for future in as_completed(futures):
+                notes[futures[future]] = future.result()
+                summarized += 1
+                if progress:
+                    progress("summarizing", products_total=total, products_summarized=summarized)
+        if progress:
+            progress("analyzing", products_total=total, products_summarized=summarized)
+        return self.grok_service.reduce_comparison(
+            list(zip(selected_products, notes)),
+            user_question=user_question,
+            original_search_query=original_search_query,
+            conversation_history=conversation_history,
+        )
+
+    def _get_map_pool(self) -> ThreadPoolExecutor:
+        with ComparisonService._map_pool_lock:
+            if ComparisonService._map_pool is None:
+                ComparisonService._map_pool = ThreadPoolExecutor(
+                    max_workers=max(1, self._map_concurrency), thread_name_prefix="comparison-map"
+                )
+            return ComparisonService._map_pool
+
+    def _map_product(self, product: Dict) -> Optional[str]:
+        """Enrich one product and generate its notes; None (uncached) when that fails."""
+        try:
+            notes = self.grok_service.summarize_product(self._fetch_product_data(product))
+        except Exception as e:
+            print(f"Error summarizing product {product.get('id')}: {str(e)}")
+            return None
+        if notes:
+            self._store_notes(product, notes)
+        return notes or None
+    
+    def _fetch_all_product_data(self, selected_products: List[Dict], progress: Optional[Callable] = None) -> List[Dict]:
         """Fetch product details and reviews for all selected products"""
         enriched_products = []
         
         for product in selected_products:
-            try:
-                # Fetch product details
-                product_details = self._get_product_details(product)
-                
-                # Fetch product reviews
-                product_reviews = self._get_product_reviews(product)
-                
-                # Combine all information
-                enriched_product = {
-                    **product,  # Keep original product info
-                    "details": product_details.get("details", {}),
-                    "reviews": product_reviews.get("reviews", [])
-                }
-                
-                enriched_products.append(enriched_product)
-                
-            except Exception as e:
-                print(f"Error fetching data for product {product.get('id')}: {str(e)}")
-                # Add product with basic info if detailed fetch fails
-                enriched_products.append(product)
+            if progress:
+                progress("enriching", products_total=len(selected_products), products_enriched=len(enriched_products))
+            enriched_products.append(self._fetch_product_data(product))
         
         return enriched_products
+
+    def _fetch_product_data(self, product: Dict) -> Dict:
+        """Fetch details and reviews for one product (basic info only if that fails)"""
+        try:
+            # Fetch product details
+            product_details = self._get_product_details(product)
+            
+            # Fetch product reviews
+            product_reviews = self._get_product_reviews(product)
+            
+            # Combine all information
+            return {
+                **product,  # Keep original product info
+                "details": product_details.get("details", {}),
+                "reviews": product_reviews.get("reviews", [])
+            }
+            
+        except Exception as e:
+            print(f"Error fetching data for product {product.get('id')}: {str(e)}")
+            # Add product with basic info if detailed fetch fails
+            return product
     
     def _get_product_details(self, product: Dict) -> Dict:
         """Get detailed product information"""
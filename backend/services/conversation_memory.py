@@ -0,0 +1,83 @@
+"""
+Conversation memory
+-------------------
+Bounded chat history for comparison sessions.
+
+WHY: Follow-up questions need earlier turns, but sending every stored
+chat_message would grow prompts without bound. Each prompt instead gets the
+session's running summary of older turns plus the last few turns verbatim,
+clipped to a fixed character budget. After each AI reply the turns that fell
+out of the verbatim window are folded into the summary in the background.
+"""
+import os
+from typing import List, Optional
+
+from .activity_service import ActivityService
+
+
+class ConversationMemory:
+    """Builds bounded history blocks and refreshes running summaries."""
+
+    def __init__(
+        self,
+        recent_turns: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        summary_max_chars: Optional[int] = None,
+        fold_min_messages: Optional[int] = None,
+    ):
+        self.recent_messages = 2 * (recent_turns or int(os.getenv("CHAT_MEMORY_RECENT_TURNS", "3")))
+        self.max_chars = max_chars or int(os.getenv("CHAT_MEMORY_MAX_CHARS", "4000"))
+        self.summary_max_chars = summary_max_chars or int(os.getenv("CHAT_MEMORY_SUMMARY_MAX_CHARS", "1500"))
+        self.fold_min_messages = fold_min_messages or int(os.getenv("CHAT_MEMORY_FOLD_MIN_MESSAGES", "2"))
+
+    @staticmethod
+    def _clip(text: str, limit: int) -> str:
+        text = " ".join((text or "").split())
+        return text if len(text) <= limit else text[: max(0, limit - 3)].rstrip() + "..."
+
+    @staticmethod
+    def _speaker(message) -> str:
+        return "User" if message.message_type == "user" else "Assistant"
+
+    def format_transcript(self, messages: List, per_message_chars: int = 800) -> str:
+        return "\n".join(f"{self._speaker(m)}: {self._clip(m.message_content, per_message_chars)}" for m in messages)
+
+    def build_history(self, activity: ActivityService, user_id, comparison_id, exclude_message_id=None) -> Optional[str]:
+        """History block for the next prompt, never longer than `max_chars`."""
+        summary, recent = activity.get_conversation_window(
+            user_id, comparison_id, self.recent_messages, exclude_message_id=exclude_message_id
+        )
+        parts = []
+        if summary:
+            parts.append("Summary of earlier conversation: " + self._clip(summary, self.summary_max_chars))
+        header = "Recent messages:\n"
+        budget = self.max_chars - sum(len(p) + 2 for p in parts) - len(header)
+        # Newest turns matter most: drop the oldest verbatim messages when over budget
+        while recent and budget > 0:
+            per_message = budget // len(recent) - 12
+            if per_message >= 120:
+                parts.append(header + self.format_transcript(recent, per_message))
+                break
+            recent = recent[1:]
+        return "\n\n".join(parts) or None
+
+    def refresh_summary(self, activity: ActivityService, grok_service, user_id, comparison_id) -> bool:
+        """Fold messages older than the verbatim window into the running summary.
+
+        Returns True when the summary was updated.
+        """
+        session, pending = activity.list_unsummarized_messages(user_id, comparison_id)
+        if not session:
+            return False
+        to_fold = pending[: max(0, len(pending) - self.recent_messages)]
+        if len(to_fold) < self.fold_min_messages:
+            return False
+        summary = grok_service.summarize_conversation(
+            session.conversation_summary,
+            self.format_transcript(to_fold),
+            max_chars=self.summary_max_chars,
+        )
+        if not summary:
+            return False
+        activity.update_conversation_summary(comparison_id, summary, to_fold[-1].created_at)
+        return True
@@ -0,0 +1,107 @@
+"""
+Count service
+-------------
+Cached and approximate `total` counts for the paginated activity lists.
+
+WHY: Every list page used to run an exact count() over the filtered query
+next to the page query itself, roughly doubling the database work per page.
+Totals are now cached per (user, list, scope) and invalidated by
+ActivityService whenever it inserts or soft-deletes rows of that list
+(write-through), with a TTL bounding staleness across worker processes.
+Clients pick the cost they want with total=exact|approx|none; approx uses
+the Postgres planner's row estimate for very large sets instead of counting.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+TOTAL_MODES = ("exact", "approx", "none")
+
+
+class CountService:
+    """Process-wide TTL LRU cache of list totals with planner-estimate fallback."""
+
+    def __init__(self, ttl_seconds: Optional[int] = None, exact_max: Optional[int] = None, max_entries: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds or int(os.getenv("COUNT_CACHE_TTL_SECONDS", "300"))
+        # approx: sets estimated above this are not counted exactly
+        self.exact_max = exact_max or int(os.getenv("COUNT_APPROX_EXACT_MAX", "10000"))
+        self.max_entries = max_entries or int(os.getenv("COUNT_CACHE_MAX", "20000"))
+        self._lock = threading.Lock()
+        # (user_id, list_name, scope) -> (expires_at, count, is_exact)
+        self._cache: "OrderedDict[Tuple, Tuple[float, int, bool]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "estimates": 0, "invalidations": 0}
+
+    # -------- cache --------
+    def peek(self, user_id, list_name: str, scope=None, exact: bool = True) -> Optional[int]:
+        """Cached total (exact ones only when `exact`), or None."""
+        key = (str(user_id), list_name, scope)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] >= time.time() and (entry[2] or not exact):
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, user_id, list_name: str, scope, count: int, is_exact: bool = True) -> None:
+        key = (str(user_id), list_name, scope)
+        with self._lock:
+            self._cache[key] = (time.time() + self.ttl_seconds, int(count), is_exact)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, user_id, *list_names: str) -> None:
+        """Drop every cached total of `list_names` (all scopes) for a user."""
+        uid = str(user_id)
+        with self._lock:
+            stale = [k for k in self._cache if k[0] == uid and k[1] in list_names]
+            for k in stale:
+                del self._cache[k]
+            self._stats["invalidations"] += 1
+
+    # -------- counting --------
+    def total(self, db, q, user_id, list_name: str, mode: str = "exact", scope=None) -> Optional[int]:
+        """Total rows of ORM query `q` under `mode` (see TOTAL_MODES); None for "none"."""
+        if mode == "none":
+            return None
+        cached = self.peek(user_id, list_name, scope, exact=mode == "exact")
+        if cached is not None:
+            return cached
+        if mode == "approx":
+            estimate = self.estimate(db, q)
+            if estimate is not None and estimate > self.exact_max:
+                self.store(user_id, list_name, scope, estimate, is_exact=False)
+                return estimate
+        count = q.order_by(None).count()
+        self.store(user_id, list_name, scope, count)
+        return count
+
+    def estimate(self, db, q) -> Optional[int]:
+        """Planner row estimate for `q` (EXPLAIN, no execution); None when unavailable."""
+        try:
+            dialect = db.get_bind().dialect
+            if dialect.name != "postgresql":
+                return None
+            sql = str(q.order_by(None).statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+            plan = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql.replace("%", "%%")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            with self._lock:
+                self._stats["estimates"] += 1
+            return int(plan[0]["Plan"]["Plan Rows"])
+        except Exception as e:
+            print(f"Warn: count estimate failed - {e}")
+            return None
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._cache))
+
+
+# Shared by all ActivityService instances (one per request)
+counts = CountService()
@@ -4,8 +4,26 @@ from typing import Dict, List, Optional, Tuple
 from fastapi import HTTPException
 import os
 import time
+import threading
 from collections import OrderedDict
 from dotenv import load_dotenv
+from .review_retriever import ReviewRetriever
+from .query_titler import is_simple_query, local_title
+from .prompts import (
+    PROMPT_VERSION,
+    TITLE_PROMPT_VERSION,
+    TITLE_BATCH_PROMPT_VERSION,
+    MEMORY_PROMPT_VERSION,
+    MAP_PROMPT_VERSION,
+    REDUCE_PROMPT_VERSION,
+    build_comparison_messages,
+    build_map_messages,
+    build_reduce_messages,
+    build_memory_messages,
+    build_title_messages,
+    build_title_batch_messages,
+    parse_numbered_lines,
+)
 
 load_dotenv()
 
@@ -18,11 +36,20 @@ class GrokService:
         self._summary_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
         self._summary_ttl = int(os.getenv("GROK_SUMMARY_CACHE_TTL_SECONDS", "21600"))  # 6 hours default
         self._summary_max_size = int(os.getenv("GROK_SUMMARY_CACHE_MAX", "10000"))
+        # Grok budget for a title before falling back to the local heuristic title
+        self._summary_timeout = float(os.getenv("GROK_SUMMARY_TIMEOUT_SECONDS", "5"))
+        # Summaries are produced on LLM scheduler worker threads
+        self._summary_lock = threading.Lock()
+        # Per-product character budget for review snippets in comparison prompts
+        self._review_context_chars = int(os.getenv("GROK_REVIEW_CONTEXT_CHARS", "600"))
+        # Aggregated token usage/latency per prompt version (prefix-cache hit ratios)
+        self._usage_lock = threading.Lock()
+        self._usage_stats: Dict[str, Dict[str, float]] = {}
         
         if not self.api_key:
             raise ValueError("GROK_API_KEY environment variable is required")
     
-    def analyze_products(self, products_data: List[Dict], user_question: str = None, original_search_query: str = None) -> str:
+    def analyze_products(self, products_data: List[Dict], user_question: str = None, original_search_query: str = None, conversation_history: str = None) -> str:
         """
         Analyze products using Grok AI
         
@@ -30,6 +57,7 @@ class GrokService:
             products_data: List of product details including reviews
             user_question: Optional specific question from user
             original_search_query: The original search query that found these products
+            conversation_history: Optional bounded chat history (running summary + recent turns)
             
         Returns:
             String containing the AI analysis
@@ -41,14 +69,15 @@ class GrokService:
             
             # Prepare the context with all product information
             context = self._prepare_context(products_data)
-            print(f"GrokService: Context length: {len(context)} characters")
+            review_context = self._prepare_review_context(products_data, user_question)
+            print(f"GrokService: Context length: {len(context) + len(review_context)} characters")
             
             # Create the prompt for Grok
-            prompt = self._create_prompt(context, user_question, original_search_query)
-            print(f"GrokService: Prompt length: {len(prompt)} characters")
+            messages = self._create_prompt(context, user_question, original_search_query, conversation_history, review_context)
+            print(f"GrokService: Prompt length: {sum(len(m['content']) for m in messages)} characters")
             
             # Call Grok API
-            response = self._call_grok_api(prompt)
+            response = self._call_grok_api(messages)
             print(f"GrokService: Response length: {len(response)} characters")
             
             return response
@@ -59,8 +88,58 @@ class GrokService:
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Grok analysis failed: {str(e)}")
     
+    def summarize_product(self, product_data: Dict, max_chars: int = 800) -> str:
+        """Compact, question-independent notes for one enriched product (map step)."""
+        try:
+            context = self._prepare_context([product_data])
+            review_context = self._prepare_review_context([product_data])
+            if review_context:
+                context += "\n\n" + review_context
+            notes = self._call_grok_api(
+                build_map_messages(context),
+                prompt_version=MAP_PROMPT_VERSION,
+                max_tokens=300,
+            )
+            notes = (notes or "").strip()
+            if len(notes) > max_chars:
+                notes = notes[:max_chars].rstrip()
+            return notes
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"GrokService: summarize_product error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Product summary failed: {str(e)}")
+
+    def reduce_comparison(self, product_notes: List[Tuple[Dict, str]], user_question: str = None, original_search_query: str = None, conversation_history: str = None) -> str:
+        """Merge per-product notes into one comparison (reduce step).
+
+        `product_notes` pairs each product's snapshot (name, price, rating) with
+        its map notes; live snapshot fields are added here, not in the cached notes.
+        """
+        try:
+            parts = []
+            for i, (product, notes) in enumerate(product_notes, 1):
+                parts.append(
+                    f"PRODUCT {i}: {product.get('name', 'N/A')}\n"
+                    f"Price: ${product.get('price', 'N/A')} | Rating: {product.get('rating', 'N/A')}/5 "
+                    f"({product.get('total_reviews', 'N/A')} reviews)\n"
+                    f"{notes or 'No details available.'}"
+                )
+            messages = build_reduce_messages("\n\n".join(parts), user_question, original_search_query, conversation_history)
+            print(f"GrokService: Reduce prompt length: {sum(len(m['content']) for m in messages)} characters")
+            return self._call_grok_api(messages, prompt_version=REDUCE_PROMPT_VERSION)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"GrokService: reduce_comparison error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Grok analysis failed: {str(e)}")
+
     def _prepare_context(self, products_data: List[Dict]) -> str:
-        """Prepare comprehensive context from product data"""
+        """Prepare comprehensive context from product data.
+
+        Question-independent, so it stays identical across the turns of a
+        session; reviews come from _prepare_review_context.
+        """
         context_parts = []
         
         for i, product in enumerate(products_data, 1):
@@ -90,92 +169,56 @@ class GrokService:
                 if 'review_summary_text' in detail:
                     product_info += f"Review Summary: {detail['review_summary_text']}\n"
             
-            # Add recent reviews
-            if 'reviews' in product and product['reviews']:
-                product_info += "Recent Reviews:\n"
-                for review in product['reviews'][:3]:  # Limit to 3 reviews
-                    product_info += f"- Rating: {review.get('rating', 'N/A')}/5\n"
-                    product_info += f"  Title: {review.get('review_title', 'N/A')}\n"
-                    product_info += f"  Text: {review.get('review_text', 'N/A')[:200]}...\n"
-            
             context_parts.append(product_info)
         
         return "\n\n".join(context_parts)
-    
-    def _create_prompt(self, context: str, user_question: str = None, original_search_query: str = None) -> str:
-        """Create the prompt for Grok AI"""
-        
-        if user_question:
-            prompt = f"""You are a friendly, helpful shopping assistant. The user was looking for: "{original_search_query}"
-
-PRODUCT INFORMATION:
-{context}
-
-USER QUESTION: {user_question}
 
-SAFETY GUIDELINES:
-- Only provide advice based on the product information provided
-- Don't make claims about products you don't have information for
-- If you're unsure about something, say so rather than guessing
-- Don't give medical, legal, or financial advice
-- Don't make absolute claims about product performance or guarantees
-- Be honest about limitations of the information available
-- If asked about safety, recommend checking official product documentation
+    def _prepare_review_context(self, products_data: List[Dict], user_question: str = None) -> str:
+        """Review snippets per product, picked by relevance to `user_question`.
 
-IMPORTANT: 
-- Answer naturally and conversationally, like a helpful friend
-- Don't be overly formal or robotic
-- If mentioning their search, say it naturally like "since you're looking for electronics" instead of "based on your search for 'electronics for men'"
-- Keep responses concise but friendly
-- Use bullet points for clarity when helpful
-- Be direct and honest in your advice
-- Always remind users to verify information and read product details
-
-If they ask about features, list the key features naturally.
-If they ask about comparison, focus on the main differences.
-If they ask about value, give a brief, honest assessment.
-
-Sound human and helpful while being safe and responsible!"""
-        else:
-            prompt = f"""You are a friendly, helpful shopping assistant. The user was looking for: "{original_search_query}"
-
-PRODUCT INFORMATION:
-{context}
-
-SAFETY GUIDELINES:
-- Only provide advice based on the product information provided
-- Don't make claims about products you don't have information for
-- If you're unsure about something, say so rather than guessing
-- Don't give medical, legal, or financial advice
-- Don't make absolute claims about product performance or guarantees
-- Be honest about limitations of the information available
-
-Please give a natural, helpful overview of these products. Focus on:
-- Key features and benefits
-- Price and value assessment  
-- Main pros and cons
-- Quick recommendation
-
-Keep it conversational and easy to read. Always remind users to verify information and read product details."""
-        
-        return prompt
+        Uses ReviewRetriever under a fixed character budget per product (the
+        first reviews when there is no question). The result depends on the
+        question, so it is sent with the turn rather than the session context.
+        """
+        context_parts = []
+        for i, product in enumerate(products_data, 1):
+            if not product.get('reviews'):
+                continue
+            snippets = ReviewRetriever(product['reviews']).top_snippets(
+                user_question, max_chars=self._review_context_chars
+            )
+            if not snippets:
+                continue
+            label = "Relevant Reviews" if user_question else "Recent Reviews"
+            review_info = f"{label} for PRODUCT {i} ({product.get('name', 'N/A')}):\n"
+            for review in snippets:
+                rating = review.get('rating')
+                review_info += f"- Rating: {'N/A' if rating is None else rating}/5\n"
+                review_info += f"  Title: {review.get('review_title') or 'N/A'}\n"
+                review_info += f"  Text: {review['snippet']}\n"
+            context_parts.append(review_info)
+        return "\n".join(context_parts)
+    
+    def _create_prompt(self, context: str, user_question: str = None, original_search_query: str = None, conversation_history: str = None, review_context: str = None) -> List[Dict[str, str]]:
+        """Create the chat messages for Grok AI (static system prompt first; see services/prompts.py)"""
+        return build_comparison_messages(context, user_question, original_search_query, conversation_history, review_context)
     
-    def _call_grok_api(self, prompt: str) -> str:
-        """Make API call to Grok"""
+    def _call_grok_api(self, prompt, prompt_version: str = PROMPT_VERSION, timeout: float = 30, max_tokens: int = 2000) -> str:
+        """Make API call to Grok.
+
+        `prompt` is either a ready list of chat messages or a plain string sent
+        as a single user message.
+        """
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         
+        messages = prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
         payload = {
             "model": "grok-3-mini",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": 2000,
+            "messages": messages,
+            "max_tokens": max_tokens,
             "temperature": 0.7
         }
         
@@ -184,12 +227,14 @@ Keep it conversational and easy to read. Always remind users to verify informati
         print(f"GrokService: Payload keys: {list(payload.keys())}")
         
         try:
+            started = time.monotonic()
             response = requests.post(
                 f"{self.base_url}/v1/chat/completions",
                 headers=headers,
                 json=payload,
-                timeout=30
+                timeout=timeout
             )
+            latency_ms = (time.monotonic() - started) * 1000.0
             print(f"GrokService: Response status: {response.status_code}")
             print(f"GrokService: Response headers: {dict(response.headers)}")
             
@@ -199,6 +244,7 @@ Keep it conversational and easy to read. Always remind users to verify informati
             
             result = response.json()
             print(f"GrokService: Response keys: {list(result.keys())}")
+            self._record_usage(prompt_version, result.get('usage') or {}, latency_ms)
             
             return result['choices'][0]['message']['content']
             
@@ -214,49 +260,200 @@ Keep it conversational and easy to read. Always remind users to verify informati
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Grok API call failed: {str(e)}") 
 
-    def summarize_query(self, text: str) -> str:
-        """
-        Produce a very short, human-friendly search title from a long user query.
-        Keep it concise (3-6 words), remove noise, and avoid punctuation.
-        Includes a small in-memory TTL cache to avoid repeated LLM calls.
-        """
+    def _record_usage(self, prompt_version: str, usage: Dict, latency_ms: float) -> None:
+        """Accumulate token usage and latency reported by the API for one call."""
+        details = usage.get('prompt_tokens_details') or {}
+        prompt_tokens = int(usage.get('prompt_tokens') or 0)
+        cached_tokens = int(details.get('cached_tokens') or 0)
+        completion_tokens = int(usage.get('completion_tokens') or 0)
+        print(
+            f"GrokService: Usage [{prompt_version}] prompt={prompt_tokens} cached={cached_tokens} "
+            f"completion={completion_tokens} latency_ms={latency_ms:.0f}"
+        )
+        with self._usage_lock:
+            stats = self._usage_stats.setdefault(prompt_version, {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "completion_tokens": 0,
+                "cache_hit_calls": 0,
+                "cache_hit_latency_ms": 0.0,
+                "cache_miss_latency_ms": 0.0,
+            })
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["completion_tokens"] += completion_tokens
+            if cached_tokens > 0:
+                stats["cache_hit_calls"] += 1
+                stats["cache_hit_latency_ms"] += latency_ms
+            else:
+                stats["cache_miss_latency_ms"] += latency_ms
+
+    def get_usage_stats(self) -> Dict[str, Dict[str, float]]:
+        """Usage per prompt version with cached-token ratio and mean latencies."""
+        with self._usage_lock:
+            out = {}
+            for version, stats in self._usage_stats.items():
+                hits = stats["cache_hit_calls"]
+                misses = stats["calls"] - hits
+                out[version] = {
+                    **stats,
+                    "cached_token_ratio": (stats["cached_tokens"] / stats["prompt_tokens"]) if stats["prompt_tokens"] else 0.0,
+                    "avg_cache_hit_latency_ms": (stats["cache_hit_latency_ms"] / hits) if hits else None,
+                    "avg_cache_miss_latency_ms": (stats["cache_miss_latency_ms"] / misses) if misses else None,
+                }
+            return out
+
+    def summarize_conversation(self, previous_summary: Optional[str], transcript: str, max_chars: int = 1500) -> str:
+        """Fold new chat turns into a session's running summary."""
         try:
-            text = (text or "").strip()
-            if not text:
-                return ""
+            output = self._call_grok_api(
+                build_memory_messages(previous_summary, transcript),
+                prompt_version=MEMORY_PROMPT_VERSION,
+            )
+            summary = (output or "").strip()
+            if len(summary) > max_chars:
+                summary = summary[:max_chars].rstrip()
+            return summary
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"GrokService: summarize_conversation error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Conversation summary failed: {str(e)}")
 
-            # TTL cache lookup (normalize key)
-            key = " ".join(text.lower().split())
-            now = time.time()
+    def _summary_key(self, text: str) -> str:
+        return " ".join((text or "").lower().split())
+
+    def get_cached_summary(self, text: str) -> Optional[str]:
+        """Return a cached summary for `text` if present and fresh (no LLM call)."""
+        key = self._summary_key(text)
+        with self._summary_lock:
             cached = self._summary_cache.get(key)
             if cached:
                 exp, val = cached
-                if exp >= now:
+                if exp >= time.time():
                     # LRU bump
                     self._summary_cache.move_to_end(key)
                     return val
+        return None
 
-            prompt = (
-                "You are a query title generator. Given a long shopping query, "
-                "return ONLY a very short, human-friendly title (3-6 words), "
-                "no punctuation, no quotes, title case, and remove noise words.\n\n"
-                f"Query: {text}\n"
-                "Short Title:"
-            )
-            output = self._call_grok_api(prompt)
-            # Take first line, strip punctuation, clamp length
-            short = (output or "").splitlines()[0].strip().strip('"\' .,:;')
-            if len(short) > 64:
-                short = short[:64].rstrip()
-
+    def _cache_summary(self, text: str, short: str) -> None:
+        key = self._summary_key(text)
+        with self._summary_lock:
             # Cache set with TTL and LRU maintenance
-            self._summary_cache[key] = (now + max(60, self._summary_ttl), short)
+            self._summary_cache[key] = (time.time() + max(60, self._summary_ttl), short)
             self._summary_cache.move_to_end(key)
             # Enforce max size
             while len(self._summary_cache) > self._summary_max_size:
                 self._summary_cache.popitem(last=False)
 
+    @staticmethod
+    def _clean_title(line: str) -> str:
+        # Strip punctuation and clamp length
+        short = (line or "").strip().strip('"\' .,:;')
+        if len(short) > 64:
+            short = short[:64].rstrip()
+        return short
+
+    def quick_summary(self, text: str) -> Optional[str]:
+        """Title available without an LLM call: cached, or local for simple queries."""
+        text = (text or "").strip()
+        if not text:
+            return ""
+        cached = self.get_cached_summary(text)
+        if cached is not None:
+            return cached
+        if is_simple_query(text):
+            return local_title(text)
+        return None
+
+    def summarize_query(self, text: str) -> str:
+        """
+        Produce a very short, human-friendly search title from a long user query.
+        Keep it concise (3-6 words), remove noise, and avoid punctuation.
+        Includes a small in-memory TTL cache to avoid repeated LLM calls.
+        Simple queries are titled locally (see services/query_titler.py); the
+        local title is also returned when Grok is slow or fails.
+        """
+        try:
+            text = (text or "").strip()
+            quick = self.quick_summary(text)
+            if quick is not None:
+                return quick
+
+            try:
+                output = self._call_grok_api(
+                    build_title_messages(text),
+                    prompt_version=TITLE_PROMPT_VERSION,
+                    timeout=self._summary_timeout,
+                )
+            except HTTPException as e:
+                print(f"GrokService: summarize_query falling back to local title: {e.detail}")
+                return local_title(text)
+            # Take first line
+            short = self._clean_title((output or "").splitlines()[0] if output else "")
+            if not short:
+                return local_title(text)
+            self._cache_summary(text, short)
             return short
         except Exception as e:
             print(f"GrokService: summarize_query error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
+
+    def summarize_queries(self, texts: List[str]) -> List[str]:
+        """
+        Batch variant of summarize_query: one LLM call for every uncached text.
+
+        Returns titles aligned with `texts`. Items the model's reply can't be
+        matched back to get the local heuristic title; it isn't cached, so a
+        later request tries Grok again. This runs on an LLM scheduler worker,
+        so it never makes more than one Grok call.
+        """
+        try:
+            texts = [(t or "").strip() for t in texts]
+            results: List[Optional[str]] = [None] * len(texts)
+            missing: "OrderedDict[str, List[int]]" = OrderedDict()
+            for i, text in enumerate(texts):
+                if not text:
+                    results[i] = ""
+                    continue
+                quick = self.quick_summary(text)
+                if quick is not None:
+                    results[i] = quick
+                else:
+                    missing.setdefault(self._summary_key(text), []).append(i)
+
+            if len(missing) == 1:
+                idxs = next(iter(missing.values()))
+                short = self.summarize_query(texts[idxs[0]])
+                for i in idxs:
+                    results[i] = short
+            elif missing:
+                pending = [texts[idxs[0]] for idxs in missing.values()]
+                try:
+                    output = self._call_grok_api(
+                        build_title_batch_messages(pending),
+                        prompt_version=TITLE_BATCH_PROMPT_VERSION,
+                        timeout=self._summary_timeout,
+                    )
+                except HTTPException as e:
+                    print(f"GrokService: summarize_queries falling back to local titles: {e.detail}")
+                    output = ""
+                parsed = parse_numbered_lines(output or "", len(pending))
+                for n, idxs in enumerate(missing.values()):
+                    text = texts[idxs[0]]
+                    short = self._clean_title(parsed[n]) if parsed.get(n) else None
+                    if short:
+                        self._cache_summary(text, short)
+                    else:
+                        short = local_title(text)
+                    for i in idxs:
+                        results[i] = short
+
+            return [r or "" for r in results]
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"GrokService: summarize_queries error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Summarization failed: {str(e)}")
@@ -0,0 +1,225 @@
+"""
+LLM scheduler
+-------------
+Bounded worker pool with priority classes for every Grok call.
+
+WHY: Grok calls take up to 30s. Running them directly on request workers
+(Starlette's small threadpool for sync endpoints, or worse the event loop for
+async ones) lets a burst of comparisons starve unrelated requests. All LLM
+work is queued here instead, executed by a fixed number of worker threads,
+and ordered by:
+
+1. priority class (interactive chat > comparison > summaries > speculative)
+2. per-user fairness (a user's Nth pending job sorts behind everyone's 1st)
+3. arrival order
+
+When the queue is full callers get a fast 503, and users with too many
+pending jobs get a 429, instead of piling up behind each other. Background
+submissions (comparison jobs nobody is blocking on) may wait much longer
+than interactive calls, so at most LLM_SCHEDULER_MAX_BACKGROUND of them are
+queued at once; otherwise they could hold the whole queue for up to an hour.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+PRIORITY_CHAT = 0
+PRIORITY_COMPARE = 1
+PRIORITY_SUMMARY = 2
+PRIORITY_SPECULATIVE = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_CHAT: "chat",
+    PRIORITY_COMPARE: "compare",
+    PRIORITY_SUMMARY: "summary",
+    PRIORITY_SPECULATIVE: "speculative",
+}
+
+
+class LLMScheduler:
+    """Priority queue + worker threads for LLM calls with backpressure."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_per_user: Optional[int] = None,
+        max_wait_seconds: Optional[float] = None,
+        max_background: Optional[int] = None,
+    ):
+        self.workers = workers or int(os.getenv("LLM_SCHEDULER_WORKERS", "4"))
+        self.max_queue = max_queue or int(os.getenv("LLM_SCHEDULER_MAX_QUEUE", "50"))
+        self.max_per_user = max_per_user or int(os.getenv("LLM_SCHEDULER_MAX_PER_USER", "4"))
+        self.max_wait_seconds = max_wait_seconds or float(os.getenv("LLM_SCHEDULER_MAX_WAIT_SECONDS", "20"))
+        self.max_background = max_background or int(os.getenv("LLM_SCHEDULER_MAX_BACKGROUND", str(max(1, self.max_queue // 4))))
+        self._cv = threading.Condition()
+        # heap entries: (priority, user_rank, seq, enqueued_at, max_wait, background, user_key, fn, args, kwargs, future)
+        self._heap: list = []
+        self._queued_background = 0
+        self._seq = itertools.count()
+        self._pending_by_user: Counter = Counter()
+        self._running = 0
+        self._threads: list = []
+        self._metrics: Dict[str, Dict[str, float]] = {
+            name: {"submitted": 0, "started": 0, "completed": 0, "failed": 0, "rejected": 0, "expired": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    # -------- submission --------
+    def submit(
+        self,
+        priority: int,
+        fn: Callable,
+        *args,
+        user_key: Optional[str] = None,
+        max_wait_seconds: Optional[float] = None,
+        background: bool = False,
+        reserve: int = 0,
+        **kwargs,
+    ) -> Future:
+        """Queue `fn(*args, **kwargs)` and return a Future for its result.
+
+        Raises HTTPException(503) when the queue is full and (429) when the
+        user already has `max_per_user` jobs queued or running.
+        `max_wait_seconds` overrides the queue-wait expiry (e.g. for
+        background jobs nobody is blocking on); such jobs should pass
+        `background=True` so they count toward `max_background` (503 beyond).
+        `reserve` keeps that many queue slots free for other callers: the
+        job is rejected once the queue holds `max_queue - reserve` entries
+        (used for optional work such as speculation).
+        """
+        name = PRIORITY_NAMES.get(priority, "summary")
+        future: Future = Future()
+        with self._cv:
+            self._ensure_workers()
+            if len(self._heap) >= self.max_queue - reserve or (background and self._queued_background >= self.max_background):
+                self._metrics[name]["rejected"] += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="AI assistant is busy, please retry shortly",
+                    headers={"Retry-After": "5"},
+                )
+            user_rank = 0
+            if user_key is not None:
+                user_rank = self._pending_by_user[user_key]
+                if user_rank >= self.max_per_user:
+                    self._metrics[name]["rejected"] += 1
+                    raise HTTPException(
+                        status_code=429,
+                        detail="Too many AI requests in progress, please wait for them to finish",
+                        headers={"Retry-After": "2"},
+                    )
+                self._pending_by_user[user_key] += 1
+            heapq.heappush(
+                self._heap,
+                (priority, user_rank, next(self._seq), time.monotonic(), max_wait_seconds, background, user_key, fn, args, kwargs, future),
+            )
+            if background:
+                self._queued_background += 1
+            self._metrics[name]["submitted"] += 1
+            self._cv.notify()
+        return future
+
+    def has_capacity(self, reserve: int = 0) -> bool:
+        """True while fewer than `max_queue - reserve` jobs are queued (no guarantee for a later submit)."""
+        with self._cv:
+            return len(self._heap) < self.max_queue - reserve
+
+    def run(self, priority: int, fn: Callable, *args, user_key: Optional[str] = None, **kwargs) -> Any:
+        """Blocking helper for sync callers."""
+        return self.submit(priority, fn, *args, user_key=user_key, **kwargs).result()
+
+    async def run_async(self, priority: int, fn: Callable, *args, user_key: Optional[str] = None, **kwargs) -> Any:
+        """Await the job from an async endpoint without holding a threadpool worker."""
+        future = self.submit(priority, fn, *args, user_key=user_key, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    # -------- workers --------
+    def _ensure_workers(self) -> None:
+        # Called with self._cv held; threads start lazily on first use
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cv:
+                while not self._heap:
+                    self._cv.wait()
+                priority, _, _, enqueued_at, max_wait, background, user_key, fn, args, kwargs, future = heapq.heappop(self._heap)
+                self._running += 1
+                if background:
+                    self._queued_background -= 1
+            name = PRIORITY_NAMES.get(priority, "summary")
+            waited_ms = (time.monotonic() - enqueued_at) * 1000.0
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if waited_ms > (self.max_wait_seconds if max_wait is None else max_wait) * 1000.0:
+                    # Caller has most likely given up; don't spend an LLM call on it
+                    self._bump(name, "expired")
+                    future.set_exception(HTTPException(
+                        status_code=503,
+                        detail="AI request timed out in queue, please retry",
+                        headers={"Retry-After": "5"},
+                    ))
+                    continue
+                self._observe_wait(name, waited_ms)
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                    self._bump(name, "failed")
+                else:
+                    future.set_result(result)
+                    self._bump(name, "completed")
+            finally:
+                with self._cv:
+                    self._running -= 1
+                    if user_key is not None:
+                        self._pending_by_user[user_key] -= 1
+                        if self._pending_by_user[user_key] <= 0:
+                            del self._pending_by_user[user_key]
+
+    # -------- metrics --------
+    def _bump(self, name: str, field: str) -> None:
+        with self._cv:
+            self._metrics[name][field] += 1
+
+    def _observe_wait(self, name: str, waited_ms: float) -> None:
+        with self._cv:
+            m = self._metrics[name]
+            m["started"] += 1
+            m["wait_ms_total"] += waited_ms
+            m["wait_ms_max"] = max(m["wait_ms_max"], waited_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, running jobs and per-priority queue-wait metrics."""
+        with self._cv:
+            by_priority = {}
+            for name, m in self._metrics.items():
+                started = m["started"]
+                by_priority[name] = {
+                    **m,
+                    "wait_ms_avg": (m["wait_ms_total"] / started) if started else 0.0,
+                }
+            return {
+                "workers": self.workers,
+                "queued": len(self._heap),
+                "queued_background": self._queued_background,
+                "max_background": self.max_background,
+                "running": self._running,
+                "max_queue": self.max_queue,
+                "by_priority": by_priority,
+            }
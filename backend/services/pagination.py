@@ -0,0 +1,80 @@
+"""
+Pagination
+----------
+Opaque keyset cursors for the activity list endpoints.
+
+WHY: LIMIT/OFFSET makes the database walk and discard every skipped row, and
+a count() per page doubles the work, so deep pages and infinite scroll get
+slower as history grows. A cursor encodes the (sort timestamp, id) of the
+last row returned and the next page starts strictly after it, which is an
+index range scan whatever the depth. Offset is still accepted for older
+clients; totals are only computed when asked for.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(sort_value: datetime, row_id: Any) -> str:
+    """Opaque, URL-safe cursor for the row after which the next page starts."""
+    payload = json.dumps([sort_value.isoformat(), str(row_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_raw, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        return datetime.fromisoformat(sort_raw), str(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_condition(sort_col, id_col, cursor: str, descending: bool = True):
+    """WHERE clause selecting rows strictly after `cursor` in (sort_col, id_col) order."""
+    sort_value, raw_id = decode_cursor(cursor)
+    try:
+        row_id = id_col.type.python_type(raw_id)
+    except (NotImplementedError, ValueError, TypeError):
+        row_id = raw_id
+    key = tuple_(sort_col, id_col)
+    return key < tuple_(sort_value, row_id) if descending else key > tuple_(sort_value, row_id)
+
+
+def keyset_order(sort_col, id_col, descending: bool = True) -> list:
+    return [sort_col.desc(), id_col.desc()] if descending else [sort_col.asc(), id_col.asc()]
+
+
+def paginate(
+    q,
+    sort_col,
+    id_col,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    descending: bool = True,
+    with_total: bool = True,
+) -> Tuple[List[Any], Optional[int], Optional[str]]:
+    """Page an ORM query by cursor (or offset when no cursor is given).
+
+    `q` must be filtered but not ordered. Returns (items, total, next_cursor);
+    total is None unless `with_total`, next_cursor is None on the last page.
+    """
+    total = q.order_by(None).count() if with_total else None
+    if cursor:
+        q = q.where(keyset_condition(sort_col, id_col, cursor, descending))
+        offset = 0
+    rows = q.order_by(*keyset_order(sort_col, id_col, descending)).limit(limit + 1).offset(max(0, offset)).all()
+    return rows[:limit], total, next_cursor(rows, limit, sort_col.key, id_col.key)
+
+
+def next_cursor(rows: List[Any], limit: int, sort_attr: str, id_attr: str) -> Optional[str]:
+    """Cursor after the last of `limit` rows when a (limit + 1)-th row was fetched."""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(getattr(last, sort_attr), getattr(last, id_attr))
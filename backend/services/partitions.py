@@ -0,0 +1,180 @@
+"""
+Partitions
+----------
+Monthly range partitions for the append-only tables, created ahead of time,
+and retention by dropping whole partitions.
+
+WHY: user_events, product_prices and chat_messages only ever grow. As single
+heap tables their indexes (including the GIN index on event_data) and vacuum
+cost grow with them, and removing old rows would take huge DELETEs that
+leave bloat behind. Migration 20261019_partition_append_only converts them to
+tables partitioned by month on their timestamp column. This module keeps
+PARTITION_MONTHS_AHEAD months of empty partitions ready, so inserts never
+land in the default partition. It also drops partitions that are entirely
+older than the per-table retention
+(PARTITION_RETENTION_MONTHS_<TABLE>, 0 = keep forever), which is a
+metadata-only operation. It runs on startup and from maintain_partitions.py
+(cron).
+
+Two tables need more than a DROP:
+- product_prices rows are intervals (price_recorded_at = first seen,
+  last_seen_at = last confirmed, see product_snapshots.py), so a price that
+  hasn't changed for months lives in an old partition and is still the
+  product's current row. An expired partition is first trimmed of rows whose
+  interval ended before the cutoff and that have a newer row; it is dropped
+  only once empty, otherwise kept until its remaining current rows are
+  superseded.
+- comparison_sessions.message_count / last_message_at are recomputed from
+  the remaining live messages of every session with messages in a
+  chat_messages partition before it is dropped. summary_through is a
+  timestamp, so it stays valid; dropped turns survive only in the summary.
+"""
+import os
+import re
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+# table -> partition key column (see the partitioning migration)
+PARTITIONED_TABLES = {
+    "user_events": "event_timestamp",
+    "product_prices": "price_recorded_at",
+    "chat_messages": "created_at",
+}
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+# Rows of an expired product_prices partition that are safe to remove: the
+# interval ended before the cutoff and a newer row is the product's current one
+_PRICE_TRIM_SQL = """
+    DELETE FROM {partition} p
+    WHERE COALESCE(p.last_seen_at, p.price_recorded_at) < :cutoff
+      AND EXISTS (
+          SELECT 1 FROM product_prices n
+          WHERE n.product_id = p.product_id AND n.price_recorded_at > p.price_recorded_at
+      )
+"""
+
+# Recount live messages, excluding the partition about to be dropped, for
+# every session that has messages in it (same rules as the counters backfill)
+_SESSION_COUNTERS_SQL = """
+    WITH affected AS (
+        SELECT DISTINCT comparison_id FROM {partition}
+    ),
+    remaining AS (
+        SELECT a.comparison_id, COUNT(m.message_id) AS cnt, MAX(m.created_at) AS last_at
+        FROM affected a
+        LEFT JOIN chat_messages m
+          ON m.comparison_id = a.comparison_id
+         AND m.deleted_at IS NULL
+         AND m.tableoid <> '{partition}'::regclass
+        GROUP BY a.comparison_id
+    )
+    UPDATE comparison_sessions s
+    SET message_count = r.cnt, last_message_at = r.last_at
+    FROM remaining r
+    WHERE s.comparison_id = r.comparison_id
+"""
+
+
+class PartitionManager:
+    """Creates upcoming monthly partitions and drops expired ones."""
+
+    def __init__(self, months_ahead: Optional[int] = None, retention_months: Optional[Dict[str, int]] = None):
+        self.months_ahead = months_ahead or int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+        self.retention_months = retention_months or {
+            table: int(os.getenv(f"PARTITION_RETENTION_MONTHS_{table.upper()}", "0")) for table in PARTITIONED_TABLES
+        }
+
+    def is_partitioned(self, conn, table: str) -> bool:
+        return bool(conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :t AND c.relnamespace = current_schema()::regnamespace"
+            ),
+            {"t": table},
+        ).scalar())
+
+    def partitions(self, conn, table: str) -> List[str]:
+        return list(conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = CAST(:t AS regclass) ORDER BY c.relname"
+            ),
+            {"t": table},
+        ).scalars())
+
+    def ensure_partitions(self, conn, table: str, today: Optional[date] = None) -> List[str]:
+        """Create this month's and the next `months_ahead` monthly partitions; returns created names."""
+        existing = set(self.partitions(conn, table))
+        first = _month_start(today or date.today())
+        created = []
+        for i in range(self.months_ahead + 1):
+            start = _add_months(first, i)
+            name = partition_name(table, start)
+            if name in existing:
+                continue
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{_add_months(start, 1).isoformat()}')"
+            ))
+            created.append(name)
+        return created
+
+    def drop_expired(self, conn, table: str, today: Optional[date] = None) -> List[str]:
+        """Drop monthly partitions entirely older than the table's retention; returns dropped names.
+
+        product_prices partitions are trimmed and dropped only once empty;
+        chat_messages drops first refresh the affected session counters.
+        """
+        months = self.retention_months.get(table, 0)
+        if months <= 0:
+            return []
+        cutoff = _add_months(_month_start(today or date.today()), -months)
+        pattern = re.compile(rf"^{table}_p(\d{{4}})(\d{{2}})$")
+        dropped = []
+        for name in self.partitions(conn, table):
+            m = pattern.match(name)
+            if not m or _add_months(date(int(m.group(1)), int(m.group(2)), 1), 1) > cutoff:
+                continue
+            if table == "product_prices" and not self._trim_price_partition(conn, name, cutoff):
+                continue
+            if table == "chat_messages":
+                conn.execute(text(_SESSION_COUNTERS_SQL.format(partition=name)))
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+        return dropped
+
+    def _trim_price_partition(self, conn, name: str, cutoff: date) -> bool:
+        """Delete superseded price intervals that ended before `cutoff`; True when the partition is now empty."""
+        conn.execute(text(_PRICE_TRIM_SQL.format(partition=name)), {"cutoff": cutoff})
+        return not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar()
+
+    def run(self, engine, today: Optional[date] = None) -> Dict[str, Dict[str, List[str]]]:
+        """Maintain every partitioned table (one transaction per table); tables not yet partitioned are skipped."""
+        report = {}
+        for table in PARTITIONED_TABLES:
+            try:
+                with engine.begin() as conn:
+                    if not self.is_partitioned(conn, table):
+                        continue
+                    report[table] = {
+                        "created": self.ensure_partitions(conn, table, today),
+                        "dropped": self.drop_expired(conn, table, today),
+                    }
+            except Exception as e:
+                print(f"Warn: partition maintenance failed for {table} - {e}")
+        return report
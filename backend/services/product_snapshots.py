@@ -0,0 +1,320 @@
+"""
+Product snapshots
+-----------------
+Reads and writes of a product's current state (product row + latest price +
+latest rating).
+
+WHY: The comparison endpoints used to run three queries per product (Product
+lookup, latest ProductPrice, latest ProductRating), i.e. 15+ round trips for
+a 5-product session, and each "latest" was an ORDER BY ... DESC LIMIT 1 over
+a growing history. Writes now append to the history *and* upsert the
+one-row-per-product product_current_state table in the same transaction, so
+reads are primary-key joins for the whole id list in one round trip.
+Products without a current-state row yet (e.g. before the backfill
+migration ran) fall back to a DISTINCT ON scan of the histories. The bulk
+writers (record_prices / record_ratings) cost a fixed number of statements
+per call whatever the number of products.
+
+History rows are intervals: price_recorded_at / rating_recorded_at is when
+a value was first seen and last_seen_at (NULL = same instant) when it was
+last confirmed. A write whose values equal the current state only moves the
+latest row's last_seen_at instead of appending a duplicate, and
+compact_history() run-length-encodes rows written before that.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import String, column, func, or_, select, text, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import Product, ProductCurrentState, ProductPrice, ProductRating
+
+PRICE_FIELDS = ("current_price", "original_price", "currency_code", "currency_symbol", "is_in_stock")
+RATING_FIELDS = ("average_rating", "total_review_count")
+
+SNAPSHOT_FIELDS = (
+    "product_name",
+    "image_url",
+    "product_url",
+    "platform_name",
+    "price",
+    "original_price",
+    "currency_code",
+    "currency_symbol",
+    "in_stock",
+    "average_rating",
+    "total_reviews",
+)
+
+
+class ProductSnapshotRepository:
+    """Batch reads of the latest product snapshot."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def latest_for(self, product_ids: List[str]) -> Dict[str, Dict[str, Optional[object]]]:
+        """Map product_id -> snapshot dict (SNAPSHOT_FIELDS, None when unknown).
+
+        Every requested id is present in the result, in request order, even
+        when there is no product/price/rating row for it.
+        """
+        ids = list(dict.fromkeys(pid for pid in (product_ids or []) if pid))
+        if not ids:
+            return {}
+
+        requested = values(column("product_id", String), name="requested_ids").data([(pid,) for pid in ids])
+        state = ProductCurrentState
+        stmt = (
+            select(
+                requested.c.product_id,
+                Product.product_name,
+                Product.image_url,
+                Product.product_url,
+                Product.platform_name,
+                state.current_price,
+                state.original_price,
+                state.currency_code,
+                state.currency_symbol,
+                state.is_in_stock,
+                state.average_rating,
+                state.total_review_count,
+                state.product_id,
+            )
+            .select_from(requested)
+            .outerjoin(Product, Product.product_id == requested.c.product_id)
+            .outerjoin(state, state.product_id == requested.c.product_id)
+        )
+
+        rows = {}
+        missing = []
+        for row in self.db.execute(stmt):
+            rows[row[0]] = row[1:-1]
+            if row[-1] is None:
+                missing.append(row[0])
+        if missing:
+            rows.update(self._latest_from_history(missing))
+        empty = (None,) * len(SNAPSHOT_FIELDS)
+        return {pid: dict(zip(SNAPSHOT_FIELDS, rows.get(pid, empty))) for pid in ids}
+
+    def _latest_from_history(self, ids: List[str]) -> Dict[str, tuple]:
+        """Latest snapshot rows computed from the append-only histories (DISTINCT ON)."""
+        requested = values(column("product_id", String), name="requested_ids").data([(pid,) for pid in ids])
+        latest_price = (
+            select(
+                ProductPrice.product_id,
+                ProductPrice.current_price,
+                ProductPrice.original_price,
+                ProductPrice.currency_code,
+                ProductPrice.currency_symbol,
+                ProductPrice.is_in_stock,
+            )
+            .where(ProductPrice.product_id.in_(ids))
+            .distinct(ProductPrice.product_id)
+            .order_by(ProductPrice.product_id, ProductPrice.price_recorded_at.desc().nullslast())
+            .subquery("latest_price")
+        )
+        latest_rating = (
+            select(
+                ProductRating.product_id,
+                ProductRating.average_rating,
+                ProductRating.total_review_count,
+            )
+            .where(ProductRating.product_id.in_(ids))
+            .distinct(ProductRating.product_id)
+            .order_by(ProductRating.product_id, ProductRating.rating_recorded_at.desc().nullslast())
+            .subquery("latest_rating")
+        )
+        stmt = (
+            select(
+                requested.c.product_id,
+                Product.product_name,
+                Product.image_url,
+                Product.product_url,
+                Product.platform_name,
+                latest_price.c.current_price,
+                latest_price.c.original_price,
+                latest_price.c.currency_code,
+                latest_price.c.currency_symbol,
+                latest_price.c.is_in_stock,
+                latest_rating.c.average_rating,
+                latest_rating.c.total_review_count,
+            )
+            .select_from(requested)
+            .outerjoin(Product, Product.product_id == requested.c.product_id)
+            .outerjoin(latest_price, latest_price.c.product_id == requested.c.product_id)
+            .outerjoin(latest_rating, latest_rating.c.product_id == requested.c.product_id)
+        )
+        return {row[0]: tuple(row[1:]) for row in self.db.execute(stmt)}
+
+    # -------- writes (caller commits) --------
+    def record_price(
+        self,
+        product_id: str,
+        current_price: Optional[float] = None,
+        original_price: Optional[float] = None,
+        currency_code: Optional[str] = None,
+        currency_symbol: Optional[str] = None,
+        is_in_stock: Optional[bool] = None,
+    ) -> None:
+        """Append a product_prices row (unless unchanged) and move product_current_state's price columns to it."""
+        self.record_prices([{
+            "product_id": product_id,
+            "current_price": current_price,
+            "original_price": original_price,
+            "currency_code": currency_code,
+            "currency_symbol": currency_symbol,
+            "is_in_stock": is_in_stock,
+        }])
+
+    def record_rating(self, product_id: str, average_rating: Optional[float] = None, total_review_count: Optional[int] = None) -> None:
+        """Append a product_ratings row (unless unchanged) and move product_current_state's rating columns to it."""
+        self.record_ratings([{
+            "product_id": product_id,
+            "average_rating": average_rating,
+            "total_review_count": total_review_count,
+        }])
+
+    def record_prices(self, rows: List[Dict[str, object]]) -> None:
+        """Bulk record_price: rows carry product_id plus PRICE_FIELDS (missing keys are None)."""
+        self._record(rows, PRICE_FIELDS, ProductPrice, ProductPrice.price_id, ProductPrice.price_recorded_at, ProductCurrentState.price_recorded_at)
+
+    def record_ratings(self, rows: List[Dict[str, object]]) -> None:
+        """Bulk record_rating: rows carry product_id plus RATING_FIELDS (missing keys are None)."""
+        self._record(rows, RATING_FIELDS, ProductRating, ProductRating.rating_id, ProductRating.rating_recorded_at, ProductCurrentState.rating_recorded_at)
+
+    def _record(self, rows, fields: tuple, history, id_col, history_recorded_at, state_recorded_at) -> None:
+        # (product_id, recorded_at) is unique in the histories and now() is per
+        # transaction, so keep one row per product (the last)
+        latest = {r["product_id"]: {"product_id": r["product_id"], **{k: r.get(k) for k in fields}} for r in rows}
+        if not latest:
+            return
+        unchanged = self._unchanged(latest, fields, state_recorded_at)
+        changed = [r for pid, r in latest.items() if pid not in unchanged]
+        if changed:
+            self.db.execute(insert(history), changed)
+            self._upsert_state(changed, fields, state_recorded_at)
+        if unchanged:
+            # Extend the current interval instead of appending a duplicate row
+            current = (
+                select(id_col)
+                .where(history.product_id.in_(unchanged))
+                .distinct(history.product_id)
+                .order_by(history.product_id, history_recorded_at.desc().nullslast())
+            )
+            self.db.execute(
+                update(history).where(id_col.in_(current)).values(last_seen_at=func.now()),
+                execution_options={"synchronize_session": False},
+            )
+
+    def _unchanged(self, rows: Dict[str, Dict[str, object]], fields: tuple, state_recorded_at) -> List[str]:
+        """Product ids whose `fields` equal their product_current_state values."""
+        state = ProductCurrentState
+        stmt = select(state.product_id, *(getattr(state, k) for k in fields)).where(
+            state.product_id.in_(list(rows)), state_recorded_at.isnot(None)
+        )
+        return [
+            row[0]
+            for row in self.db.execute(stmt)
+            if all(_same(rows[row[0]][k], value) for k, value in zip(fields, row[1:]))
+        ]
+
+    def _upsert_state(self, rows: List[Dict[str, object]], fields: tuple, recorded_at_col) -> None:
+        # Multi-row INSERT ... ON CONFLICT DO UPDATE; never move a column group back in time.
+        # ON CONFLICT can't touch a row twice per statement, so the last row per product wins.
+        recorded_at = recorded_at_col.key
+        latest = {r["product_id"]: r for r in rows}
+        stmt = insert(ProductCurrentState).values(
+            [{"product_id": pid, **{k: r[k] for k in fields}, recorded_at: func.now()} for pid, r in latest.items()]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProductCurrentState.product_id],
+            set_={**{k: stmt.excluded[k] for k in fields}, recorded_at: stmt.excluded[recorded_at], "updated_at": func.now()},
+            where=or_(recorded_at_col.is_(None), recorded_at_col <= stmt.excluded[recorded_at]),
+        )
+        self.db.execute(stmt)
+
+    # -------- maintenance --------
+    def compact_history(self, batch_products: int = 500) -> Dict[str, int]:
+        """Run-length-encode product_prices / product_ratings (commits per batch).
+
+        Consecutive rows of a product with identical values collapse into
+        the first one, whose last_seen_at becomes the run's last sighting.
+        Returns the number of history rows removed per table.
+        """
+        removed = {}
+        for table, id_col, recorded_at, value_cols in _HISTORIES:
+            removed[table] = 0
+            after = ""
+            while True:
+                ids = self.db.execute(
+                    text(
+                        f"SELECT DISTINCT product_id FROM {table} WHERE product_id > :after "
+                        f"ORDER BY product_id LIMIT :n"
+                    ),
+                    {"after": after, "n": batch_products},
+                ).scalars().all()
+                if not ids:
+                    break
+                removed[table] += self.db.execute(
+                    text(_compaction_sql(table, id_col, recorded_at, value_cols)),
+                    {"first": ids[0], "last": ids[-1]},
+                ).scalar() or 0
+                self.db.commit()
+                after = ids[-1]
+        return removed
+
+
+def _same(new, current) -> bool:
+    # Numeric columns come back as Decimal while writers pass floats
+    if isinstance(new, (int, float)) and not isinstance(new, bool) and current is not None:
+        return float(new) == float(current)
+    return new == current
+
+
+_HISTORIES = (
+    ("product_prices", "price_id", "price_recorded_at",
+     ("current_price", "original_price", "currency_code", "currency_symbol", "is_in_stock", "shipping_cost", "shipping_info")),
+    ("product_ratings", "rating_id", "rating_recorded_at", ("average_rating", "total_review_count")),
+)
+
+
+def _compaction_sql(table: str, id_col: str, recorded_at: str, value_cols: tuple) -> str:
+    # A row starts a new run unless every value equals the previous row's.
+    # Data-modifying CTEs run to completion even though only `removed` is read.
+    changed = " OR ".join(f"{c} IS DISTINCT FROM lag({c}) OVER w" for c in value_cols)
+    return f"""
+        WITH ordered AS (
+            SELECT {id_col} AS row_id, product_id, {recorded_at} AS recorded_at,
+                   COALESCE(last_seen_at, {recorded_at}) AS seen_at,
+                   CASE WHEN lag({id_col}) OVER w IS NULL OR {changed} THEN 1 ELSE 0 END AS is_start
+            FROM {table}
+            WHERE product_id BETWEEN :first AND :last
+            WINDOW w AS (PARTITION BY product_id ORDER BY {recorded_at}, {id_col})
+        ),
+        runs AS (
+            SELECT row_id, product_id, recorded_at, seen_at,
+                   SUM(is_start) OVER (PARTITION BY product_id ORDER BY recorded_at, row_id) AS run_no
+            FROM ordered
+        ),
+        intervals AS (
+            SELECT product_id, run_no,
+                   (array_agg(row_id ORDER BY recorded_at, row_id))[1] AS keep_id,
+                   MAX(seen_at) AS last_seen_at
+            FROM runs
+            GROUP BY product_id, run_no
+            HAVING COUNT(*) > 1
+        ),
+        extended AS (
+            UPDATE {table} t SET last_seen_at = i.last_seen_at
+            FROM intervals i
+            WHERE t.{id_col} = i.keep_id
+        ),
+        removed AS (
+            DELETE FROM {table} t
+            USING runs r JOIN intervals i ON i.product_id = r.product_id AND i.run_no = r.run_no
+            WHERE t.{id_col} = r.row_id AND r.row_id <> i.keep_id
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM removed
+    """
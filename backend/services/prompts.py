@@ -0,0 +1,196 @@
+"""
+Prompt templates
+----------------
+Versioned chat prompt layouts for GrokService.
+
+WHY: Providers cache the longest identical prefix of a request. Every
+message list built here is ordered from most to least stable:
+
+1. static system instructions (identical for every call of a given version)
+2. per-session product context (identical across turns of one comparison)
+3. per-turn content: conversation history, question-relevant review
+   snippets and the question
+
+so repeated calls reuse the cached prefix. Bump PROMPT_VERSION whenever the
+static text changes so usage stats can be compared across versions.
+"""
+import re
+from typing import Dict, List, Optional
+
+PROMPT_VERSION = "compare-v3"
+TITLE_PROMPT_VERSION = "title-v1"
+TITLE_BATCH_PROMPT_VERSION = "title-batch-v1"
+MEMORY_PROMPT_VERSION = "memory-v1"
+MAP_PROMPT_VERSION = "compare-map-v1"
+REDUCE_PROMPT_VERSION = "compare-reduce-v1"
+
+COMPARISON_SYSTEM_PROMPT = """You are a friendly, helpful shopping assistant. You compare products using only the product information supplied in the conversation.
+
+SAFETY GUIDELINES:
+- Only provide advice based on the product information provided
+- Don't make claims about products you don't have information for
+- If you're unsure about something, say so rather than guessing
+- Don't give medical, legal, or financial advice
+- Don't make absolute claims about product performance or guarantees
+- Be honest about limitations of the information available
+- If asked about safety, recommend checking official product documentation
+
+IMPORTANT:
+- Answer naturally and conversationally, like a helpful friend
+- Don't be overly formal or robotic
+- If mentioning their search, say it naturally like "since you're looking for electronics" instead of "based on your search for 'electronics for men'"
+- Keep responses concise but friendly
+- Use bullet points for clarity when helpful
+- Be direct and honest in your advice
+- Always remind users to verify information and read product details
+
+If they ask about features, list the key features naturally.
+If they ask about comparison, focus on the main differences.
+If they ask about value, give a brief, honest assessment.
+
+Sound human and helpful while being safe and responsible!"""
+
+OVERVIEW_TASK = """Please give a natural, helpful overview of these products. Focus on:
+- Key features and benefits
+- Price and value assessment
+- Main pros and cons
+- Quick recommendation
+
+Keep it conversational and easy to read."""
+
+TITLE_SYSTEM_PROMPT = (
+    "You are a query title generator. Given a long shopping query, "
+    "return ONLY a very short, human-friendly title (3-6 words), "
+    "no punctuation, no quotes, title case, and remove noise words."
+)
+
+TITLE_BATCH_SYSTEM_PROMPT = (
+    "You are a query title generator. For each numbered shopping query, "
+    "return a very short, human-friendly title (3-6 words), no punctuation, "
+    "no quotes, title case, and remove noise words. Reply with exactly one "
+    "line per query in the form '<number>. <title>' and nothing else."
+)
+
+CONVERSATION_SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a shopping assistant conversation about "
+    "comparing products. Merge the previous summary with the new turns into one "
+    "concise summary (at most 120 words). Keep the user's stated needs, "
+    "preferences, budget, rejected products and the assistant's key conclusions. "
+    "Reply with the summary text only."
+)
+
+PRODUCT_MAP_SYSTEM_PROMPT = (
+    "You write compact, factual notes about one product for a later side-by-side "
+    "comparison. Use only the product information provided. Reply with at most "
+    "80 words as short lines: 'Type:', 'Key features:', 'Strengths:', 'Weaknesses:', "
+    "'Review themes:'. Do not mention the price, do not recommend, and say "
+    "'unknown' when information is missing."
+)
+
+REDUCE_TASK_NOTE = (
+    "The products above are summarized from compact per-product notes. "
+    "Compare them side by side and group similar products where it helps."
+)
+
+_SESSION_TEMPLATE = 'PRODUCT INFORMATION:\n{context}\n\nThe user was looking for: "{original_search_query}"'
+_QUESTION_TEMPLATE = "USER QUESTION: {user_question}"
+_HISTORY_TEMPLATE = "CONVERSATION SO FAR:\n{conversation_history}"
+_REVIEWS_TEMPLATE = "CUSTOMER REVIEWS:\n{review_context}"
+_MEMORY_TEMPLATE = "PREVIOUS SUMMARY:\n{previous_summary}\n\nNEW TURNS:\n{transcript}\n\nUPDATED SUMMARY:"
+_MAP_TEMPLATE = "PRODUCT INFORMATION:\n{context}\n\nNOTES:"
+_TITLE_TEMPLATE = "Query: {text}\nShort Title:"
+_NUMBERED_LINE_RE = re.compile(r"^\s*(\d+)\s*[.):-]\s*(.+?)\s*$")
+
+
+def build_comparison_messages(
+    context: str,
+    user_question: Optional[str] = None,
+    original_search_query: Optional[str] = None,
+    conversation_history: Optional[str] = None,
+    review_context: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """Chat messages for a product comparison: system, session context, turn.
+
+    Conversation history and the review snippets picked for the question
+    change every turn, so they go after the product context and right
+    before the question.
+    """
+    turn = _QUESTION_TEMPLATE.format(user_question=user_question) if user_question else OVERVIEW_TASK
+    if review_context:
+        turn = _REVIEWS_TEMPLATE.format(review_context=review_context) + "\n\n" + turn
+    if conversation_history:
+        turn = _HISTORY_TEMPLATE.format(conversation_history=conversation_history) + "\n\n" + turn
+    return [
+        {"role": "system", "content": COMPARISON_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": _SESSION_TEMPLATE.format(context=context, original_search_query=original_search_query or "")
+            + "\n\n"
+            + turn,
+        },
+    ]
+
+
+def build_map_messages(context: str) -> List[Dict[str, str]]:
+    """Chat messages for the per-product notes of a map-reduce comparison.
+
+    Deliberately independent of the user's question and search so the notes
+    can be cached per product and reused across sessions.
+    """
+    return [
+        {"role": "system", "content": PRODUCT_MAP_SYSTEM_PROMPT},
+        {"role": "user", "content": _MAP_TEMPLATE.format(context=context)},
+    ]
+
+
+def build_reduce_messages(
+    summaries: str,
+    user_question: Optional[str] = None,
+    original_search_query: Optional[str] = None,
+    conversation_history: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """Final merge call of a map-reduce comparison (same layout as build_comparison_messages)."""
+    return build_comparison_messages(
+        summaries + "\n\n" + REDUCE_TASK_NOTE, user_question, original_search_query, conversation_history
+    )
+
+
+def build_title_messages(text: str) -> List[Dict[str, str]]:
+    """Chat messages for the short search title generator."""
+    return [
+        {"role": "system", "content": TITLE_SYSTEM_PROMPT},
+        {"role": "user", "content": _TITLE_TEMPLATE.format(text=text)},
+    ]
+
+
+def build_memory_messages(previous_summary: Optional[str], transcript: str) -> List[Dict[str, str]]:
+    """Chat messages that fold new conversation turns into the running summary."""
+    return [
+        {"role": "system", "content": CONVERSATION_SUMMARY_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": _MEMORY_TEMPLATE.format(previous_summary=previous_summary or "(none)", transcript=transcript),
+        },
+    ]
+
+
+def build_title_batch_messages(texts: List[str]) -> List[Dict[str, str]]:
+    """Chat messages asking for one title per numbered query (1-based)."""
+    numbered = "\n".join(f"{i}. {' '.join(t.split())}" for i, t in enumerate(texts, 1))
+    return [
+        {"role": "system", "content": TITLE_BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Queries:\n{numbered}\n\nTitles:"},
+    ]
+
+
+def parse_numbered_lines(output: str, count: int) -> Dict[int, str]:
+    """Map 0-based item index -> text from '<n>. <text>' lines; ignores anything else."""
+    parsed: Dict[int, str] = {}
+    for line in output.splitlines():
+        m = _NUMBERED_LINE_RE.match(line)
+        if not m:
+            continue
+        n = int(m.group(1)) - 1
+        if 0 <= n < count and n not in parsed:
+            parsed[n] = m.group(2)
+    return parsed
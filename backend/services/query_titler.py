@@ -0,0 +1,105 @@
+"""
+Query titler
+------------
+Deterministic, local search-title generator used in front of Grok.
+
+WHY: Most shopping queries ("cheap running shoes for men under $50") can be
+titled without an LLM: drop filler and price phrases, keep the product noun
+phrase and title-case it. GrokService.summarize_query answers simple queries
+from here instantly and only calls Grok for long, messy ones; the local title
+is also the fallback when Grok is slow or failing.
+"""
+import os
+import re
+from typing import List
+
+# Price / budget phrases: "under $50", "between 20 and 40 dollars", "$30-$60"
+_PRICE_RE = re.compile(
+    r"\b(?:under|below|less than|cheaper than|over|above|more than|around|about|"
+    r"between|max(?:imum)?|up to|within|budget(?: of)?|at most|no more than)?\s*"
+    r"\$\s?\d[\d,]*(?:\.\d+)?(?:\s*(?:-|to|and)\s*\$?\s?\d[\d,]*(?:\.\d+)?)?"
+    r"(?:\s*(?:dollars|usd|bucks))?"
+    r"|\b(?:under|below|less than|cheaper than|over|above|more than|around|about|"
+    r"between|max(?:imum)?|up to|within|budget(?: of)?|at most|no more than)\s+"
+    r"\d[\d,]*(?:\.\d+)?(?:\s*(?:-|to|and)\s*\d[\d,]*(?:\.\d+)?)?\s*(?:dollars|usd|bucks)?\b"
+    r"|\b\d[\d,]*(?:\.\d+)?\s*(?:dollars|usd|bucks)\b",
+    re.IGNORECASE,
+)
+_URL_RE = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+_WORD_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9'&+\-]*")
+# Clause boundaries: shared by is_simple_query (any match = not simple) and local_title
+_CLAUSE_RE = re.compile(r"[.?!;]|\b(?:but|because|although|however|which|who|that)\b", re.IGNORECASE)
+
+_FILLER_PHRASES = [
+    "i am looking for", "i'm looking for", "im looking for", "looking for",
+    "i want to buy", "i want", "i need", "i would like", "i'd like",
+    "can you find", "can you show me", "could you find", "help me find",
+    "show me", "find me", "search for", "where can i buy", "recommend me",
+    "recommend", "suggest", "please",
+]
+_STOP_WORDS = {
+    "a", "an", "the", "some", "any", "me", "my", "i", "im", "is", "are", "be",
+    "buy", "get", "cheap", "cheapest", "affordable", "best", "good", "nice",
+    "great", "top", "quality", "new", "really", "very", "something", "stuff",
+    "thing", "things", "that", "which", "who", "it", "one", "ones", "please",
+}
+_ACRONYMS = {"tv", "pc", "hd", "uhd", "usb", "led", "lcd", "oled", "ssd", "hdd", "gps", "hdmi", "ac", "dc", "xl", "xxl"}
+# Kept inside a title but never at its edges
+_CONNECTORS = {"for", "with", "and", "in", "of", "to", "on"}
+
+LOCAL_TITLE_MAX_WORDS = int(os.getenv("LOCAL_TITLE_MAX_WORDS", "10"))
+LOCAL_TITLE_MAX_CHARS = int(os.getenv("LOCAL_TITLE_MAX_CHARS", "80"))
+
+
+def _content_words(text: str) -> List[str]:
+    text = _URL_RE.sub(" ", text or "")
+    text = _PRICE_RE.sub(" ", text)
+    lowered = " " + " ".join(text.lower().split()) + " "
+    for phrase in _FILLER_PHRASES:
+        lowered = lowered.replace(f" {phrase} ", " ")
+    words = [w.strip("'-") for w in _WORD_RE.findall(lowered)]
+    return [w for w in words if w and w not in _STOP_WORDS]
+
+
+def _format_word(word: str, first: bool) -> str:
+    if word in _CONNECTORS and not first:
+        return word
+    if word in _ACRONYMS or (any(c.isdigit() for c in word) and len(word) <= 4):
+        return word.upper()
+    return word[:1].upper() + word[1:]
+
+
+def local_title(text: str, max_words: int = 6) -> str:
+    """Best-effort title for a shopping query without calling an LLM."""
+    # Messy queries: title the first clause (or comma-separated part) that names something
+    words = []
+    parts = (part for clause in _CLAUSE_RE.split(text or "") for part in clause.split(","))
+    for part in parts:
+        words = _content_words(part)
+        if words:
+            break
+    # Trim connectors from the edges ("for men" -> keep, trailing "for" -> drop)
+    while words and words[0] in _CONNECTORS:
+        words.pop(0)
+    words = words[:max_words]
+    while words and words[-1] in _CONNECTORS:
+        words.pop()
+    if not words:
+        return " ".join((text or "").split())[:64]
+    return " ".join(_format_word(w, i == 0) for i, w in enumerate(words))[:64].rstrip()
+
+
+def is_simple_query(text: str) -> bool:
+    """True when the local title is good enough and Grok can be skipped.
+
+    Short queries with a handful of content words and a single clause are
+    simple; long, multi-sentence or heavily qualified ones go to the LLM.
+    """
+    text = (text or "").strip()
+    if not text or len(text) > LOCAL_TITLE_MAX_CHARS:
+        return False
+    if len(text.split()) > LOCAL_TITLE_MAX_WORDS:
+        return False
+    if _CLAUSE_RE.search(text):
+        return False
+    return 0 < len(_content_words(text)) <= 6
@@ -0,0 +1,143 @@
+"""
+Review retriever
+----------------
+Small in-process BM25 index over a single product's reviews.
+
+WHY: The comparison prompt used to include the first 3 reviews of every
+product regardless of what the user asked. Scoring review sentences against
+the question lets us send the few snippets that actually answer it (e.g.
+"battery life") and keep the prompt short. Terms are hashed into a fixed
+number of buckets so the index stays tiny and needs no vocabulary or
+external service.
+"""
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+_STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does",
+    "for", "from", "has", "have", "how", "i", "if", "in", "is", "it", "its",
+    "me", "my", "of", "on", "or", "so", "that", "the", "their", "them", "there",
+    "these", "they", "this", "to", "was", "we", "were", "what", "when", "which",
+    "who", "will", "with", "would", "you", "your", "about", "any", "all", "one",
+    "product", "products", "item", "good", "better", "best",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stop words removed and a light plural strip."""
+    out = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        if tok in _STOP_WORDS or len(tok) < 2:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        out.append(tok)
+    return out
+
+
+class ReviewRetriever:
+    """BM25 over review sentences with hashed term ids.
+
+    Each review is split into sentences ("passages"); the question is scored
+    against every passage and the best ones are returned grouped by review.
+    """
+
+    def __init__(self, reviews: List[Dict], k1: float = 1.5, b: float = 0.75, buckets: int = 1 << 18):
+        self.reviews = reviews or []
+        self.k1 = k1
+        self.b = b
+        self.buckets = buckets
+        # passage: (review_index, sentence_text, term_counts, length)
+        self._passages: List[tuple] = []
+        self._df: Counter = Counter()
+        for idx, review in enumerate(self.reviews):
+            for sentence in _SENTENCE_RE.split(review.get("review_text") or ""):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                counts = Counter(self._hash(t) for t in tokenize(sentence))
+                if not counts:
+                    continue
+                self._passages.append((idx, sentence, counts, sum(counts.values())))
+                self._df.update(counts.keys())
+        total_len = sum(p[3] for p in self._passages)
+        self._avg_len = (total_len / len(self._passages)) if self._passages else 0.0
+
+    def _hash(self, term: str) -> int:
+        return zlib.crc32(term.encode("utf-8")) % self.buckets
+
+    def _idf(self, term_id: int) -> float:
+        n = len(self._passages)
+        df = self._df.get(term_id, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _score(self, query_ids: List[int], counts: Counter, length: int) -> float:
+        score = 0.0
+        norm = self.k1 * (1 - self.b + self.b * (length / self._avg_len if self._avg_len else 0))
+        for term_id in query_ids:
+            tf = counts.get(term_id, 0)
+            if tf:
+                score += self._idf(term_id) * (tf * (self.k1 + 1)) / (tf + norm)
+        return score
+
+    def top_snippets(self, question: Optional[str], max_chars: int = 600, max_reviews: int = 3) -> List[Dict]:
+        """Return up to `max_reviews` reviews with their most relevant snippet.
+
+        Snippets are added best-first until `max_chars` is spent. Without a
+        usable question (or when nothing matches) this falls back to the first
+        reviews, trimmed to the same budget.
+        """
+        query_ids = list(dict.fromkeys(self._hash(t) for t in tokenize(question or "")))
+        scored = []
+        if query_ids:
+            for pos, (idx, sentence, counts, length) in enumerate(self._passages):
+                score = self._score(query_ids, counts, length)
+                if score > 0:
+                    scored.append((score, pos, idx, sentence))
+            scored.sort(key=lambda s: (-s[0], s[1]))
+
+        if not scored:
+            return self._leading_reviews(max_chars, max_reviews)
+
+        picked: Dict[int, List[str]] = {}
+        budget = max_chars
+        for _, _, idx, sentence in scored:
+            if idx not in picked and len(picked) >= max_reviews:
+                continue
+            if len(sentence) > budget:
+                if budget < 80:
+                    break
+                sentence = sentence[: budget - 3].rstrip() + "..."
+            picked.setdefault(idx, []).append(sentence)
+            budget -= len(sentence)
+            if budget <= 0:
+                break
+
+        return [
+            {
+                "rating": self.reviews[idx].get("rating"),
+                "review_title": self.reviews[idx].get("review_title"),
+                "snippet": " ".join(sentences),
+            }
+            for idx, sentences in sorted(picked.items())
+        ]
+
+    def _leading_reviews(self, max_chars: int, max_reviews: int) -> List[Dict]:
+        out = []
+        per_review = max(80, max_chars // max(1, max_reviews))
+        for review in self.reviews[:max_reviews]:
+            text = (review.get("review_text") or "").strip()
+            if len(text) > per_review:
+                text = text[: per_review - 3].rstrip() + "..."
+            out.append({
+                "rating": review.get("rating"),
+                "review_title": review.get("review_title"),
+                "snippet": text,
+            })
+        return out
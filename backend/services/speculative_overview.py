@@ -0,0 +1,116 @@
+"""
+Speculative overview
+--------------------
+Pre-generates the default comparison overview when a session is created.
+
+WHY: Right after POST /api/compare/sessions the user almost always asks for
+the overview. Starting enrichment + the no-question analyze_products call in
+the background (lowest scheduler priority) lets the first chat turn be
+served from ComparisonService's cache. Speculation is capped per user per
+hour so unused overviews can't run up LLM spend, and it is only queued while
+the scheduler has more than SPECULATIVE_OVERVIEW_QUEUE_RESERVE free slots, so
+a burst of session creations can't push interactive calls into 503s.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .llm_scheduler import PRIORITY_SPECULATIVE
+
+
+class SpeculativeOverview:
+    """Starts, deduplicates and budgets speculative overview generation."""
+
+    def __init__(self, comparison_service, scheduler, per_user_per_hour: Optional[int] = None, enabled: Optional[bool] = None):
+        self.comparison_service = comparison_service
+        self.scheduler = scheduler
+        self.per_user_per_hour = per_user_per_hour or int(os.getenv("SPECULATIVE_OVERVIEW_PER_HOUR", "10"))
+        self.enabled = enabled if enabled is not None else os.getenv("SPECULATIVE_OVERVIEW_ENABLED", "true").lower() == "true"
+        # Queue slots left for interactive work; speculation only uses the rest
+        self.queue_reserve = int(os.getenv("SPECULATIVE_OVERVIEW_QUEUE_RESERVE", str(scheduler.max_queue // 2)))
+        self._lock = threading.Lock()
+        self._spend: Dict[str, deque] = {}
+        self._pending: Dict[Tuple, Future] = {}
+        self._stats = {"started": 0, "skipped_budget": 0, "skipped_busy": 0, "served": 0}
+
+    def _take_budget(self, user_key: str) -> bool:
+        now = time.time()
+        with self._lock:
+            window = self._spend.setdefault(user_key, deque())
+            while window and now - window[0] > 3600:
+                window.popleft()
+            if len(window) >= self.per_user_per_hour:
+                self._stats["skipped_budget"] += 1
+                return False
+            window.append(now)
+            return True
+
+    def maybe_start(self, user_key: str, products: List[Dict], original_search_query: Optional[str] = None) -> bool:
+        """Queue the overview for `products` unless cached, in flight, disabled or over budget."""
+        if not self.enabled or not self.comparison_service or not products:
+            return False
+        key = self.comparison_service.cache_key(products, None, original_search_query)
+        if self.comparison_service.get_cached_comparison(products, None, original_search_query):
+            return False
+        with self._lock:
+            if key in self._pending:
+                return False
+        if not self.scheduler.has_capacity(self.queue_reserve):
+            with self._lock:
+                self._stats["skipped_busy"] += 1
+            return False
+        if not self._take_budget(user_key):
+            return False
+        try:
+            future = self.scheduler.submit(
+                PRIORITY_SPECULATIVE,
+                self.comparison_service.compare_products,
+                selected_products=products,
+                user_question=None,
+                original_search_query=original_search_query,
+                user_key=f"speculative:{user_key}",
+                reserve=self.queue_reserve,
+            )
+        except HTTPException:
+            # Queue filled up since the capacity check (or per-user cap hit)
+            with self._lock:
+                self._stats["skipped_busy"] += 1
+            return False
+        with self._lock:
+            self._pending[key] = future
+            self._stats["started"] += 1
+        future.add_done_callback(lambda _f: self._forget(key))
+        return True
+
+    def _forget(self, key: Tuple) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    async def get_or_wait(self, products: List[Dict], original_search_query: Optional[str] = None, timeout: float = 30) -> Optional[Dict]:
+        """Cached overview, or wait for the in-flight speculative one; None if neither."""
+        if not self.comparison_service or not products:
+            return None
+        cached = self.comparison_service.get_cached_comparison(products, None, original_search_query)
+        if cached is None:
+            key = self.comparison_service.cache_key(products, None, original_search_query)
+            with self._lock:
+                future = self._pending.get(key)
+            if future is None:
+                return None
+            try:
+                cached = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except Exception:
+                return None
+        with self._lock:
+            self._stats["served"] += 1
+        return cached
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._pending))
@@ -0,0 +1,142 @@
+"""
+Summary batcher
+---------------
+Collects /api/search/summarize requests for a short window and sends them to
+the LLM as one multi-item prompt.
+
+WHY: The history page (and bursts of searches) used to fire one tiny Grok
+completion per query string. Coalescing them into a single call amortizes
+the per-request overhead and latency, and duplicate texts inside a window
+share one result. Batches are formed per user (the LLM scheduler fairness
+key) so every batch is charged to the user who asked for it: a user gets at
+most SUMMARY_BATCH_INFLIGHT_PER_USER batches in the scheduler at once and
+SUMMARY_BATCH_MAX_PENDING_PER_USER texts waiting overall (429 beyond that),
+so one client can't fill the shared queue that chat and compare use.
+"""
+import asyncio
+import os
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+
+class SummaryBatcher:
+    """Asyncio micro-batcher in front of a batch summarize function.
+
+    `run_batch(texts, user_key)` receives a list of distinct texts of one
+    user and must return titles in the same order (e.g.
+    GrokService.summarize_queries via the LLM scheduler).
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[str], Optional[str]], Awaitable[List[str]]],
+        window_ms: Optional[int] = None,
+        max_batch: Optional[int] = None,
+        max_inflight_per_user: Optional[int] = None,
+        max_pending_per_user: Optional[int] = None,
+    ):
+        self.run_batch = run_batch
+        self.window_ms = window_ms or int(os.getenv("SUMMARY_BATCH_WINDOW_MS", "40"))
+        self.max_batch = max_batch or int(os.getenv("SUMMARY_BATCH_MAX", "20"))
+        self.max_inflight_per_user = max_inflight_per_user or int(os.getenv("SUMMARY_BATCH_INFLIGHT_PER_USER", "2"))
+        self.max_pending_per_user = max_pending_per_user or int(os.getenv("SUMMARY_BATCH_MAX_PENDING_PER_USER", "200"))
+        # user_key -> normalized text -> (original text, futures waiting on it)
+        self._pending: Dict[Optional[str], Dict[str, tuple]] = {}
+        self._flush_handles: Dict[Optional[str], asyncio.TimerHandle] = {}
+        # user_key -> semaphore bounding that user's batches in the scheduler
+        self._slots: Dict[Optional[str], asyncio.Semaphore] = {}
+        # user_key -> dispatches waiting for or holding that user's semaphore
+        self._dispatching: Counter = Counter()
+        # user_key -> texts queued or in flight
+        self._outstanding: Counter = Counter()
+
+    def _admit(self, user_key: Optional[str], count: int) -> None:
+        # Reserves `count` texts for the user until the caller's _release
+        if user_key is not None and self._outstanding[user_key] + count > self.max_pending_per_user:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many summaries in progress, please wait for them to finish",
+                headers={"Retry-After": "2"},
+            )
+        self._outstanding[user_key] += count
+
+    def _release(self, user_key: Optional[str], count: int) -> None:
+        self._outstanding[user_key] -= count
+        if self._outstanding[user_key] <= 0:
+            del self._outstanding[user_key]
+            self._drop_slot(user_key)
+
+    def _drop_slot(self, user_key: Optional[str]) -> None:
+        # A cancelled caller can leave its batch in flight: keep the semaphore
+        # until that dispatch is done, or the next one would get a fresh one
+        if not self._dispatching[user_key] and user_key not in self._outstanding:
+            self._dispatching.pop(user_key, None)
+            self._slots.pop(user_key, None)
+
+    async def summarize(self, text: str, user_key: Optional[str] = None) -> str:
+        """Queue one text and wait for its title."""
+        self._admit(user_key, 1)
+        try:
+            return await self._enqueue(text, user_key)
+        finally:
+            self._release(user_key, 1)
+
+    async def summarize_many(self, texts: List[str], user_key: Optional[str] = None) -> List[str]:
+        """Queue many texts at once; results are aligned with `texts`."""
+        # Admit all or nothing so a rejected request leaves no half-queued texts
+        self._admit(user_key, len(texts))
+        try:
+            return list(await asyncio.gather(*(self._enqueue(t, user_key) for t in texts)))
+        finally:
+            self._release(user_key, len(texts))
+
+    async def _enqueue(self, text: str, user_key: Optional[str]) -> str:
+        loop = asyncio.get_running_loop()
+        key = " ".join((text or "").lower().split())
+        future = loop.create_future()
+        pending = self._pending.setdefault(user_key, {})
+        if key in pending:
+            pending[key][1].append(future)
+        else:
+            pending[key] = (text, [future])
+        if len(pending) >= self.max_batch:
+            self._flush_now(user_key)
+        elif user_key not in self._flush_handles:
+            self._flush_handles[user_key] = loop.call_later(self.window_ms / 1000.0, self._flush_now, user_key)
+        return await future
+
+    def _flush_now(self, user_key: Optional[str]) -> None:
+        handle = self._flush_handles.pop(user_key, None)
+        if handle is not None:
+            handle.cancel()
+        batch = self._pending.pop(user_key, None)
+        if not batch:
+            return
+        asyncio.get_running_loop().create_task(self._dispatch(user_key, batch))
+
+    async def _dispatch(self, user_key: Optional[str], batch: Dict[str, tuple]) -> None:
+        entries = list(batch.values())
+        slot = self._slots.get(user_key)
+        if slot is None:
+            slot = self._slots[user_key] = asyncio.Semaphore(self.max_inflight_per_user)
+        self._dispatching[user_key] += 1
+        try:
+            async with slot:
+                titles = await self.run_batch([text for text, _ in entries], user_key)
+        except Exception as e:
+            for _, futures in entries:
+                for f in futures:
+                    if not f.done():
+                        f.set_exception(e)
+            return
+        finally:
+            self._dispatching[user_key] -= 1
+            self._drop_slot(user_key)
+        titles = list(titles or [])
+        for n, (_, futures) in enumerate(entries):
+            title = titles[n] if n < len(titles) else ""
+            for f in futures:
+                if not f.done():
+                    f.set_result(title)